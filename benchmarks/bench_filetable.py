@@ -0,0 +1,110 @@
+"""
+Compares the slotted BookFile and FileTable with the BookFile objects and
+flist/fdict copies Book used to build, on a synthetic multi-book bundle.
+
+    $ python benchmarks/bench_filetable.py [--files 200000] [--sections 10]
+
+Reports the memory held by the files and their path tables once built, the
+time to build them and the throughput of target -> source and source ->
+target lookups. Both layouts must produce the same pairs.
+"""
+import argparse
+import gc
+import os
+import time
+import tracemalloc
+
+from docbooktoxtm.bookclasses import DEFAULT_TARGET_ROOT, BookFile
+from docbooktoxtm.filetable import FileTable
+
+SECTION_NAMES = ('guided-exercise', 'lab', 'quiz', 'review', 'summary', 'section', 'practice', 'demo')
+SOURCE_ROOT = 'BUNDLE-1.0/guides/en-US'
+
+
+class LegacyBookFile:
+    def __init__(self, chapter, count, file_path):
+        self.chapter = chapter
+        self.count = f"{count:02d}"
+        self.name = os.path.basename(file_path)
+        self.path = os.path.dirname(file_path)
+
+    def source_path(self, source_root):
+        return os.path.join(*source_root.split('/'), *self.path.split('/'), self.name)
+
+    def target_path(self, target_root=DEFAULT_TARGET_ROOT):
+        if self.path == 'Common':
+            return os.path.join(target_root, self.chapter, f"{self.count}-{self.name}")
+        return os.path.join(*target_root.split('/'), self.chapter, *self.path.split('/'), f"{self.count}-{self.name}")
+
+
+def synthetic_files(files: int, sections: int = 10) -> list:
+    # several books of 40 chapters each, every chapter with its own topics folder
+    args = []
+    chapter = 0
+    while len(args) < files:
+        chapter += 1
+        book, number = divmod(chapter - 1, 40)
+        index = f"{number + 1:02d}-chapter{number + 1}"
+        folder = f"book{book}/sg-chapters"
+        args.append((index, number + 1, f"{folder}/chapter{number + 1}.xml"))
+        for j in range(1, sections + 1):
+            name = f"{SECTION_NAMES[j % len(SECTION_NAMES)]}-{j}.xml"
+            args.append((index, j, f"{folder}/topics/chapter{number + 1}/{j:02d}-{name}"))
+    return args[:files]
+
+
+def legacy_build(args: list) -> tuple:
+    files = [LegacyBookFile(*arg) for arg in args]
+    flist = tuple((file.source_path(SOURCE_ROOT), file.target_path()) for file in files)
+    fdict = {tfname: sfname for sfname, tfname in flist}
+    return files, flist, fdict
+
+
+def table_build(args: list) -> tuple:
+    files = tuple(BookFile(*arg) for arg in args)
+    return files, FileTable.from_files(files, SOURCE_ROOT, DEFAULT_TARGET_ROOT)
+
+
+def measured(func, *args):
+    # timed apart from the memory measurement, which slows allocations down
+    gc.collect()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, size, result
+
+
+def lookups(func, keys) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        func(key)
+    return len(keys) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=200000)
+    parser.add_argument('--sections', type=int, default=10)
+    args = parser.parse_args()
+    files = synthetic_files(args.files, args.sections)
+    legacy_elapsed, legacy_size, (_, flist, fdict) = measured(legacy_build, files)
+    elapsed, size, (_, table) = measured(table_build, files)
+    print(f"{len(files)} files")
+    print(f"build:  legacy {legacy_elapsed:.3f}s, table {elapsed:.3f}s ({legacy_elapsed / elapsed:,.1f}x)")
+    print(f"memory: legacy {legacy_size / 1024 ** 2:.1f} MB, table {size / 1024 ** 2:.1f} MB "
+          f"({1 - size / legacy_size:.0%} less)")
+    targets = [tf for _, tf in flist]
+    sources = [sf for sf, _ in flist]
+    print(f"target -> source: legacy {lookups(fdict.get, targets):,.0f}/s, "
+          f"table {lookups(table.by_target.get, targets):,.0f}/s")
+    print(f"source -> target: table {lookups(table.by_source.get, sources):,.0f}/s (legacy: no index)")
+    print(f"same pairs: {table == flist}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares TargetMatcher with the matcher that used to live in
+Book.__get_clean_flist on a synthetic book.
+
+    $ python benchmarks/bench_matcher.py [--files 5000] [--renamed 0.05] [--skip-legacy]
+
+A share of the target files is renamed (their numeric prefixes shifted) so
+that they miss the exact lookup and go through fuzzy matching. Both matchers
+must produce the same pairs.
+"""
+import argparse
+import logging
+import os
+import random
+import time
+
+from fuzzywuzzy import process
+
+from docbooktoxtm.bookclasses import BookFile
+from docbooktoxtm.matching import TargetMatcher
+
+SECTION_NAMES = ('guided-exercise', 'lab', 'quiz', 'review', 'summary', 'section', 'practice', 'demo')
+
+
+def synthetic_flist(files: int, sections: int = 10, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    source_root = 'COURSE-1.0/guides/en-US'
+    book = []
+    chapter = 0
+    while len(book) < files:
+        chapter += 1
+        index = f"{chapter:02d}-chapter{chapter}"
+        book.append(BookFile(index, chapter, f"sg-chapters/chapter{chapter}.xml"))
+        for j in range(1, sections + 1):
+            name = f"{rng.choice(SECTION_NAMES)}-{rng.randint(1, 3)}.xml"
+            book.append(BookFile(index, j, f"sg-chapters/topics/chapter{chapter}/{j:02d}-{name}"))
+    return [(file.source_path(source_root), file.target_path()) for file in book[:files]]
+
+
+def renamed_targets(flist: list, share: float, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    targets = []
+    for _, tf in flist:
+        if rng.random() < share:
+            head, tail = os.path.split(tf)
+            count, name = tail.split('-', 1)
+            tf = os.path.join(head, f"{int(count) + 1:02d}-{name}")
+        targets.append(tf)
+    return targets
+
+
+def legacy_match(flist: list, target_actuals: list) -> list:
+    clean = []
+    matches = []
+    fdict = {tfname: sfname for sfname, tfname in flist}
+    for tf in target_actuals:
+        if tf in fdict:
+            clean.append((tf, fdict.get(tf)))
+            matches.append(fdict.get(tf))
+        else:
+            bests = process.extractBests(tf, (tarf for tarf in fdict if (
+                    os.path.basename(fdict.get(tarf)) in tf and fdict.get(tarf) not in matches)))
+            if bests:
+                clean.append((tf, fdict.get(bests[0][0])))
+                matches.append(fdict.get(bests[0][0]))
+    return sorted(tuple(clean))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=5000)
+    parser.add_argument('--renamed', type=float, default=0.05)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    flist = synthetic_flist(args.files)
+    targets = renamed_targets(flist, args.renamed)
+    unexpected = len(set(targets) - {tf for _, tf in flist})
+    print(f"{len(flist)} files, {unexpected} unexpected target names")
+    elapsed, clean = timed(lambda: TargetMatcher(flist).match(targets).clean)
+    print(f"TargetMatcher: {elapsed:.3f}s")
+    if not args.skip_legacy:
+        legacy_elapsed, legacy_clean = timed(legacy_match, flist, targets)
+        print(f"legacy:        {legacy_elapsed:.3f}s ({legacy_elapsed / elapsed:,.1f}x)")
+        print(f"same pairs:    {clean == legacy_clean}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+End-to-end benchmarks of the conversion pipeline on synthetic courses, run
+offline with pytest-benchmark.
+
+    $ python -m pytest benchmarks/bench_pipeline.py --benchmark-only
+          [--benchmark-autosave] [--benchmark-compare]
+
+Every round converts fresh copies of a course written by `coursegen`:
+unsourcing the release and resourcing its XTM export, on disk and streamed,
+plus building the book and matching the target on their own. Throughput (book
+files and source megabytes per second) and the peak RSS of one conversion in
+a fresh interpreter are attached to each result as `extra_info`, so that saved
+runs can be compared across commits.
+
+The course size is set with BENCH_CHAPTERS, BENCH_SECTIONS and
+BENCH_SECTION_BYTES (12, 8 and 4096 by default).
+"""
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+from typing import Optional
+
+import pytest
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.ziputils import member_name
+
+from coursegen import generate_course, translated_target
+
+pytest.importorskip('pytest_benchmark')
+
+OPTIONS = {
+    'chapters': int(os.environ.get('BENCH_CHAPTERS', 12)),
+    'sections': int(os.environ.get('BENCH_SECTIONS', 8)),
+    'section_bytes': int(os.environ.get('BENCH_SECTION_BYTES', 4096)),
+}
+ROUNDS = 5
+
+
+def copies(course: dict, target: bool) -> str:
+    """
+    Work directory holding fresh copies of the inputs, which a run consumes.
+    """
+    wd = tempfile.mkdtemp(dir=course['dir'])
+    for fname in ('source', 'target') if target else ('source',):
+        shutil.copy(course[fname], wd)
+    return wd
+
+
+def convert(wd: str, source: str, target: Optional[str], stream: bool) -> str:
+    book = Book(os.path.join(wd, source), os.path.join(wd, target) if target else None, stream=stream, wd=wd)
+    return book()
+
+
+def build(source: str, target: Optional[str] = None) -> None:
+    Book(source, target).close()
+
+
+def peak_rss(wd: str, source: str, target: Optional[str], stream: bool, full: bool) -> int:
+    if full:
+        convert(wd, source, target, stream)
+    else:
+        build(os.path.join(wd, source), os.path.join(wd, target) if target else None)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+@pytest.fixture(scope='session')
+def course(tmp_path_factory) -> dict:
+    directory = str(tmp_path_factory.mktemp('course'))
+    course = {'dir': directory, 'source': generate_course(os.path.join(directory, 'SYN100-1.0.0.zip'), **OPTIONS)}
+    wd = copies(course, target=False)
+    unsourced = convert(wd, os.path.basename(course['source']), None, stream=True)
+    course['target'] = translated_target(os.path.join(wd, unsourced), os.path.join(directory, unsourced))
+    book = Book(course['source'])
+    book.close()
+    course['files'] = len(book.flist)
+    course['bytes'] = sum(book.source_index.infos[member_name(current)].file_size for current, _ in book.flist)
+    return course
+
+
+def record(benchmark, course: dict, target: bool, stream: bool = False, full: bool = True) -> None:
+    """
+    Adds throughput and the peak RSS of the same run, or of only building the
+    book when not `full`, in a fresh interpreter.
+    """
+    mean = benchmark.stats.stats.mean
+    benchmark.extra_info['files'] = course['files']
+    benchmark.extra_info['files_per_s'] = round(course['files'] / mean, 1)
+    benchmark.extra_info['MB_per_s'] = round(course['bytes'] / mean / 1e6, 2)
+    names = os.path.basename(course['source']), os.path.basename(course['target']) if target else None
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        # ru_maxrss is in kilobytes on Linux
+        benchmark.extra_info['peak_rss_kb'] = pool.apply(peak_rss, (copies(course, target), *names, stream, full))
+
+
+def test_course(course):
+    book = Book(course['source'], course['target'])
+    book.close()
+    sections = OPTIONS['sections'] + 1
+    assert course['files'] == 4 + (OPTIONS['chapters'] + 2) * sections
+    assert len(book.clean) == course['files']
+    assert book.sublog == {'unmatched_targets': (), 'unmatched_sources': ()}
+
+
+def test_book(benchmark, course):
+    benchmark(build, course['source'])
+    record(benchmark, course, target=False, full=False)
+
+
+def test_match(benchmark, course):
+    benchmark(build, course['source'], course['target'])
+    record(benchmark, course, target=True, full=False)
+
+
+@pytest.mark.parametrize('stream', (False, True), ids=('disk', 'stream'))
+def test_unsource(benchmark, course, stream):
+    def setup():
+        return (copies(course, target=False), os.path.basename(course['source']), None, stream), {}
+    benchmark.pedantic(convert, setup=setup, rounds=ROUNDS)
+    record(benchmark, course, target=False, stream=stream)
+
+
+@pytest.mark.parametrize('stream', (False, True), ids=('disk', 'stream'))
+def test_resource(benchmark, course, stream):
+    def setup():
+        names = os.path.basename(course['source']), os.path.basename(course['target'])
+        return (copies(course, target=True), *names, stream), {}
+    benchmark.pedantic(convert, setup=setup, rounds=ROUNDS)
+    record(benchmark, course, target=True, stream=stream)
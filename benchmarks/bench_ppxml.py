@@ -0,0 +1,85 @@
+"""
+Compares the in-process lxml formatter with the legacy xmllint shell pipeline.
+
+    $ python benchmarks/bench_ppxml.py [PACKAGE.zip] [--repeat N]
+
+Every XML member of the package is extracted once per engine and run through
+`ppxml`, as `unzip_target` does for an XTM export. Throughput is reported in
+files per second together with the files whose content differs between the
+two engines once xmllint's own diagnostics are left out.
+"""
+import argparse
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+
+from docbooktoxtm.bookclasses import ppxml
+from docbooktoxtm.formatting import ENGINES
+
+DIAGNOSTIC = re.compile(rb'^\S+:\d+: (parser|namespace) (error|warning)')
+DEFAULT_PACKAGE = os.path.join(os.path.dirname(__file__), os.pardir, 'tests', 'DTX123-1.0.0.zip')
+
+
+def xml_members(f_zip: zipfile.ZipFile) -> list:
+    return [name for name in f_zip.namelist() if name.endswith('.xml')]
+
+
+def run(package: str, engine: str, workdir: str) -> float:
+    root = os.path.join(workdir, engine)
+    shutil.rmtree(root, ignore_errors=True)
+    with zipfile.ZipFile(package) as f_zip:
+        f_zip.extractall(root, members=xml_members(f_zip))
+    start = time.perf_counter()
+    ppxml(root, engine)
+    return time.perf_counter() - start
+
+
+def strip_diagnostics(lines: list) -> bytes:
+    # xmllint writes each diagnostic into the file as three lines: message, context, caret
+    kept, skip = [], 0
+    for line in lines:
+        if skip:
+            skip -= 1
+        elif DIAGNOSTIC.match(line):
+            skip = 2
+        else:
+            kept.append(line)
+    return b''.join(kept)
+
+
+def outputs(root: str) -> dict:
+    files = {}
+    for path, _, names in os.walk(root):
+        for name in names:
+            full = os.path.join(path, name)
+            with open(full, 'rb') as f:
+                files[os.path.relpath(full, root)] = strip_diagnostics(f.read().splitlines(keepends=True))
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('package', nargs='?', default=DEFAULT_PACKAGE)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    with zipfile.ZipFile(args.package) as f_zip:
+        count = len(xml_members(f_zip))
+    workdir = tempfile.mkdtemp(prefix='bench-ppxml-')
+    try:
+        for engine in ENGINES:
+            best = min(run(args.package, engine, workdir) for _ in range(args.repeat))
+            print(f"{engine:>8}: {count} files in {best:.3f}s ({count / best:,.1f} files/s)")
+        results = [outputs(os.path.join(workdir, engine)) for engine in ENGINES]
+        differing = sorted(name for name in results[0] if results[0][name] != results[1].get(name))
+        print(f"identical output: {count - len(differing)}/{count}")
+        for name in differing:
+            print(f"  differs: {name}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Measures how long the docbooktoxtm CLI takes to start.
+
+    $ python benchmarks/bench_startup.py [--repeat 10] [--max-import-ms 80] [--max-help-ms 400]
+
+`import docbooktoxtm.main` is timed with `python -X importtime` and a full
+`docbooktoxtm --help` run is timed wall-clock, each in a fresh interpreter.
+The script exits with status 1 when a median exceeds its budget or when
+`--help` imports one of the heavy dependencies that only the commands need.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+HEAVY_MODULES = ('lxml', 'xmltodict', 'pydantic', 'fuzzywuzzy', 'Levenshtein', 'github', 'requests')
+
+
+def python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))))
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True)
+
+
+def imported_modules(importtime: str) -> dict:
+    """
+    Parses `-X importtime` output into {module: cumulative microseconds}.
+    """
+    modules = {}
+    for line in importtime.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def heavy_imports(modules: dict) -> list:
+    return sorted(name for name in modules if name.split('.')[0] in HEAVY_MODULES)
+
+
+def time_import() -> float:
+    modules = imported_modules(python('-X', 'importtime', '-c', 'import docbooktoxtm.main').stderr)
+    return modules['docbooktoxtm.main'] / 1000
+
+
+def time_help() -> float:
+    start = time.perf_counter()
+    python('-m', 'docbooktoxtm.main', '--help')
+    return (time.perf_counter() - start) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--max-import-ms', type=float, default=80)
+    parser.add_argument('--max-help-ms', type=float, default=400)
+    args = parser.parse_args()
+    heavy = heavy_imports(imported_modules(python('-X', 'importtime', '-m', 'docbooktoxtm.main', '--help').stderr))
+    import_ms = statistics.median(time_import() for _ in range(args.repeat))
+    help_ms = statistics.median(time_help() for _ in range(args.repeat))
+    print(f"import docbooktoxtm.main: {import_ms:.1f} ms (budget {args.max_import_ms:.0f} ms)")
+    print(f"docbooktoxtm --help:      {help_ms:.1f} ms (budget {args.max_help_ms:.0f} ms)")
+    print(f"heavy modules on --help:  {', '.join(heavy) or 'none'}")
+    if heavy or import_ms > args.max_import_ms or help_ms > args.max_help_ms:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
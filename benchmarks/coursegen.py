@@ -0,0 +1,149 @@
+"""
+Generates synthetic DocBook course packages laid out like a GitHub release.
+
+    $ python benchmarks/coursegen.py OUT.zip [--course SYN100] [--chapters 12]
+          [--sections 8] [--appendices 2] [--section-bytes 4096] [--extra-files 200]
+
+The package holds `{course}-{version}/guides/en-US/{course}-SG.xml`, which
+includes `Book_Info.xml`, the common intro files, `sg-chapters/chapterN.xml`
+and `sg-chapters/appendix-X.xml`; those in turn include their sections from
+`sg-chapters/topics/`. Section bodies are padded with paragraphs up to
+`--section-bytes`, and `--extra-files` non-guide files (labs, scripts) are
+added next to `guides/`. The output only depends on the arguments and `--seed`.
+"""
+import argparse
+import random
+import string
+import zipfile
+from typing import Dict, Optional
+
+DOCTYPE = '<!DOCTYPE {root} PUBLIC "-//OASIS//DTD DocBook XML V4.5//EN" ' \
+          '"http://www.oasis-open.org/docbook/xml/4.5/docbookx.dtd">'
+INCLUDE = '  <xi:include xmlns:xi="http://www.w3.org/2001/XInclude" href="{href}"/>'
+SECTION_NAMES = ('guided-exercise', 'lab', 'quiz', 'lecture', 'review', 'summary', 'practice', 'demo')
+INTRO = ('Common/Conventions.xml', 'Course_Preface.xml', 'Common/Intro-i18n.xml')
+WORDS = ('the', 'server', 'container', 'command', 'configure', 'network', 'service', 'file', 'user', 'system',
+         'install', 'package', 'cluster', 'deploy', 'storage', 'verify', 'output', 'node', 'image', 'option')
+
+
+def document(root: str, body: str, element_id: Optional[str] = None) -> str:
+    id_attr = f' id="{element_id}"' if element_id else ''
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n{DOCTYPE.format(root=root)}\n<{root}{id_attr}>\n{body}\n</{root}>\n'
+
+
+def includes(hrefs) -> str:
+    return '\n'.join(INCLUDE.format(href=href) for href in hrefs)
+
+
+def paragraphs(rng: random.Random, size: int) -> str:
+    lines = []
+    length = 0
+    while length < size:
+        line = f"  <para>{' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 24))).capitalize()}.</para>"
+        if rng.random() < 0.2:
+            line = f"  <screen>[student@workstation ~]$ <userinput>{rng.choice(WORDS)} --{rng.choice(WORDS)}" \
+                   f"</userinput></screen>"
+        lines.append(line)
+        length += len(line) + 1
+    return '\n'.join(lines)
+
+
+def book_info(course: str, version: str, pubsnumber: str, subtitle: str) -> str:
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<bookinfo>
+  <invpartnumber>{course}</invpartnumber>
+  <title>Synthetic course {course}</title>
+  <subtitle>{subtitle}</subtitle>
+  <productname class="trade">{course.rstrip(string.digits)}</productname>
+  <productnumber>{version}</productnumber>
+  <edition>1</edition>
+  <pubdate>{pubsnumber}</pubdate>
+  <pubsnumber>{pubsnumber}</pubsnumber>
+</bookinfo>
+'''
+
+
+def course_files(course: str = 'SYN100',
+                 chapters: int = 12,
+                 sections: int = 8,
+                 appendices: int = 2,
+                 section_bytes: int = 4096,
+                 extra_files: int = 200,
+                 version: str = '1.0',
+                 pubsnumber: str = '20200101',
+                 subtitle: str = 'Student Workbook',
+                 seed: int = 0
+                 ) -> Dict[str, bytes]:
+    """
+    Member name -> content of a synthetic release, in archive order.
+    """
+    rng = random.Random(seed)
+    root = f"{course}-{version}"
+    guides = f"{root}/guides/en-US"
+    files = {
+        f"{root}/README.md": f"# {course}\n".encode(),
+        f"{guides}/Book_Info.xml": book_info(course, version, pubsnumber, subtitle).encode(),
+    }
+    for intro in INTRO:
+        body = paragraphs(rng, section_bytes)
+        files[f"{guides}/{intro}"] = document('section', body, element_id=intro.split('/')[-1][:-4]).encode()
+    book = ['Book_Info.xml', *INTRO]
+    parts = [(f"chapter{i}", 'chapter', f"chapter{i}") for i in range(1, chapters + 1)]
+    parts += [(f"appendix-{string.ascii_lowercase[i]}", 'appendix', 'appendix') for i in range(appendices)]
+    for name, kind, topics in parts:
+        hrefs = []
+        for j in range(1, sections + 1):
+            section = f"topics/{topics}/{name}-{j:02d}-{rng.choice(SECTION_NAMES)}.xml"
+            hrefs.append(section)
+            body = f"  <title>{name} section {j}</title>\n{paragraphs(rng, section_bytes)}"
+            files[f"{guides}/sg-chapters/{section}"] = document('section', body, element_id=f"{name}-{j}").encode()
+        body = f"  <title>{name}</title>\n  <abstract>\n    <para>{name}</para>\n  </abstract>\n{includes(hrefs)}"
+        files[f"{guides}/sg-chapters/{name}.xml"] = document(kind, body, element_id=name).encode()
+        book.append(f"sg-chapters/{name}.xml")
+    files[f"{guides}/{course}-SG.xml"] = document('book', includes(book), element_id=f"{course}-SG").encode()
+    for i in range(extra_files):
+        data = ''.join(rng.choice(string.ascii_letters + '\n') for _ in range(rng.randint(64, 2048)))
+        files[f"{root}/classroom/materials/labs/lab{i // 20}/file{i}.sh"] = data.encode()
+    return files
+
+
+def generate_course(fname: str, **options) -> str:
+    """
+    Writes a synthetic release to `fname`; `options` are those of `course_files`.
+    """
+    with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+        for name, data in course_files(**options).items():
+            f_zip.writestr(name, data)
+    return fname
+
+
+def translated_target(unsourced: str, fname: str, subtitle: str = 'Teilnehmerarbeitsbuch') -> str:
+    """
+    Turns an unsourced package into what XTM would export for another language.
+    """
+    with zipfile.ZipFile(unsourced) as source, zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename.endswith('Book_Info.xml'):
+                data = data.replace(b'Student Workbook', subtitle.encode())
+            f_zip.writestr(info.filename, data)
+    return fname
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('fname')
+    parser.add_argument('--course', default='SYN100')
+    parser.add_argument('--chapters', type=int, default=12)
+    parser.add_argument('--sections', type=int, default=8)
+    parser.add_argument('--appendices', type=int, default=2)
+    parser.add_argument('--section-bytes', type=int, default=4096)
+    parser.add_argument('--extra-files', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    options = vars(args)
+    print(generate_course(options.pop('fname'), **options))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+In-memory conversions for services that keep a worker process warm.
+
+    >>> from docbooktoxtm.api import convert
+    >>> unsourced = convert(source_bytes)
+    >>> resourced = convert(source_bytes, target=request.stream)
+    >>> resourced.fname, resourced.data.read()
+
+Packages are read from bytes or binary file-like objects and written to a
+stream. Nothing is written to or removed from the working directory, no
+logging handlers are installed (records go to the `logging` root logger as
+everywhere else in the package) and no worker processes are started unless
+`jobs` asks for them. With the xmllint engine every formatted document goes
+through a temporary file, which is removed right after.
+"""
+import io
+import zipfile
+from typing import BinaryIO, IO, NamedTuple, Optional, Union
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.formatting import DEFAULT_ENGINE
+from docbooktoxtm.ziputils import ZipIndex
+
+Package = Union[bytes, bytearray, memoryview, IO[bytes]]
+
+
+class Converted(NamedTuple):
+    fname: str
+    data: BinaryIO
+    sublog: Optional[dict] = None
+
+
+def package_index(package: Package) -> ZipIndex:
+    if isinstance(package, (bytes, bytearray, memoryview)):
+        package = io.BytesIO(package)
+    return ZipIndex(package)
+
+
+def convert(source: Package,
+            target: Optional[Package] = None,
+            output: Optional[BinaryIO] = None,
+            engine: str = DEFAULT_ENGINE,
+            jobs: int = 1,
+            level: Optional[int] = None,
+            zip_jobs: int = 1
+            ) -> Converted:
+    """
+    Unsources `source` or, given the `target` exported from XTM, resources it.
+    :param source: Source release package, as bytes or a readable binary file
+     object, which must be seekable.
+    :param target: Target package, in the same forms.
+    :param output: Writable binary stream receiving the output package; it need
+     not be seekable. Default is a new BytesIO.
+    :param engine: XML formatting engine used on the target files.
+    :param jobs: Number of worker processes formatting target files.
+    :param level: Deflate level of the members written to the output package.
+    :param zip_jobs: Number of threads compressing output members.
+    :return: Name the CLI would give the output package, the output stream,
+     rewound if it is a new BytesIO, and the unmatched files of a resource.
+    """
+    data = output if output is not None else io.BytesIO()
+    source_index = package_index(source)
+    target_index = package_index(target) if target is not None else None
+    try:
+        book = Book(source_index, target_index, engine=engine, jobs=jobs, level=level, zip_jobs=zip_jobs)
+        with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+            if target_index is not None:
+                book.write_resourced(f_zip)
+            else:
+                book.write_unsourced(f_zip)
+    finally:
+        source_index.close()
+        if target_index is not None:
+            target_index.close()
+    if output is None:
+        data.seek(0)
+    return Converted(book.output_fname, data, book.sublog)
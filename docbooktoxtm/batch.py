@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from docbooktoxtm.bookclasses import Book, BookInfo
+from docbooktoxtm.cache import ReleaseCache, StructureCache, place, release_cache
+from docbooktoxtm.formatting import DEFAULT_ENGINE
+from docbooktoxtm.functions import get_zip
+from docbooktoxtm.releases import ReleaseClient
+from docbooktoxtm.ziputils import ZipIndex
+
+
+class BatchResult(NamedTuple):
+    package: str
+    ok: bool
+    wd: str
+    output: Optional[str] = None
+    error: Optional[str] = None
+    seconds: float = 0.0
+    unmatched_targets: int = 0
+    unmatched_sources: int = 0
+
+
+def read_manifest(fname: str) -> List[str]:
+    """
+    Reads one package per line; blank lines and `#` comments are skipped.
+    """
+    with open(fname, 'r') as f:
+        lines = (line.split('#', 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+def parse_entry(entry: str) -> Tuple[str, Optional[str]]:
+    """
+    Splits an unsource entry of the form `COURSE[@RELEASE_TAG]`.
+    """
+    course, _, release_tag = entry.partition('@')
+    return course, release_tag or None
+
+
+def work_dirs(out_dir: str, entries: Iterable[str]) -> List[str]:
+    """
+    One working directory per entry, named after the package and numbered
+    when two entries would share it.
+    """
+    dirs = []
+    for entry in entries:
+        name = os.path.basename(entry).rsplit('.zip', 1)[0].replace('@', '-') or 'package'
+        wd, i = name, 1
+        while wd in dirs:
+            i += 1
+            wd = f"{name}-{i}"
+        dirs.append(wd)
+    return [os.path.abspath(os.path.join(out_dir, wd)) for wd in dirs]
+
+
+class ThreadFilter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.ident = threading.get_ident()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.thread == self.ident
+
+
+@contextmanager
+def package_log(wd: str) -> Iterator[None]:
+    """
+    Copies the records logged by the current thread to `wd/events.log`.
+    """
+    log = logging.getLogger('')
+    handler = logging.FileHandler(os.path.join(wd, 'events.log'))
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] : %(message)s", "%a %d %b %Y %H:%M:%S"))
+    handler.addFilter(ThreadFilter())
+    log.addHandler(handler)
+    try:
+        yield
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+
+
+class Batch:
+    """
+    Runs `resource` or `unsource` on many packages with a pool of threads.
+
+    The threads share one GitHub client (and with it one HTTP session), the
+    release cache and the structure cache next to it. Every package gets a
+    working directory of its own below `out_dir`, where its inputs are linked,
+    its release is downloaded and its output is written, so that packages
+    never see each other's files. Without a `cache` the default release cache
+    is used; `cache=False` downloads every release.
+    """
+
+    def __init__(self,
+                 out_dir: str = os.curdir,
+                 workers: int = 4,
+                 cache: Union[ReleaseCache, bool, None] = None,
+                 client: Optional[ReleaseClient] = None,
+                 engine: str = DEFAULT_ENGINE,
+                 jobs: int = 1,
+                 stream: bool = False,
+                 level: Optional[int] = None,
+                 zip_jobs: int = 0
+                 ):
+        self.out_dir = out_dir
+        self.workers = workers
+        self.cache = cache = release_cache(cache)
+        self.client = client or ReleaseClient(cache_dir=cache.root if cache else None)
+        self.options = dict(engine=engine, jobs=jobs, stream=stream, level=level, zip_jobs=zip_jobs,
+                            structures=StructureCache(cache.root) if cache else None)
+        self.lock = threading.Lock()
+        self.release_locks: Dict[Tuple[str, Optional[str]], threading.Lock] = defaultdict(threading.Lock)
+
+    @contextmanager
+    def release_lock(self, course: str, release_tag: Optional[str]) -> Iterator[None]:
+        # packages of the same release wait for the first download and then find it in the cache
+        with self.lock:
+            lock = self.release_locks[(course, release_tag)]
+        with lock:
+            yield
+
+    def get_zip(self, course: str, release_tag: Optional[str], wd: str) -> str:
+        with self.release_lock(course, release_tag):
+            return get_zip(course, release_tag, cache=self.cache or False, client=self.client, wd=wd)
+
+    def resource_one(self, target_fname: str, wd: str) -> Tuple[Book, str]:
+        target = os.path.join(wd, os.path.basename(target_fname))
+        place(os.path.abspath(target_fname), target)
+        with ZipIndex(target) as target_index:
+            bi = BookInfo.from_zipf(target_index)
+            source_fname = self.get_zip(bi.course, bi.release_tag, wd)
+            book = Book(source_fname, target_index, wd=wd, **self.options)
+            return book, book()
+
+    def unsource_one(self, entry: str, wd: str) -> Tuple[Book, str]:
+        if os.path.isfile(entry):
+            source_fname = os.path.join(wd, os.path.basename(entry))
+            place(os.path.abspath(entry), source_fname)
+        else:
+            source_fname = self.get_zip(*parse_entry(entry), wd)
+        book = Book(source_fname, wd=wd, **self.options)
+        return book, book()
+
+    def run_one(self, func: Callable[[str, str], Tuple[Book, str]], entry: str, wd: str) -> BatchResult:
+        start = time.perf_counter()
+        os.makedirs(wd, exist_ok=True)
+        with package_log(wd):
+            logging.info(f"Processing {entry} in {wd}")
+            try:
+                book, output = func(entry, wd)
+            except Exception as e:
+                logging.error(f"Could not process {entry}: {e}")
+                logging.debug(f"Traceback for {entry}", exc_info=True)
+                return BatchResult(entry, False, wd, error=f"{type(e).__name__}: {e}",
+                                   seconds=time.perf_counter() - start)
+        sublog = book.sublog or {}
+        return BatchResult(
+            entry, True, wd,
+            output=os.path.join(wd, output),
+            seconds=time.perf_counter() - start,
+            unmatched_targets=len(sublog.get('unmatched_targets', ())),
+            unmatched_sources=len(sublog.get('unmatched_sources', ()))
+        )
+
+    def run(self, func: Callable[[str, str], Tuple[Book, str]], entries: List[str]) -> List[BatchResult]:
+        dirs = work_dirs(self.out_dir, entries)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(self.run_one, [func] * len(entries), entries, dirs))
+        logging.debug(f"{self.client.requests} GitHub request(s) for {len(entries)} package(s)")
+        return results
+
+    def resource(self, target_fnames: List[str]) -> List[BatchResult]:
+        return self.run(self.resource_one, target_fnames)
+
+    def unsource(self, entries: List[str]) -> List[BatchResult]:
+        return self.run(self.unsource_one, entries)
+
+
+def write_summary(results: List[BatchResult], fname: str) -> None:
+    with open(fname, 'w') as f:
+        json.dump([result._asdict() for result in results], f, indent=2, ensure_ascii=False)
@@ -2,16 +2,26 @@ import logging
 import os
 import re
 import shutil
+import sys
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from os import PathLike
-from subprocess import Popen, DEVNULL
-from typing import Iterable, Tuple, Union, Any, Optional
+from typing import Iterable, Tuple, Union, Any, Optional, Callable, Dict, NamedTuple
 
 import xmltodict
-from fuzzywuzzy import process, fuzz
-from lxml import etree
 from pydantic import BaseModel, DirectoryPath
 
+from docbooktoxtm.booktree import BookTree
+from docbooktoxtm.filetable import FileTable
+from docbooktoxtm.cache import StructureCache
+from docbooktoxtm.formatting import DEFAULT_ENGINE, format_file_safely, format_bytes_safely
+from docbooktoxtm.incremental import Delta, Manifest, ManifestEntry, digest
+from docbooktoxtm.languages import default_detector
+from docbooktoxtm.limits import Limits
+from docbooktoxtm.matching import TargetMatcher
+from docbooktoxtm.profiling import count, counting, trace
+from docbooktoxtm.ziputils import MemberWriter, ZipIndex, atomic_zip, copy_member, member_name, zipdir
+
 DEFAULT_SOURCE_ROOT = os.path.join('guides', 'en-US')
 DEFAULT_TARGET_ROOT = 'en-US'
 
@@ -19,57 +29,67 @@ PathPair = Tuple[DirectoryPath, DirectoryPath]
 FileList = Iterable[PathPair]
 
 
-def ppxml(path: PathLike) -> None:
-    for root, _, files in os.walk(path):
-        for file in files:
-            file = os.path.join(root, file)
-            cmd1 = f'mv "{file}" "{file}.bak" 2>&1'
-            cmd2 = f'xmllint --format --recover "{file}.bak" > "{file}" 2>&1'
-            cmd3 = f'rm -f "{file}.bak" 2>&1'
-            pattern = r'/^\..*\.xml\.bak.*parser error.*not defined$/,+2d'
-            cmd4 = f'sed "{pattern}" -i {file}'
-            final = Popen(f"{cmd1}; {cmd2}; {cmd3}; {cmd4}", shell=True, stdin=DEVNULL,
-                          stdout=DEVNULL, stderr=DEVNULL, close_fds=True)
-            final.communicate()
+def run_tasks(func: Callable, tasks: list, jobs: int = 1) -> list:
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(tasks) > 1:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(func, tasks, chunksize=chunksize))
+    return [func(task) for task in tasks]
+
+
+def file_size(path: PathLike) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
 
 
-def zipdir(path: PathLike,
-           f_zip: zipfile.ZipFile
-           ) -> None:
-    for root, _, files in os.walk(path):
-        for file in files:
-            f_zip.write(os.path.join(root, file))
+def ppxml(path: PathLike, engine: str = DEFAULT_ENGINE, jobs: int = 1) -> Tuple[str, ...]:
+    files = sorted(os.path.join(root, file) for root, _, names in os.walk(path) for file in names)
+    if counting():
+        count(read=sum(map(file_size, files)), files=len(files))
+    results = run_tasks(format_file_safely, [(file, engine) for file in files], jobs)
+    failed = []
+    for file, error in results:
+        if error is None:
+            logging.debug(f"Formatted {file}")
+        else:
+            logging.error(f"Could not format {file}: {error}")
+            failed.append(file)
+    if counting():
+        count(written=sum(map(file_size, files)))
+    return tuple(failed)
 
 
 class BookFile:
+    __slots__ = ('chapter', 'count', 'name', 'path')
+
     def __init__(self, chapter, count, file_path):
-        self.chapter = chapter
+        self.chapter = sys.intern(chapter)
         self.count = f"{count:02d}"
         self.name = os.path.basename(file_path)
-        self.path = os.path.dirname(file_path)
+        self.path = sys.intern(os.path.dirname(file_path))
+
+    def source_dir(self, source_root):
+        return os.path.join(*source_root.split('/'), *self.path.split('/'))
 
     def source_path(self, source_root):
-        return os.path.join(*source_root.split('/'), *self.path.split('/'), self.name)
+        return os.path.join(self.source_dir(source_root), self.name)
 
-    def target_path(self, target_root=DEFAULT_TARGET_ROOT):
-        if self.path == 'Common':
-            return os.path.join(target_root, self.chapter, f"{self.count}-{self.name}")
-        return os.path.join(*target_root.split('/'), self.chapter, *self.path.split('/'), f"{self.count}-{self.name}")
+    def astuple(self) -> Tuple[str, int, str]:
+        """
+        Arguments that rebuild this file, as stored in the structure cache.
+        """
+        return self.chapter, int(self.count), '/'.join((self.path, self.name)) if self.path else self.name
 
+    def target_dir(self, target_root=DEFAULT_TARGET_ROOT):
+        if self.path == 'Common':
+            return os.path.join(target_root, self.chapter)
+        return os.path.join(*target_root.split('/'), self.chapter, *self.path.split('/'))
 
-SUBTITLE_INDEX = {
-    'Teilnehmerarbeitsbuch': 'de-DE',
-    'Manuel d\'exercices': 'fr-FR',
-    '受講生用のワークブック': 'ja-JP',
-    '受講生用ワークブック': 'ja-JP',
-    '수강생 워크북': 'ko-KR',
-    'Livro do aluno': 'pt-BR',
-    'Рабочая тетрадь': 'ru-RU',
-    '学员练习册': 'zh-CN',
-    'Libro de trabajo del estudiante': 'es-ES',
-    'छात्र-छात्रा की वर्कबुक': 'hi-IN',
-    'Student Workbook': 'en-US'
-}
+    def target_path(self, target_root=DEFAULT_TARGET_ROOT):
+        return os.path.join(self.target_dir(target_root), f"{self.count}-{self.name}")
 
 
 class BookInfo(BaseModel):
@@ -101,28 +121,18 @@ class BookInfo(BaseModel):
         self.release_tag = f"{self.productname}{self.productnumber}-en-{self.edition}-{self.pubsnumber}"
 
     @staticmethod
-    def _xmltodict(zip_fname: str):
-        with zipfile.ZipFile(zip_fname, 'r') as f_zip:
-            bi_files = [file for file in f_zip.namelist() if 'Book_Info.xml' in file]
-            if len(bi_files) == 1:
-                bi_file = f_zip.open(bi_files[0], 'r')
-            elif len(bi_files) > 1:
-                filtered_bi_files = [file for file in bi_files if 'en-US' in file]
-                if len(filtered_bi_files) == 1:
-                    bi_file = f_zip.open(filtered_bi_files[0], 'r')
-            else:
-                raise ValueError(f"No 'Book_Info.xml' file found in {zip_fname}.")
-            book = xmltodict.parse(bi_file.read()).get('bookinfo')
+    def _xmltodict(zipf: Union[str, ZipIndex]):
+        index = zipf if isinstance(zipf, ZipIndex) else ZipIndex(zipf)
+        try:
+            book = xmltodict.parse(index.read(index.find_book_info())).get('bookinfo')
+        finally:
+            if index is not zipf:
+                index.close()
         return {attr: value.get('#text') if '#text' in value else value for attr, value in book.items()}
 
     @staticmethod
     def get_book_language(query: str):
-        return SUBTITLE_INDEX.get(
-            process.extractOne(
-                query,
-                list(SUBTITLE_INDEX.keys()),
-                scorer=fuzz.ratio)[0]
-        )
+        return default_detector().detect(query)
 
     @classmethod
     def from_zipf(cls, zipf):
@@ -131,8 +141,11 @@ class BookInfo(BaseModel):
 
 
 class Book(BookInfo):
-    source_zip: str
+    source_zip: Optional[str] = None
     target_zip: Optional[str] = None
+    source_index: Any = None
+    target_index: Any = None
+    owned_indexes: tuple = ()
     wd: str
     mapf: str
     source_root: str
@@ -141,39 +154,73 @@ class Book(BookInfo):
     appendices: tuple
     chapters: tuple
     files: Optional[tuple] = None
-    flist: Optional[Union[tuple, list]] = None
+    flist: Any = None
     clean: Optional[Union[tuple, list]] = None
     target_actuals: Optional[Union[tuple, list]] = None
     sublog: Optional[dict] = None
+    engine: str = DEFAULT_ENGINE
+    jobs: int = 1
+    stream: bool = False
+    level: Optional[int] = None
+    zip_jobs: int = 0
+    prepared: Any = None
+    low_memory: bool = False
+    limits: Any = None
 
     def __init__(self,
-                 source_zip: str,
-                 target_zip: Optional[str] = None
+                 source_zip: Union[str, ZipIndex],
+                 target_zip: Optional[Union[str, ZipIndex]] = None,
+                 engine: str = DEFAULT_ENGINE,
+                 jobs: int = 1,
+                 stream: bool = False,
+                 wd: Optional[str] = None,
+                 level: Optional[int] = None,
+                 zip_jobs: int = 0,
+                 prepared: Optional['PreparedTarget'] = None,
+                 low_memory: bool = False,
+                 limits: Optional[Limits] = None,
+                 structures: Optional[StructureCache] = None
                  ):
-        book_info = self._xmltodict(target_zip) if target_zip else self._xmltodict(source_zip)
-        book_info = self.__validate_book_info(book_info)
-        logging.debug(f"Book info extracted from {source_zip}.")
-        for key, value in book_info.items():
-            logging.debug(f"{key}: {value}")
-        attributes = self.__get_attributes(book_info.get('invpartnumber'), source_zip)
-        super().__init__(source_zip=source_zip, target_zip=target_zip, wd=os.getcwd(), **attributes, **book_info)
-        files = [BookFile('00-introduction', i, file) for i, file in enumerate(self.intro, start=1)]
-        files += self.__get_chapter_file_list()
-        files += self.__get_appendix_file_list()
-        self.files = tuple(files)
-        self.flist = tuple(
-            (file.source_path(self.source_root), file.target_path(self.target_root)) for file in self.files
-        )
-        if target_zip:
-            self.target_actuals = self.__get_target_actuals()
-            self.clean = self.__get_clean_flist()
+        # the indexes opened here belong to the book, and must not outlive a failed parse
+        owned = []
+        try:
+            with trace('parse'):
+                source_index = source_zip if isinstance(source_zip, ZipIndex) else ZipIndex(source_zip)
+                if source_index is not source_zip:
+                    owned.append(source_index)
+                target_index = target_zip if isinstance(target_zip, ZipIndex) or target_zip is None else ZipIndex(target_zip)
+                if target_index is not None and target_index is not target_zip:
+                    owned.append(target_index)
+                book_info = self._xmltodict(target_index) if target_index else self._xmltodict(source_index)
+                book_info = self.__validate_book_info(book_info)
+                logging.debug(f"Book info extracted from {source_index.fname}.")
+                for key, value in book_info.items():
+                    logging.debug(f"{key}: {value}")
+                attributes = self.__get_attributes(book_info.get('invpartnumber'), source_index, structures)
+                super().__init__(source_zip=source_index.fname, target_zip=target_index.fname if target_index else None,
+                                 source_index=source_index, target_index=target_index, wd=os.path.abspath(wd) if wd else os.getcwd(), engine=engine,
+                                 owned_indexes=tuple(owned), jobs=jobs, stream=stream or low_memory, level=level,
+                                 zip_jobs=1 if low_memory else zip_jobs, prepared=prepared, low_memory=low_memory,
+                                 limits=limits,
+                                 **attributes, **book_info)
+            if target_index:
+                with trace('match'):
+                    self.target_actuals = self.__get_target_actuals()
+                    self.clean = self.__get_clean_flist()
+                    count(files=len(self.target_actuals))
+        except BaseException:
+            for index in owned:
+                index.close()
+            raise
 
     def __get_target_actuals(self):
-        with zipfile.ZipFile(self.target_zip, 'r') as f_zip:
-            flist = [f for f in f_zip.namelist() if f[-1] != '/']
-            if flist[0].split('/', 1)[0] != 'en-US':
-                return tuple(os.path.join('en-US', *f.split('/')) for f in flist)
-            return tuple(os.path.join(*f.split('/')) for f in flist)
+        return tuple(self.target_members())
+
+    def target_members(self) -> Dict[str, str]:
+        flist = [f for f in self.target_index.namelist if f[-1] != '/']
+        if flist[0].split('/', 1)[0] != 'en-US':
+            return {os.path.join('en-US', *f.split('/')): f for f in flist}
+        return {os.path.join(*f.split('/')): f for f in flist}
 
     @staticmethod
     def __validate_book_info(info):
@@ -196,156 +243,420 @@ class Book(BookInfo):
         return info
 
     def __get_clean_flist(self):
-        clean = []
-        matches = []
-        fdict = {tfname: sfname for sfname, tfname in self.flist}
-        for tf in self.target_actuals:
-            if tf in fdict:
-                clean.append((tf, fdict.get(tf)))
-                matches.append(fdict.get(tf))
-                logging.info(f"File matched as expected: {tf} -> {fdict.get(tf)}")
-            else:
-                bests = process.extractBests(tf, (tarf for tarf in fdict if (
-                            os.path.basename(fdict.get(tarf)) in tf and fdict.get(tarf) not in matches)))
-                if bests:
-                    clean.append((tf, fdict.get(bests[0][0])))
-                    matches.append(fdict.get(bests[0][0]))
-                    logging.info(f"Unexpected filename: {tf}")
-                    logging.info(f"Matched to source file: {tf} -> {fdict.get(bests[0][0])}")
-                else:
-                    logging.warning(f"Unmatched target file: {tf}")
-        unmatched_sf = tuple(sf for sf, tf in self.flist if sf not in matches)
-        for sf in unmatched_sf:
-            logging.warning(f"Source file not found in target files: {sf}")
-        return sorted(tuple(clean))
+        matches = TargetMatcher(self.flist).match(self.target_actuals)
+        self.sublog = {
+            'unmatched_targets': matches.unmatched_targets,
+            'unmatched_sources': matches.unmatched_sources
+        }
+        return matches.clean
 
-    @staticmethod
-    def __get_attributes(course, source_zip):
-        def get_book(zipf: zipfile.ZipFile, fname: str, source_root: str):
-            namelist = [file for file in zipf.namelist() if file[-1] != '/']
-            root_file = zipf.open('/'.join((source_root, fname)))
-            parser = etree.XMLParser(recover=True)
-            root = etree.parse(root_file, parser=parser).getroot()
-            children = [file for child in root if (
-                    (file := child.attrib.get('href'))
-                    and
-                    '/'.join((source_root, file)) in namelist
-            )
-                        ]
-            file_list = []
-            for child in children:
-                file_list.append(child)
-                file_list += get_book(zipf, child, source_root)
-            return file_list
-
-        with zipfile.ZipFile(source_zip, 'r') as f_zip:
-            root_file_pattern = f"^.*/guides/en-US/{course}-SG\.xml$"
-            sg = [file for file in f_zip.namelist() if re.search(root_file_pattern, file)]
-            source_root, mapf = os.path.split(sg[0])
-            book_tree = get_book(f_zip, mapf, source_root)
-            intro = tuple(file for file in book_tree if 'sg-chapters' not in file)
-            appendices = tuple(file for file in book_tree if 'appendix' in file)
-            chapters = tuple(file for file in book_tree if ('sg-chapters' in file and file not in appendices))
+    @classmethod
+    def __get_attributes(cls, course, source_index: ZipIndex, structures: Optional[StructureCache] = None):
+        source_digest = source_index.digest if structures else None
+        cached = structures.get(source_digest, course) if structures else None
+        if cached is not None:
+            structure = {
+                'mapf': cached['mapf'],
+                'source_root': cached['source_root'],
+                'intro': tuple(cached['intro']),
+                'appendices': tuple(cached['appendices']),
+                'chapters': tuple(cached['chapters']),
+                'files': tuple(BookFile(*file) for file in cached['files']),
+                'flist': FileTable(cached['flist']),
+            }
+        else:
+            structure = cls.__get_structure(course, source_index)
+            if structures:
+                structures.put(source_digest, course, {
+                    **structure,
+                    'files': [file.astuple() for file in structure['files']],
+                    'flist': list(structure['flist']),
+                })
+        return {
+            **structure,
+            'clean': [],
+            'target_actuals': [],
+            'sublog': {}
+        }
 
+    @classmethod
+    def __get_structure(cls, course, source_index: ZipIndex):
+        source_root, mapf = os.path.split(source_index.find_map(course))
+        tree = BookTree(source_index, source_root)
+        book_tree = tree.walk(mapf)
+        intro = tuple(file for file in book_tree if 'sg-chapters' not in file)
+        appendices = tuple(file for file in book_tree if 'appendix' in file)
+        chapters = tuple(file for file in book_tree if ('sg-chapters' in file and file not in appendices))
+        files = [BookFile('00-introduction', i, file) for i, file in enumerate(intro, start=1)]
+        files += cls.__get_chapter_file_list(tree, chapters)
+        files += cls.__get_appendix_file_list(tree, appendices)
+        flist = FileTable.from_files(files, source_root, DEFAULT_TARGET_ROOT)
         return {
             'mapf': mapf,
             'source_root': source_root,
             'intro': intro,
             'appendices': appendices,
             'chapters': chapters,
-            'clean': [],
-            'flist': [],
-            'target_actuals': [],
-            'sublog': {}
+            'files': tuple(files),
+            'flist': flist,
         }
 
-    def __get_chapter_file_list(self):
+    @staticmethod
+    def __get_chapter_file_list(tree: BookTree, chapters: tuple):
         chapter_files = []
-        with zipfile.ZipFile(self.source_zip) as f_zip:
-            for i, chapter in enumerate(self.chapters, start=1):
-                chapter_root, chapter_fname = os.path.split(chapter)
-                chapter_open = f_zip.open('/'.join((self.source_root, chapter)))
-                chapter_index = f"{i:02d}-{chapter_fname.split('.', 1)[0]}"
-                root = etree.parse(chapter_open, parser=etree.XMLParser(recover=True)).getroot()
-                sections = [section for child in root if (section := child.attrib.get('href'))]
-                chapter_file = BookFile(chapter_index, i, chapter)
-                chapter_files.append(chapter_file)
-                chapter_files += [BookFile(chapter_index, j, '/'.join((chapter_root, section))) for j, section in
-                                  enumerate(sections, start=1)]
+        for i, chapter in enumerate(chapters, start=1):
+            chapter_root, chapter_fname = os.path.split(chapter)
+            chapter_index = f"{i:02d}-{chapter_fname.split('.', 1)[0]}"
+            sections = tree.hrefs(chapter)
+            chapter_file = BookFile(chapter_index, i, chapter)
+            chapter_files.append(chapter_file)
+            chapter_files += [BookFile(chapter_index, j, '/'.join((chapter_root, section))) for j, section in
+                              enumerate(sections, start=1)]
         return chapter_files
 
-    def __get_appendix_file_list(self):
+    @staticmethod
+    def __get_appendix_file_list(tree: BookTree, appendices: tuple):
         appendix_files = []
         j = 1
-        with zipfile.ZipFile(self.source_zip) as f_zip:
-            for i, appendix in enumerate(self.appendices, start=1):
-                appendix_root = os.path.dirname(appendix)
-                appendix_open = f_zip.open('/'.join((self.source_root, appendix)))
-                root = etree.parse(appendix_open, parser=etree.XMLParser(recover=True)).getroot()
-                sections = [section for child in root if (section := child.attrib.get('href'))]
-                appendix_file = BookFile('99-appendix', i, appendix)
-                appendix_files.append(appendix_file)
-                for section in sections:
-                    appendix_files.append(BookFile('99-appendix', j, '/'.join((appendix_root, section))))
-                    j += 1
+        for i, appendix in enumerate(appendices, start=1):
+            appendix_root = os.path.dirname(appendix)
+            sections = tree.hrefs(appendix)
+            appendix_file = BookFile('99-appendix', i, appendix)
+            appendix_files.append(appendix_file)
+            for section in sections:
+                appendix_files.append(BookFile('99-appendix', j, '/'.join((appendix_root, section))))
+                j += 1
         return appendix_files
 
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.wd, *parts)
+
+    @staticmethod
+    def count_extracted(index: ZipIndex) -> None:
+        infos = [info for info in index.infos.values() if not info.is_dir()]
+        count(read=sum(info.compress_size for info in infos), written=sum(info.file_size for info in infos),
+              files=len(infos))
+
     def unzip_source(self):
-        with zipfile.ZipFile(self.source_zip, 'r') as source_zip:
-            source_root = source_zip.namelist()[0].split('/')[0]
-            source_zip.extractall()
+        source_root = self.source_index.root
+        with trace('extract'):
+            self.source_index.zipf.extractall(self.wd)
+            self.count_extracted(self.source_index)
         os.remove(self.source_zip)
         return source_root
 
     def unzip_target(self):
-        with zipfile.ZipFile(self.target_zip, 'r') as target_zip:
-            if target_zip.namelist()[0].split('/')[0] != self.target_root:
-                target_zip.extractall(self.target_root)
-            else:
-                target_zip.extractall()
+        if self.prepared is None:
+            prepare_target(self.target_index, self.wd, self.engine, self.jobs, target_root=self.target_root)
         os.remove(self.target_zip)
-        ppxml(self.target_root)
         return self.target_root
 
     def resource(self):
         sfdir = self.unzip_source()
         tfdir = self.unzip_target()
         for current, new in self.clean:
-            if not os.path.exists(os.path.dirname(new)):
+            if not os.path.exists(self.path(os.path.dirname(new))):
                 logging.debug(f"mkdir -p {new}")
-                os.makedirs(os.path.dirname(new))
+                os.makedirs(self.path(os.path.dirname(new)))
             logging.debug(f"cp {current} {new}")
-            shutil.move(current, new)
-        shutil.rmtree(tfdir)
-        for root, dirs, _ in os.walk(os.path.join(sfdir, 'guides')):
+            shutil.move(self.path(current), self.path(new))
+        shutil.rmtree(self.path(tfdir))
+        for root, dirs, _ in os.walk(self.path(sfdir, 'guides')):
             for d in dirs:
-                if d != 'en-US' and d in tuple(SUBTITLE_INDEX.values()):
+                if d != 'en-US' and d in default_detector().locales:
                     shutil.rmtree(os.path.join(root, d))
         if self.target != 'en-US':
-            shutil.copytree(os.path.join(sfdir, 'guides', 'en-US'), os.path.join(sfdir, 'guides', self.target))
-            shutil.rmtree(os.path.join(sfdir, 'guides', 'en-US'))
-        zip_fname = f"{self.course}-{self.pubsnumber}_{self.target}.zip"
-        with zipfile.ZipFile(zip_fname, 'w', zipfile.ZIP_DEFLATED) as f_zip:
-            zipdir(sfdir, f_zip)
-        shutil.rmtree(sfdir)
+            shutil.copytree(self.path(sfdir, 'guides', 'en-US'), self.path(sfdir, 'guides', self.target))
+            shutil.rmtree(self.path(sfdir, 'guides', 'en-US'))
+        zip_fname = self.output_fname
+        with trace('compress'):
+            with zipfile.ZipFile(self.path(zip_fname), 'w', zipfile.ZIP_DEFLATED) as f_zip:
+                zipdir(self.path(sfdir), f_zip, self.wd, self.level, self.zip_jobs)
+            count(written=os.path.getsize(self.path(zip_fname)))
+        shutil.rmtree(self.path(sfdir))
         return zip_fname
 
     def unsource(self):
         sfdir = self.unzip_source()
         tfdir = self.target_root
-        os.mkdir(tfdir)
+        os.mkdir(self.path(tfdir))
         for current, new in self.flist:
-            if not os.path.exists(os.path.dirname(new)):
+            if not os.path.exists(self.path(os.path.dirname(new))):
                 logging.debug(f"mkdir -p {new}")
-                os.makedirs(os.path.dirname(new))
+                os.makedirs(self.path(os.path.dirname(new)))
             logging.debug(f"cp {current} {new}")
-            shutil.move(current, new)
-        shutil.rmtree(sfdir)
-        zip_fname = f"{self.course}-{self.pubsnumber}_{self.target}.zip"
-        with zipfile.ZipFile(zip_fname, 'w', zipfile.ZIP_DEFLATED) as f_zip:
-            zipdir(tfdir, f_zip)
-        shutil.rmtree(tfdir)
+            shutil.move(self.path(current), self.path(new))
+        shutil.rmtree(self.path(sfdir))
+        zip_fname = self.output_fname
+        with trace('compress'):
+            with zipfile.ZipFile(self.path(zip_fname), 'w', zipfile.ZIP_DEFLATED) as f_zip:
+                zipdir(self.path(tfdir), f_zip, self.wd, self.level, self.zip_jobs)
+            count(written=os.path.getsize(self.path(zip_fname)))
+        shutil.rmtree(self.path(tfdir))
         return zip_fname
 
+    @property
+    def output_fname(self) -> str:
+        return f"{self.course}-{self.pubsnumber}_{self.target}.zip"
+
+    def resourced_name(self, name: str) -> Optional[str]:
+        parts = name.split('/')
+        if len(parts) > 3 and parts[1] == 'guides':
+            languages = default_detector().locales
+            if any(d != 'en-US' and d in languages for d in parts[2:-1]):
+                return None
+            if parts[2] == 'en-US':
+                parts[2] = self.target
+        return '/'.join(parts)
+
+    def format_target_members(self, members: Iterable[str]) -> Dict[str, bytes]:
+        return format_members(self.target_index, members, self.engine, self.jobs)
+
+    def write_resourced(self, f_zip: zipfile.ZipFile) -> None:
+        """
+        Writes the resourced package to an archive opened for writing, reading
+        both input packages without extracting or removing them.
+        """
+        target_members = self.target_members()
+        replacements = {member_name(new): target_members[current] for current, new in self.clean}
+        formatted = (self.prepared.formatted if self.prepared is not None else None) or {}
+        if self.low_memory:
+            formatted = LazyFormatted(self.target_index, self.engine, formatted)
+        else:
+            with trace('format'):
+                members = sorted(member for member in set(replacements.values()) if member not in formatted)
+                formatted = {**formatted, **self.format_target_members(members)}
+        source_zip = self.source_index.zipf
+        target_infos = self.target_index.infos
+        with trace('compress'):
+            start = f_zip.fp.tell()
+            with MemberWriter(f_zip, self.level, self.zip_jobs) as writer:
+                for info in source_zip.infolist():
+                    arcname = self.resourced_name(info.filename)
+                    if info.is_dir() or arcname is None:
+                        continue
+                    if info.filename in replacements:
+                        logging.debug(f"cp {replacements[info.filename]} {arcname}")
+                        size = target_infos[replacements[info.filename]].file_size
+                        self.check_limits(f_zip, size, size, arcname)
+                        data = formatted[replacements.pop(info.filename)]
+                        writer.write_bytes(arcname, data)
+                        count(read=len(data), files=1)
+                    else:
+                        self.check_limits(f_zip, 0, info.compress_size, arcname)
+                        writer.copy(source_zip, info, arcname)
+                        count(read=info.compress_size, files=1)
+                for new, current in replacements.items():
+                    arcname = self.resourced_name(new)
+                    if arcname is not None:
+                        logging.debug(f"cp {current} {arcname}")
+                        size = target_infos[current].file_size
+                        self.check_limits(f_zip, size, size, arcname)
+                        writer.write_bytes(arcname, formatted[current])
+                        count(read=size, files=1)
+            count(written=f_zip.fp.tell() - start)
+
+    def resource_stream(self, keep_inputs: bool = False):
+        zip_fname = self.output_fname
+        with atomic_zip(self.path(zip_fname)) as f_zip:
+            self.write_resourced(f_zip)
+        if not keep_inputs:
+            self.remove_inputs(self.path(zip_fname))
+        return zip_fname
+
+    def remove_inputs(self, zip_fname: str) -> None:
+        for fname in (self.source_zip, self.target_zip):
+            if fname is not None and os.path.abspath(fname) != os.path.abspath(zip_fname):
+                os.remove(fname)
+
+    def write_unsourced(self, f_zip: zipfile.ZipFile) -> None:
+        """
+        Writes the unsourced package to an archive opened for writing, reading
+        the source package without extracting or removing it.
+        """
+        with trace('compress'):
+            start = f_zip.fp.tell()
+            for current, new in self.flist:
+                logging.debug(f"cp {current} {new}")
+                info = self.source_index.infos[member_name(current)]
+                self.check_limits(f_zip, 0, info.compress_size, member_name(new))
+                copy_member(self.source_index.zipf, info, f_zip, member_name(new))
+                count(read=info.compress_size, files=1)
+            count(written=f_zip.fp.tell() - start)
+
+    def unsource_stream(self):
+        zip_fname = self.output_fname
+        with atomic_zip(self.path(zip_fname)) as f_zip:
+            self.write_unsourced(f_zip)
+        self.remove_inputs(self.path(zip_fname))
+        return zip_fname
+
+    def manifest(self) -> Manifest:
+        files = {}
+        for current, new in self.flist:
+            info = self.source_index.infos[member_name(current)]
+            source = member_name(current).split('/', 1)[1]
+            files[source] = ManifestEntry(digest(info.CRC, info.file_size), member_name(new))
+        return Manifest(self.source_index.root, files)
+
+    @property
+    def delta_fname(self) -> str:
+        return f"{self.course}-{self.pubsnumber}_{self.target}-delta.zip"
+
+    def unsource_delta(self, previous: Optional[Manifest] = None) -> Tuple[str, Delta, Manifest]:
+        """
+        Unsources only the files that differ from the previous run: files that
+        are new, whose content changed, or whose target path moved because the
+        book was reordered. Without a previous manifest every file is new.
+        :param previous: Manifest written by the previous run for the course.
+        :return: Name of the delta package, the delta and the manifest of this run.
+        """
+        manifest = self.manifest()
+        delta = manifest.diff(previous)
+        emitted = set(delta.emitted)
+        zip_fname = self.delta_fname
+        self.preflight()
+        with trace('compress'), atomic_zip(self.path(zip_fname)) as f_zip:
+            start = f_zip.fp.tell()
+            for current, new in self.flist:
+                if member_name(new) in emitted:
+                    logging.debug(f"cp {current} {new}")
+                    info = self.source_index.infos[member_name(current)]
+                    self.check_limits(f_zip, 0, info.compress_size, member_name(new))
+                    copy_member(self.source_index.zipf, info, f_zip, member_name(new))
+                    count(read=info.compress_size, files=1)
+            count(written=f_zip.fp.tell() - start)
+        logging.info(f"{len(emitted)} of {len(self.flist)} files emitted to {zip_fname}; "
+                     f"{len(delta.removed)} target files removed since {previous.release if previous else 'none'}")
+        self.remove_inputs(self.path(zip_fname))
+        return zip_fname, delta, manifest
+
+    def plan(self) -> dict:
+        """
+        What a run would do, without doing it: the path each file would be
+        moved from and to, and for a resource the files left unmatched. Only
+        the central directories, `Book_Info.xml` and the include graph of the
+        book were read to build it.
+        """
+        pairs = self.clean if self.target_index else self.flist
+        return {
+            'mode': 'resource' if self.target_index else 'unsource',
+            'course': self.course,
+            'release': self.source_index.root,
+            'target': self.target,
+            'output': self.output_fname,
+            'files': [{'from': member_name(current), 'to': member_name(new)} for current, new in pairs],
+            'unmatched_targets': [member_name(path) for path in (self.sublog or {}).get('unmatched_targets', ())],
+            'unmatched_sources': [member_name(path) for path in (self.sublog or {}).get('unmatched_sources', ())],
+        }
+
+    def close(self) -> None:
+        for index in self.owned_indexes:
+            index.close()
+
+    def scratch_estimate(self) -> int:
+        """
+        Bytes of scratch disk a run needs: the output package, which is about
+        as large as the input packages, and on disk the extracted files too.
+        """
+        indexes = [index for index in (self.source_index, self.target_index) if index is not None]
+        infos = [info for index in indexes for info in index.infos.values()]
+        estimate = sum(info.compress_size for info in infos)
+        if not self.stream:
+            estimate += sum(info.file_size for info in infos)
+        return estimate
+
+    def check_limits(self, f_zip: Optional[zipfile.ZipFile] = None, memory: int = 0, disk: int = 0,
+                     what: str = 'this run') -> None:
+        """
+        Fails if the next member, which needs `memory` bytes in memory and
+        `disk` bytes in the output package, would go over `limits`.
+        """
+        if self.limits is None:
+            return
+        self.limits.check_rss(memory, what)
+        self.limits.check_scratch((f_zip.fp.tell() if f_zip is not None else 0) + disk, what)
+
+    def preflight(self) -> None:
+        """
+        Fails before anything is written if the run would go over `limits`.
+        """
+        if self.limits is not None:
+            self.limits.check_rss(what=f"reading {self.course}")
+            self.limits.check_scratch(self.scratch_estimate(), f"{'streaming' if self.stream else 'extracting'} "
+                                      f"{self.course}{'' if self.stream else ' (try --low-memory)'}")
+
     def __call__(self):
-        return self.resource() if self.target_zip else self.unsource()
+        try:
+            self.preflight()
+            if self.stream:
+                return self.resource_stream() if self.target_index else self.unsource_stream()
+            return self.resource() if self.target_index else self.unsource()
+        finally:
+            self.close()
+
+
+def format_members(index: ZipIndex, members: Iterable[str], engine: str = DEFAULT_ENGINE, jobs: int = 1
+                   ) -> Dict[str, bytes]:
+    tasks = [(member, index.read(member), engine) for member in members]
+    count(read=sum(len(data) for _, data, _ in tasks), files=len(tasks))
+    formatted = {}
+    for member, data, error in run_tasks(format_bytes_safely, tasks, jobs):
+        if error is None:
+            logging.debug(f"Formatted {member}")
+        else:
+            logging.error(f"Could not format {member}: {error}")
+        formatted[member] = data
+    count(written=sum(map(len, formatted.values())))
+    return formatted
+
+
+class LazyFormatted:
+    """
+    Formats target members one at a time, when they are looked up, instead
+    of keeping every formatted member in memory.
+    """
+
+    def __init__(self, index: ZipIndex, engine: str = DEFAULT_ENGINE, formatted: Optional[Dict[str, bytes]] = None):
+        self.index = index
+        self.engine = engine
+        self.formatted = formatted or {}
+
+    def __getitem__(self, member: str) -> bytes:
+        if member in self.formatted:
+            return self.formatted[member]
+        return format_members(self.index, (member,), self.engine)[member]
+
+
+class PreparedTarget(NamedTuple):
+    """
+    Target files formatted before the book is built: in the working directory
+    or, in stream mode, in memory as member name -> formatted data.
+    """
+    formatted: Optional[Dict[str, bytes]] = None
+
+
+def prepare_target(index: ZipIndex,
+                   wd: str,
+                   engine: str = DEFAULT_ENGINE,
+                   jobs: int = 1,
+                   stream: bool = False,
+                   target_root: str = DEFAULT_TARGET_ROOT
+                   ) -> PreparedTarget:
+    """
+    Formats the XML files of a target package, either extracted to
+    `wd/target_root` or in memory, before the source release is known.
+    """
+    if stream:
+        with trace('format'):
+            members = [name for name in sorted(index.files) if name.endswith('.xml')]
+            return PreparedTarget(format_members(index, members, engine, jobs))
+    with trace('extract'):
+        if index.root != target_root:
+            index.zipf.extractall(os.path.join(wd, target_root))
+        else:
+            index.zipf.extractall(wd)
+        Book.count_extracted(index)
+    with trace('format'):
+        ppxml(os.path.join(wd, target_root), engine, jobs)
+    return PreparedTarget()
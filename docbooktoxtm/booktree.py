@@ -0,0 +1,73 @@
+import logging
+from typing import Dict, Iterator, List, Tuple
+
+from lxml import etree
+
+from docbooktoxtm.profiling import count
+from docbooktoxtm.ziputils import ZipIndex
+
+
+class BookTree:
+    """
+    Include graph of a book, resolved from its SG map.
+
+    Each member is parsed at most once, with `iterparse`, keeping only the
+    `href` attributes of the root's children; later lookups of the same member
+    are served from memory. `walk` traverses the graph without recursion and
+    skips any include that would re-enter one of its own ancestors.
+    """
+
+    def __init__(self, index: ZipIndex, source_root: str):
+        self.index = index
+        self.source_root = source_root
+        self.children: Dict[str, Tuple[str, ...]] = {}
+
+    def member(self, fname: str) -> str:
+        return '/'.join((self.source_root, fname))
+
+    def hrefs(self, fname: str) -> Tuple[str, ...]:
+        """
+        `href` attributes of the children of the root element of `fname`, a
+        path relative to the source root, in document order.
+        """
+        hrefs = self.children.get(fname)
+        if hrefs is None:
+            hrefs = []
+            depth = 0
+            count(read=self.index.infos[self.member(fname)].file_size, files=1)
+            with self.index.open(self.member(fname)) as f:
+                for event, element in etree.iterparse(f, events=('start', 'end'), recover=True):
+                    if event == 'start':
+                        depth += 1
+                        if depth == 2 and (href := element.get('href')):
+                            hrefs.append(href)
+                    else:
+                        depth -= 1
+                        element.clear()
+            hrefs = self.children[fname] = tuple(hrefs)
+        return hrefs
+
+    def includes(self, fname: str) -> Tuple[str, ...]:
+        return tuple(href for href in self.hrefs(fname) if self.member(href) in self.index)
+
+    def walk(self, fname: str) -> List[str]:
+        """
+        Every file included from `fname`, directly or not, depth first and in
+        document order. Files included from several places are listed each time.
+        """
+        book_tree = []
+        ancestors = [fname]
+        stack: List[Iterator[str]] = [iter(self.includes(fname))]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                ancestors.pop()
+                continue
+            if child in ancestors:
+                logging.warning(f"Skipping {child}: it includes itself through {' -> '.join(ancestors)}")
+                continue
+            book_tree.append(child)
+            ancestors.append(child)
+            stack.append(iter(self.includes(child)))
+        return book_tree
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+from docbooktoxtm import __version__
+from docbooktoxtm.config import CACHE_DIR, CACHE_MAX_BYTES
+from docbooktoxtm.ziputils import CHUNK_SIZE, atomic_write
+
+STRUCTURES_MAX_ENTRIES = 256
+
+
+def file_digest(fname: str) -> str:
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def place(source: str, dest: str) -> None:
+    """
+    Hard-links `source` to `dest`, falling back to a copy across file systems.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+class CacheEntry(NamedTuple):
+    digest: str
+    size: int
+    etag: Optional[str]
+    atime: float
+
+
+class ReleaseCache:
+    """
+    Content-addressed store of re-rooted release packages.
+
+    Packages are stored once per SHA-256 digest under `blobs/` and looked up by
+    (user, course, tag) through `index.json`, together with the ETag they were
+    served with. Once the blobs exceed `max_bytes`, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = os.path.expanduser(root)
+        self.max_bytes = max_bytes
+        self.blobs = os.path.join(self.root, 'blobs')
+        self.index_fname = os.path.join(self.root, 'index.json')
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def key(user: str, course: str, tag: str) -> str:
+        return f"{user}/{course}@{tag}"
+
+    def blob(self, digest: str) -> str:
+        return os.path.join(self.blobs, f"{digest}.zip")
+
+    def load(self) -> Dict[str, CacheEntry]:
+        try:
+            with open(self.index_fname, 'r') as f:
+                return {key: CacheEntry(**entry) for key, entry in json.load(f).items()}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def save(self, index: Dict[str, CacheEntry]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        with atomic_write(self.index_fname) as f:
+            json.dump({key: entry._asdict() for key, entry in index.items()}, f, indent=1)
+
+    def get(self, user: str, course: str, tag: str) -> Optional[CacheEntry]:
+        key = self.key(user, course, tag)
+        with self.lock:
+            entry = self.load().get(key)
+        if entry is None or not os.path.isfile(self.blob(entry.digest)):
+            logging.debug(f"Cache miss: {key}")
+            return None
+        logging.debug(f"Cache hit: {key} ({entry.digest})")
+        return entry
+
+    def touch(self, user: str, course: str, tag: str) -> None:
+        key = self.key(user, course, tag)
+        with self.lock:
+            index = self.load()
+            if key in index:
+                index[key] = index[key]._replace(atime=time.time())
+                self.save(index)
+
+    def put(self, user: str, course: str, tag: str, fname: str, etag: Optional[str] = None) -> CacheEntry:
+        """
+        Stores a copy of a package and records it under (user, course, tag).
+        :param fname: Package to be stored; it is left in place.
+        :param etag: ETag the package was served with, used to revalidate it later.
+        """
+        digest = file_digest(fname)
+        entry = CacheEntry(digest=digest, size=os.path.getsize(fname), etag=etag, atime=time.time())
+        with self.lock:
+            os.makedirs(self.blobs, exist_ok=True)
+            blob = self.blob(digest)
+            if not os.path.isfile(blob):
+                with open(fname, 'rb') as source, atomic_write(blob, 'wb') as f:
+                    shutil.copyfileobj(source, f, CHUNK_SIZE)
+            index = self.load()
+            index[self.key(user, course, tag)] = entry
+            self.evict(index)
+            self.save(index)
+        logging.debug(f"Cached {fname} as {self.key(user, course, tag)} ({digest})")
+        return entry
+
+    def evict(self, index: Dict[str, CacheEntry]) -> None:
+        sizes = {entry.digest: entry.size for entry in index.values()}
+        total = sum(sizes.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1].atime):
+            if total <= self.max_bytes:
+                break
+            del index[key]
+            if all(other.digest != entry.digest for other in index.values()):
+                total -= entry.size
+                if os.path.isfile(self.blob(entry.digest)):
+                    os.remove(self.blob(entry.digest))
+                logging.debug(f"Evicted {key} ({entry.digest}) from cache")
+
+    def checkout(self, user: str, course: str, tag: str, entry: CacheEntry, dest: str) -> str:
+        # a copy rather than a link, so that nothing written to `dest` can reach the blob
+        if os.path.lexists(dest):
+            os.remove(dest)
+        shutil.copyfile(self.blob(entry.digest), dest)
+        self.touch(user, course, tag)
+        return dest
+
+
+class StructureCache:
+    """
+    Book structures resolved from source releases, stored as one JSON file per
+    source archive digest, course and tool version under `structures/`, so
+    that the DocBook tree of a release is parsed once for all its languages.
+    A new version of the tool never reads the entries of an older one. Past
+    `max_entries`, the least recently written entries are removed.
+    """
+
+    def __init__(self, root: str = CACHE_DIR, max_entries: int = STRUCTURES_MAX_ENTRIES):
+        self.root = os.path.join(os.path.expanduser(root), 'structures')
+        self.max_entries = max_entries
+
+    @staticmethod
+    def key(digest: str, course: str) -> str:
+        return hashlib.sha256(f"{__version__}\0{course}\0{digest}".encode()).hexdigest()
+
+    def fname(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, digest: str, course: str) -> Optional[Dict[str, Any]]:
+        key = self.key(digest, course)
+        try:
+            with open(self.fname(key), 'r', encoding='utf-8') as f:
+                structure = json.load(f)
+        except (OSError, ValueError):
+            logging.debug(f"Structure cache miss: {course} ({digest})")
+            return None
+        logging.debug(f"Structure cache hit: {course} ({digest})")
+        return structure
+
+    def put(self, digest: str, course: str, structure: Dict[str, Any]) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        fname = self.fname(self.key(digest, course))
+        with atomic_write(fname, encoding='utf-8') as f:
+            json.dump(structure, f)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.endswith('.json'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except OSError:
+                        pass
+        for _, fname in sorted(entries)[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+
+class MemoryStructureCache(StructureCache):
+    """
+    A structure cache that lives as long as the object, for runs that build
+    several books of one release without a cache directory.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, digest: str, course: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(self.key(digest, course))
+
+    def put(self, digest: str, course: str, structure: Dict[str, Any]) -> None:
+        self.entries[self.key(digest, course)] = structure
+
+
+def default_cache() -> Optional[ReleaseCache]:
+    return ReleaseCache(CACHE_DIR) if CACHE_DIR else None
+
+
+def release_cache(cache: Union[ReleaseCache, bool, None]) -> Optional[ReleaseCache]:
+    """
+    The release cache a `cache` argument stands for: None is the default cache,
+    built on each call, and False is no cache at all.
+    """
+    if cache is None:
+        return default_cache()
+    return cache or None
+
+
+def default_structures() -> Optional[StructureCache]:
+    return StructureCache() if CACHE_DIR else None
@@ -1,11 +1,23 @@
-import sys
 import os
-from subprocess import Popen, DEVNULL
+from enum import Enum
 
 USE_ENVIRONMENT_VARIABLES = 1
-DEFAULT_CONFIG_FILE = '$HOME/.weconfig/config.sh'
 GITHUB_TOKEN: str = 'GITHUB_TOKEN_PLACEHOLDER'
 
 if USE_ENVIRONMENT_VARIABLES:
-    os.system(f'source {DEFAULT_CONFIG_FILE}')
-    GITHUB_TOKEN = os.environ.get('github_token')
\ No newline at end of file
+    GITHUB_TOKEN = os.environ.get('github_token')
+
+CACHE_DIR: str = os.environ.get('DOCBOOKTOXTM_CACHE_DIR', os.path.join('~', '.cache', 'docbooktoxtm'))
+CACHE_MAX_BYTES: int = int(os.environ.get('DOCBOOKTOXTM_CACHE_MAX_BYTES', 4 * 1024 ** 3))
+RELEASES_TTL: float = float(os.environ.get('DOCBOOKTOXTM_RELEASES_TTL', 600))
+LANGUAGES_FILE: str = os.environ.get(
+    'DOCBOOKTOXTM_LANGUAGES', os.path.join('~', '.config', 'docbooktoxtm', 'languages.json'))
+
+
+class Engine(str, Enum):
+    lxml = 'lxml'
+    xmllint = 'xmllint'
+
+
+ENGINES = tuple(engine.value for engine in Engine)
+DEFAULT_ENGINE = Engine.lxml.value
@@ -0,0 +1,79 @@
+import os
+import sys
+from typing import Dict, Iterable, Iterator, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from docbooktoxtm.bookclasses import BookFile
+
+PathPair = Tuple[str, str]
+
+
+class FileTable:
+    """
+    Source and target paths of the files of a book, in book order.
+
+    Each path is built once, from directory prefixes that are themselves built
+    once per directory and interned, and the table is indexed in both
+    directions. It iterates, compares and indexes like the tuple of
+    (source, target) pairs it replaces.
+    """
+    __slots__ = ('sources', 'targets', 'by_source', 'by_target')
+
+    def __init__(self, pairs: Iterable[PathPair] = ()):
+        sources = []
+        targets = []
+        for source, target in pairs:
+            sources.append(source)
+            targets.append(target)
+        self.sources: Tuple[str, ...] = tuple(sources)
+        self.targets: Tuple[str, ...] = tuple(targets)
+        self.by_source: Dict[str, str] = dict(zip(self.sources, self.targets))
+        self.by_target: Dict[str, str] = dict(zip(self.targets, self.sources))
+
+    @classmethod
+    def from_files(cls, files: Iterable['BookFile'], source_root: str, target_root: str) -> 'FileTable':
+        """
+        Builds the table of `BookFile`s, joining the source and target
+        directories of each chapter and folder only once.
+        """
+        source_dirs: Dict[str, str] = {}
+        target_dirs: Dict[Tuple[str, str], str] = {}
+        pairs = []
+        for file in files:
+            source_dir = source_dirs.get(file.path)
+            if source_dir is None:
+                source_dir = source_dirs[file.path] = sys.intern(file.source_dir(source_root))
+            target_dir = target_dirs.get((file.chapter, file.path))
+            if target_dir is None:
+                target_dir = target_dirs[(file.chapter, file.path)] = sys.intern(file.target_dir(target_root))
+            pairs.append((os.path.join(source_dir, file.name), os.path.join(target_dir, f"{file.count}-{file.name}")))
+        return cls(pairs)
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def __iter__(self) -> Iterator[PathPair]:
+        return zip(self.sources, self.targets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(zip(self.sources[i], self.targets[i]))
+        return self.sources[i], self.targets[i]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, FileTable):
+            return self.sources == other.sources and self.targets == other.targets
+        if isinstance(other, (tuple, list)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"FileTable({len(self)} files)"
+
+    def target(self, source: str) -> Optional[str]:
+        return self.by_source.get(source)
+
+    def source(self, target: str) -> Optional[str]:
+        return self.by_target.get(target)
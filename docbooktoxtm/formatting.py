@@ -0,0 +1,129 @@
+import logging
+import os
+import re
+import tempfile
+from os import PathLike
+from subprocess import Popen, DEVNULL
+from typing import Optional, Tuple
+
+from lxml import etree
+
+from docbooktoxtm.config import DEFAULT_ENGINE, ENGINES, Engine
+
+XML_DECLARATION = re.compile(rb'^\s*<\?xml[^>]*?encoding', re.S)
+DOCTYPE = re.compile(rb'<!DOCTYPE[^\[>]*(\[.*?\]\s*)?>', re.S)
+
+
+def format_xml(data: bytes) -> bytes:
+    """
+    Pretty-prints an XML document in memory, mirroring `xmllint --format --recover`.
+    Parser errors (e.g. entities that are not defined without the DocBook DTD) are
+    never written into the output, so there is no noise to strip afterwards.
+    :param data: Raw XML document.
+    :return: Formatted document, or the original bytes if nothing could be recovered.
+    """
+    parser = etree.XMLParser(recover=True, remove_blank_text=True, resolve_entities=False)
+    try:
+        root = etree.fromstring(data, parser)
+    except etree.XMLSyntaxError:
+        root = None
+    if root is None:
+        return data
+    for error in parser.error_log:
+        logging.debug(f"xml parser: {error.line}:{error.column}: {error.message}")
+    tree = root.getroottree()
+    docinfo = tree.docinfo
+    encoding = docinfo.encoding or 'UTF-8'
+    body = etree.tostring(tree, pretty_print=True, encoding=encoding, xml_declaration=False)
+    if docinfo.doctype and b'<!DOCTYPE' not in body.split(b'<' + root.tag.encode(), 1)[0]:
+        doctype = DOCTYPE.search(data)
+        if doctype:
+            body = doctype.group(0) + b'\n' + body
+    if XML_DECLARATION.match(data):
+        declaration = f'<?xml version="{docinfo.xml_version}" encoding="{encoding}"?>\n'
+    else:
+        declaration = f'<?xml version="{docinfo.xml_version}"?>\n'
+    return declaration.encode() + body
+
+
+def lxml_file(file: PathLike) -> None:
+    with open(file, 'rb') as f:
+        data = f.read()
+    formatted = format_xml(data)
+    if formatted != data:
+        with open(file, 'wb') as f:
+            f.write(formatted)
+
+
+def xmllint_file(file: PathLike) -> None:
+    cmd1 = f'mv "{file}" "{file}.bak" 2>&1'
+    cmd2 = f'xmllint --format --recover "{file}.bak" > "{file}" 2>&1'
+    cmd3 = f'rm -f "{file}.bak" 2>&1'
+    pattern = r'/^\..*\.xml\.bak.*parser error.*not defined$/,+2d'
+    cmd4 = f'sed "{pattern}" -i {file}'
+    final = Popen(f"{cmd1}; {cmd2}; {cmd3}; {cmd4}", shell=True, stdin=DEVNULL,
+                  stdout=DEVNULL, stderr=DEVNULL, close_fds=True)
+    final.communicate()
+
+
+FORMATTERS = {
+    'lxml': lxml_file,
+    'xmllint': xmllint_file,
+}
+
+
+def format_file(file: PathLike, engine: str = DEFAULT_ENGINE) -> None:
+    """
+    Pretty-prints a single file in place.
+    :param file: Path to the file to be formatted.
+    :param engine: 'lxml' (in-process) or 'xmllint' (legacy shell pipeline).
+    """
+    if engine not in FORMATTERS:
+        raise ValueError(f"Unknown formatting engine '{engine}'. Choose from: {', '.join(ENGINES)}.")
+    FORMATTERS[engine](file)
+
+
+def format_bytes(data: bytes, engine: str = DEFAULT_ENGINE) -> bytes:
+    """
+    Pretty-prints a document held in memory. Engines other than lxml need
+    a file on disk, so the document goes through a temporary file for them.
+    """
+    if engine == Engine.lxml.value:
+        return format_xml(data)
+    fd, file = tempfile.mkstemp(suffix='.xml')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        format_file(file, engine)
+        with open(file, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(file)
+
+
+def format_bytes_safely(args: Tuple[str, bytes, str]) -> Tuple[str, bytes, Optional[str]]:
+    """
+    In-memory counterpart of `format_file_safely`.
+    :param args: (name, data, engine) triple.
+    :return: (name, formatted data or the original data on failure, error message or None).
+    """
+    name, data, engine = args
+    try:
+        return name, format_bytes(data, engine), None
+    except Exception as e:
+        return name, data, f"{type(e).__name__}: {e}"
+
+
+def format_file_safely(args: Tuple[str, str]) -> Tuple[str, Optional[str]]:
+    """
+    Process pool entry point: formats one file and reports failure instead of raising,
+    so that a single bad file does not abort the rest of the batch.
+    :param args: (file, engine) pair.
+    :return: (file, error message or None).
+    """
+    file, engine = args
+    try:
+        format_file(file, engine)
+    except Exception as e:
+        return file, f"{type(e).__name__}: {e}"
+    return file, None
@@ -1,79 +1,125 @@
 #!/usr/bin/env python3
 
+import logging
 import os
-import shutil
 import zipfile
+from typing import Optional, Tuple, Union
 
 import requests
-from github import Github
 
+from docbooktoxtm.cache import ReleaseCache, release_cache
 from docbooktoxtm.config import GITHUB_TOKEN
+from docbooktoxtm.profiling import count, trace
+from docbooktoxtm.releases import ReleaseClient
+from docbooktoxtm.ziputils import CHUNK_SIZE, atomic_write, atomic_zip, copy_member
 
-HEADERS: dict = {'Authorization': f"token {GITHUB_TOKEN}"}
 DEFAULT_TARGET = 'en-US'
 DEFAULT_TARGET_DIR = os.path.join('.', DEFAULT_TARGET)
+DEFAULT_BRANCH = 'master'
 
 
-def zipdir(path: str,
-           f_zip: zipfile.ZipFile
-           ) -> None:
-    for root, _, files in os.walk(path):
-        for file in files:
-            f_zip.write(os.path.join(root, file))
+def fetch(url: str,
+          fname: str,
+          etag: Optional[str] = None,
+          session: Optional[requests.Session] = None
+          ) -> Tuple[bool, Optional[str]]:
+    """
+    Downloads `url` to `fname`, unless the server confirms that the copy
+    identified by `etag` is still current.
+    :return: Whether `fname` was written, and the ETag of the current copy.
+    """
+    headers = {'If-None-Match': etag} if etag else {}
+    with (session or requests).get(url, headers=headers, stream=True) as zipball:
+        if zipball.status_code == 304:
+            logging.debug(f"Not modified: {url}")
+            return False, etag
+        zipball.raise_for_status()
+        with atomic_write(fname, 'wb') as f_zip:
+            for chunk in zipball.iter_content(chunk_size=CHUNK_SIZE):
+                f_zip.write(chunk)
+                count(read=len(chunk))
+        return True, zipball.headers.get('ETag')
+
+
+def reroot(download: str, fname: str) -> None:
+    """
+    Writes the members of a GitHub zipball to `fname` under `{fname stem}/`
+    instead of GitHub's `owner-repo-sha/` folder. Members are copied still
+    compressed, one at a time, without extracting anything.
+    """
+    new_dir = os.path.basename(fname).rsplit('.', 1)[0]
+    with zipfile.ZipFile(download, 'r') as bad_zip, atomic_zip(fname) as f_zip:
+        bad_dir = bad_zip.namelist()[0].split('/')[0]
+        for info in bad_zip.infolist():
+            if info.is_dir():
+                continue
+            copy_member(bad_zip, info, f_zip, '/'.join((new_dir, info.filename.split('/', 1)[1])))
+    logging.debug(f"Re-rooted {bad_dir}/ as {new_dir}/ in {fname}")
+
+
+def download_release(url: str,
+                     course: str,
+                     tag: str,
+                     user: str = 'RedHatTraining',
+                     cache: Optional[ReleaseCache] = None,
+                     session: Optional[requests.Session] = None,
+                     wd: Optional[str] = None
+                     ) -> str:
+    """
+    Downloads a release zipball and re-roots it as `{course}-{tag}/`. A cached
+    copy is revalidated with If-None-Match and reused when the server answers
+    304 Not Modified, which also skips the re-rooting.
+    :param wd: Directory the package is written to instead of the current one.
+    :return: Name of the package, within `wd` if given.
+    """
+    fname = os.path.join(wd, f"{course}-{tag}.zip") if wd else f"{course}-{tag}.zip"
+    download = f"{fname}.download"
+    entry = cache.get(user, course, tag) if cache else None
+    updated, etag = fetch(url, download, entry.etag if entry else None, session)
+    if not updated:
+        return cache.checkout(user, course, tag, entry, fname)
+    try:
+        reroot(download, fname)
+    finally:
+        os.remove(download)
+    if cache:
+        cache.put(user, course, tag, fname, etag)
+    return fname
 
 
 def get_zip(course: str,
             release_tag: str = None,
             user: str = 'RedHatTraining',
-            token: str = GITHUB_TOKEN
+            token: str = GITHUB_TOKEN,
+            cache: Union[ReleaseCache, bool, None] = None,
+            client: Optional[ReleaseClient] = None,
+            wd: Optional[str] = None
             ) -> str:
-    g = Github(token)
-    repo = g.get_user(user).get_repo(course)
-    release = None
-    releases = [
-        release
-        for release in repo.get_releases()
-        if (
-                release_tag in release.target_commitish
-                or
-                release_tag in release.tag_name
-        )
-    ] if release_tag else list(repo.get_releases())
-    if len(releases) == 1:
-        release = releases[0]
-    elif len(releases) > 1:
-        release = sorted(
-            releases,
-            key=lambda x: x.published_at,
-            reverse=True
-        )[0]
-    if release and release_tag is None:
-        latest_release = repo.get_latest_release()
-        if latest_release != release:
-            release_tags = {release.tag_name.split('-')[-4] for release in [release, latest_release]}
-            if len(release_tags) > 1:
-                release = sorted(
-                    [release, latest_release],
-                    key=lambda x: x.tag_name.split('-')[-4],
-                    reverse=True
-                )[0]
-            else:
-                release = sorted(
-                    [release, latest_release],
-                    key=lambda x: x.published_at,
-                    reverse=True
-                )[0]
-    url = release.zipball_url if release else f'https://api.github.com/repos/{user}/{course}/zipball/master'
-    zipball = requests.get(url, headers=HEADERS, stream=True)
-    fname = f"{course}-{release.tag_name}.zip" if release else f"{course}-master.zip"
-    with open(fname, 'wb') as f_zip:
-        f_zip.write(zipball.content)
-    with zipfile.ZipFile(fname, 'r') as bad_zip:
-        bad_dir = bad_zip.namelist()[0].split('/')[0]
-        bad_zip.extractall()
-    os.remove(fname)
-    shutil.move(bad_dir, fname.rsplit('.', 1)[0])
-    with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as f_zip:
-        zipdir(fname.rsplit('.', 1)[0], f_zip)
-    shutil.rmtree(fname.rsplit('.', 1)[0])
-    return fname
+    """
+    Downloads a course release from GitHub as `{course}-{tag}.zip`.
+    :param release_tag: Full release tag, or part of a tag name or target branch.
+     Default is None and will result in the most recent release of the highest
+     version number.
+    :param cache: Release cache; by default the one in CACHE_DIR, False always downloads.
+    :param client: GitHub client to reuse, e.g. across a batch of courses.
+    :param wd: Directory the package is written to instead of the current one.
+    :return: Name of the package, within `wd` if given.
+    """
+    cache = release_cache(cache)
+    with trace('download'):
+        # release tags are immutable: a package cached under the exact tag needs no network at all; the
+        # default branch moves, so its snapshot is always revalidated with its ETag by download_release
+        exact = cache and release_tag and release_tag != DEFAULT_BRANCH
+        entry = cache.get(user, course, release_tag) if exact else None
+        if entry:
+            fname = f"{course}-{release_tag}.zip"
+            fname = cache.checkout(user, course, release_tag, entry, os.path.join(wd, fname) if wd else fname)
+        else:
+            client = client or ReleaseClient(token, cache_dir=cache.root if cache else None)
+            release = client.resolve(user, course, release_tag)
+            url = release.zipball_url if release else f"{client.repo_url(user, course)}/zipball/{DEFAULT_BRANCH}"
+            tag = release.tag_name if release else DEFAULT_BRANCH
+            fname = download_release(url, course, tag, user, cache, client.session, wd)
+            logging.debug(f"{client.requests} GitHub request(s) so far; {course} resolved to {tag}")
+        count(written=os.path.getsize(fname), files=1)
+        return fname
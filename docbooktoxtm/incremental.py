@@ -0,0 +1,107 @@
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from docbooktoxtm.ziputils import atomic_write
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+class ManifestEntry(NamedTuple):
+    digest: str
+    target: str
+
+
+class Delta(NamedTuple):
+    added: Tuple[str, ...]
+    changed: Tuple[str, ...]
+    moved: Tuple[Tuple[str, str], ...]
+    removed: Tuple[str, ...]
+    unchanged: int
+
+    @property
+    def emitted(self) -> Tuple[str, ...]:
+        """
+        Target members that have to be uploaded again.
+        """
+        return self.added + self.changed + tuple(new for _, new in self.moved)
+
+    def report(self, previous: Optional[str], current: str) -> dict:
+        return {
+            'previous': previous,
+            'current': current,
+            'added': list(self.added),
+            'changed': list(self.changed),
+            'moved': [{'from': old, 'to': new} for old, new in self.moved],
+            'removed': list(self.removed),
+            'unchanged': self.unchanged,
+        }
+
+
+class Manifest(NamedTuple):
+    """
+    Source path -> (content digest, target path) of every file of an unsourced
+    book, as written by the previous run for the same course.
+
+    Source paths are relative to the release folder, so that manifests of
+    different releases line up, and digests are the CRC-32 and size recorded
+    in the .ZIP central directory, so that no member needs to be read.
+    """
+    release: str
+    files: Dict[str, ManifestEntry]
+
+    @classmethod
+    def load(cls, fname: str) -> Optional['Manifest']:
+        try:
+            with open(fname, 'r') as f:
+                manifest = json.load(f)
+            return cls(manifest['release'], {
+                source: ManifestEntry(**entry) for source, entry in manifest['files'].items()
+            })
+        except FileNotFoundError:
+            return None
+
+    def save(self, fname: str) -> None:
+        with atomic_write(fname) as f:
+            json.dump({'release': self.release, 'files': {
+                source: entry._asdict() for source, entry in sorted(self.files.items())
+            }}, f, indent=1)
+
+    def diff(self, previous: Optional['Manifest']) -> Delta:
+        old = previous.files if previous else {}
+        added: List[str] = []
+        changed: List[str] = []
+        moved: List[Tuple[str, str]] = []
+        unchanged = 0
+        for source, entry in self.files.items():
+            before = old.get(source)
+            if before is None:
+                added.append(entry.target)
+            elif before.digest != entry.digest:
+                changed.append(entry.target)
+            elif before.target != entry.target:
+                moved.append((before.target, entry.target))
+            else:
+                unchanged += 1
+        targets = {entry.target for entry in self.files.values()}
+        removed = {entry.target for entry in old.values()} - targets
+        return Delta(tuple(sorted(added)), tuple(sorted(changed)), tuple(sorted(moved)),
+                     tuple(sorted(removed)), unchanged)
+
+
+def digest(crc: int, size: int) -> str:
+    return f"{crc:08x}:{size}"
+
+
+def manifest_path(directory: str, course: str) -> str:
+    return os.path.join(directory, f"{course}{MANIFEST_SUFFIX}")
+
+
+def write_report(delta: Delta, delta_fname: str, previous: Optional[Manifest], manifest: Manifest) -> str:
+    """
+    Writes the delta next to its package as `{package stem}.json`.
+    """
+    fname = f"{delta_fname.rsplit('.', 1)[0]}.json"
+    with open(fname, 'w') as f:
+        json.dump(delta.report(previous.release if previous else None, manifest.release), f, indent=2)
+    return fname
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from fuzzywuzzy import fuzz, process
+
+from docbooktoxtm.config import LANGUAGES_FILE
+
+SUBTITLE_INDEX = {
+    'Teilnehmerarbeitsbuch': 'de-DE',
+    'Manuel d\'exercices': 'fr-FR',
+    '受講生用のワークブック': 'ja-JP',
+    '受講生用ワークブック': 'ja-JP',
+    '수강생 워크북': 'ko-KR',
+    'Livro do aluno': 'pt-BR',
+    'Рабочая тетрадь': 'ru-RU',
+    '学员练习册': 'zh-CN',
+    'Libro de trabajo del estudiante': 'es-ES',
+    'छात्र-छात्रा की वर्कबुक': 'hi-IN',
+    'Student Workbook': 'en-US'
+}
+FUZZY_CACHE_SIZE = 4096
+
+
+def normalize(subtitle: str) -> str:
+    """
+    Folds case, Unicode compatibility forms, typographic apostrophes and runs
+    of whitespace, so that trivially different subtitles compare equal.
+    """
+    subtitle = unicodedata.normalize('NFKC', subtitle).replace('’', "'").replace('‘', "'")
+    return ' '.join(subtitle.casefold().split())
+
+
+class LanguageDetector:
+    """
+    Maps a book subtitle to its locale. Exact and normalized subtitles are
+    looked up in dictionaries built once; anything else falls back to the
+    closest subtitle by `fuzz.ratio`, as before, and the answer is memoized.
+    """
+
+    def __init__(self, index: Dict[str, str]):
+        self.index = dict(index)
+        self.normalized = {normalize(subtitle): locale for subtitle, locale in self.index.items()}
+        self.subtitles = list(self.index)
+        self.locales: Tuple[str, ...] = tuple(dict.fromkeys(self.index.values()))
+        self.closest = lru_cache(maxsize=FUZZY_CACHE_SIZE)(self._closest)
+
+    @classmethod
+    def from_file(cls, fname: Optional[str], index: Dict[str, str] = SUBTITLE_INDEX) -> 'LanguageDetector':
+        """
+        Adds the subtitle -> locale mappings of a JSON object in `fname`, if it
+        exists, to `index`; its entries win over the built-in ones.
+        """
+        extra = load_languages(fname) if fname else {}
+        return cls({**index, **extra})
+
+    def _closest(self, subtitle: str) -> str:
+        return self.index[process.extractOne(subtitle, self.subtitles, scorer=fuzz.ratio)[0]]
+
+    def detect(self, subtitle: str) -> str:
+        locale = self.index.get(subtitle) or self.normalized.get(normalize(subtitle))
+        return locale if locale is not None else self.closest(subtitle)
+
+
+def load_languages(fname: str) -> Dict[str, str]:
+    fname = os.path.expanduser(fname)
+    try:
+        with open(fname, 'r', encoding='utf-8') as f:
+            languages = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        raise ValueError(f"Could not read {fname}: {e}") from e
+    if not isinstance(languages, dict) or not all(
+            isinstance(subtitle, str) and isinstance(locale, str) for subtitle, locale in languages.items()):
+        raise ValueError(f"{fname} must hold a JSON object mapping subtitles to locales.")
+    logging.debug(f"{len(languages)} subtitle(s) loaded from {fname}")
+    return languages
+
+
+@lru_cache(maxsize=None)
+def default_detector() -> LanguageDetector:
+    return LanguageDetector.from_file(LANGUAGES_FILE)
@@ -0,0 +1,66 @@
+import logging
+import os
+import sys
+from typing import NamedTuple, Optional
+
+MB = 1024 ** 2
+
+
+class LimitExceeded(RuntimeError):
+    """
+    Raised when a run would go, or has gone, over the memory or scratch disk
+    allowed to it, before the operating system runs out of either.
+    """
+
+
+def current_rss() -> Optional[int]:
+    """
+    Resident set size of this process in bytes, or its peak where the
+    current value is not available, or None.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Limits(NamedTuple):
+    """
+    Caps on the resident memory of the process and on the scratch disk a run
+    writes (extracted files and the output package), in bytes; None for none.
+    """
+    max_rss: Optional[int] = None
+    max_scratch: Optional[int] = None
+
+    @classmethod
+    def from_mb(cls, max_rss: Optional[int] = None, max_scratch: Optional[int] = None) -> 'Limits':
+        return cls(max_rss * MB if max_rss else None, max_scratch * MB if max_scratch else None)
+
+    def check_rss(self, needed: int = 0, what: str = 'this run') -> None:
+        """
+        Fails if the process uses, or would use with `needed` more bytes, more than `max_rss`.
+        """
+        if self.max_rss is None:
+            return
+        rss = current_rss()
+        if rss is None:
+            logging.warning(f"Cannot measure memory use on {sys.platform}: the memory limit is not enforced")
+            return
+        if rss + needed > self.max_rss:
+            raise LimitExceeded(f"Memory limit of {self.max_rss / MB:.0f} MB exceeded: {what} needs "
+                                f"{(rss + needed) / MB:.0f} MB ({rss / MB:.0f} MB in use)")
+
+    def check_scratch(self, used: int, what: str = 'this run') -> None:
+        """
+        Fails if `used` bytes of scratch disk are more than `max_scratch`.
+        """
+        if self.max_scratch is not None and used > self.max_scratch:
+            raise LimitExceeded(f"Scratch disk limit of {self.max_scratch / MB:.0f} MB exceeded: {what} needs "
+                                f"{used / MB:.0f} MB")
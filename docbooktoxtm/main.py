@@ -1,17 +1,33 @@
-from typing import Optional
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TYPE_CHECKING
 import os
 import sys
 import typer
 import logging
 
-from docbooktoxtm.bookclasses import BookInfo, Book
-from docbooktoxtm.functions import get_zip
+# lxml, pydantic, fuzzywuzzy and requests are imported by the commands that use
+# them, so that `--help`, completion and argument errors stay fast
+from docbooktoxtm.config import Engine
+
+if TYPE_CHECKING:
+    from docbooktoxtm.batch import BatchResult
+    from docbooktoxtm.bookclasses import Book
+
+SUMMARY_FNAME = 'batch-summary.json'
+LOG_HANDLER = 'docbooktoxtm'
 
 app = typer.Typer(help='Utility for prepping DocBook XML packages for use as XTM source files.')
 
 def configure_log(wd: str) -> None:
+    """
+    Logs to stderr and to `wd/events.log`. Calling it again replaces the
+    handlers of the previous call instead of adding more.
+    """
     logfile = os.path.join(wd, 'events.log')
     log = logging.getLogger('')
+    for handler in [handler for handler in log.handlers if handler.get_name() == LOG_HANDLER]:
+        log.removeHandler(handler)
+        handler.close()
     log.setLevel(logging.DEBUG)
     log_format = "%(asctime)s [%(levelname)s] : %(message)s"
     date_format = "%a %d %b %Y %H:%M:%S"
@@ -19,25 +35,154 @@ def configure_log(wd: str) -> None:
     ch = logging.StreamHandler(sys.stderr)
     ch.setFormatter(formatter)
     ch.setLevel(logging.WARNING)
-    log.addHandler(ch)
     fh = logging.FileHandler(logfile)
     fh.setFormatter(formatter)
-    log.addHandler(fh)
+    for handler in (ch, fh):
+        handler.set_name(LOG_HANDLER)
+        log.addHandler(handler)
+
+
+@contextmanager
+def limits_reported() -> Iterator[None]:
+    """
+    Turns a run stopped by --max-rss or --max-scratch into an error message and exit status 2.
+    """
+    from docbooktoxtm.limits import LimitExceeded
+
+    try:
+        yield
+    except LimitExceeded as e:
+        logging.error(str(e))
+        raise typer.Exit(2)
+
 
 @app.command(help='Restructures source file structure for more efficient parsing in XTM.')
-def resource(target_fname: str = typer.Argument(..., help='name of target .zip package')) -> None:
+def resource(target_fnames: List[str] = typer.Argument(
+                 ..., help='names of target .zip packages; several must be exports of the same release'
+             ),
+             engine: Engine = typer.Option(
+                 Engine.lxml, '-e', '--engine', help='XML formatting engine'
+             ),
+             jobs: int = typer.Option(
+                 1, '-j', '--jobs', min=0, help='number of processes formatting target files (0: one per CPU)'
+             ),
+             stream: bool = typer.Option(
+                 False, '-s', '--stream', help='rewrite packages zip-to-zip without extracting them'
+             ),
+             level: Optional[int] = typer.Option(
+                 None, '-l', '--level', min=0, max=9, help='deflate level of the output package (0: store only)'
+             ),
+             zip_jobs: int = typer.Option(
+                 0, '-z', '--zip-jobs', min=0, help='number of threads compressing output members (0: one per CPU)'
+             ),
+             low_memory: bool = typer.Option(
+                 False, '--low-memory', help='stream members one at a time, formatting each just before it is written'
+             ),
+             max_rss: Optional[int] = typer.Option(
+                 None, '--max-rss', min=1, envvar='DOCBOOKTOXTM_MAX_RSS', help='fail before memory use exceeds this many MB'
+             ),
+             max_scratch: Optional[int] = typer.Option(
+                 None, '--max-scratch', min=1, envvar='DOCBOOKTOXTM_MAX_SCRATCH',
+                 help='fail before the files written exceed this many MB of disk'
+             ),
+             no_cache: bool = typer.Option(
+                 False, '--no-cache', help='always download the source release from GitHub and parse it again'
+             ),
+             overlap: bool = typer.Option(
+                 False, '--overlap', help='extract and format the target while the source release downloads'
+             ),
+             workers: int = typer.Option(
+                 4, '-w', '--workers', min=1, help='number of target packages resourced at once'
+             ),
+             profile: bool = typer.Option(
+                 False, '--profile', help='write per-stage timings to profile.json next to events.log'
+             ),
+             cprofile: bool = typer.Option(
+                 False, '--cprofile', help='also dump a cProfile of the slowest stage (implies --profile)'
+             ),
+             ) -> None:
     """
     This function restores the XML source files to their original structure, as
     well as restores any files that had been removed from scope during prep.
-    :param target_fname: Name of target .ZIP package. This file will
-     be processed in current working directory.
-    :return target_file: Name of target restructured .ZIP package.
+    :param target_fnames: Names of target .ZIP packages. These files will
+     be processed in current working directory. Several packages must be
+     exports of the same release in different languages: the source release
+     is then downloaded and resolved once, each language is resourced from it
+     in stream mode, and one package is written per language.
+    :param engine: XML formatting engine used on the target files. 'lxml' formats
+     in-process; 'xmllint' keeps the legacy shell pipeline for comparison.
+    :param jobs: Number of worker processes used to format target files. Files
+     that fail to format are reported in events.log and left as exported.
+    :param stream: Copy members straight from the input packages into the output
+     package instead of extracting them to the working directory.
+    :param level: Deflate level, 1 (fastest) to 9 (smallest), of the members
+     written to the output package; 0 stores them. Images and other formats that
+     are compressed already are always stored. Members copied as they are in
+     stream mode keep their compression.
+    :param zip_jobs: Number of threads compressing output members. Only the
+     writes to the package are serialized.
+    :param low_memory: Implies `stream`. Target files are formatted one at a
+     time as they are written instead of all before, and members are written
+     by a single thread, so that memory use does not grow with the package.
+    :param max_rss: Memory limit in MB. The run fails with a clear error when
+     the process, with the next member, would use more. DOCBOOKTOXTM_MAX_RSS
+     sets a default.
+    :param max_scratch: Limit in MB on the disk the run writes: the extracted
+     files and the output package. DOCBOOKTOXTM_MAX_SCRATCH sets a default.
+    :param no_cache: Bypass the local release and structure caches.
+    :param overlap: Download the source release and extract and format the
+     target files at the same time, then report how much time that saved.
+     Only for a single target package.
+    :param workers: Number of target packages resourced concurrently when
+     several are given.
+    :param profile: Record wall and CPU time, bytes read and written and file
+     counts for each stage (download, parse, match, extract, format, compress)
+     in profile.json. Setting DOCBOOKTOXTM_TRACE=1 has the same effect.
+    :param cprofile: Also profile the stages with cProfile and keep the dump of
+     the slowest one as profile-<stage>.prof (DOCBOOKTOXTM_TRACE=cprofile).
+    :return target_file: Name of target restructured .ZIP package, one per
+     language.
     """
+    from docbooktoxtm.bookclasses import BookInfo, Book
+    from docbooktoxtm.cache import default_cache, default_structures
+    from docbooktoxtm.functions import get_zip
+    from docbooktoxtm.limits import Limits
+    from docbooktoxtm.ziputils import ZipIndex
+
+    from docbooktoxtm.profiling import trace_mode, tracing
+
+    if overlap and low_memory:
+        raise typer.BadParameter('--overlap formats every target file ahead of time; it cannot be used with '
+                                 '--low-memory')
+    if overlap and len(target_fnames) > 1:
+        raise typer.BadParameter('--overlap works on a single target package')
     configure_log(os.getcwd())
-    bi = BookInfo.from_zipf(target_fname)
-    source_fname = get_zip(bi.course, bi.release_tag)
-    book = Book(source_fname, target_fname)
-    resourced_fname = book()
+    options = dict(engine=engine.value, jobs=jobs, level=level, zip_jobs=zip_jobs,
+                   low_memory=low_memory, limits=Limits.from_mb(max_rss, max_scratch),
+                   structures=None if no_cache else default_structures())
+    cache = False if no_cache else default_cache()
+    if len(target_fnames) > 1:
+        from docbooktoxtm.pipeline import resource_targets
+
+        with limits_reported(), tracing(os.getcwd(), 'resource', trace_mode(profile, cprofile)):
+            resourced_fnames = resource_targets(target_fnames, cache=cache, workers=workers, **options)
+        typer.echo(f"Target file structure restored successfully for {len(resourced_fnames)} languages!")
+        for resourced_fname in resourced_fnames:
+            typer.echo(f"Resourced file name: {resourced_fname}")
+        return
+    options['stream'] = stream
+    with limits_reported(), tracing(os.getcwd(), 'resource', trace_mode(profile, cprofile)), \
+            ZipIndex(target_fnames[0]) as target_index:
+        if overlap:
+            from docbooktoxtm.pipeline import resource_overlapped
+
+            resourced_fname, timings = resource_overlapped(target_index, cache=cache, **options)
+            typer.echo(timings.report())
+        else:
+            bi = BookInfo.from_zipf(target_index)
+            source_fname = get_zip(bi.course, bi.release_tag, cache=cache)
+            book = Book(source_fname, target_index, **options)
+            resourced_fname = book()
     typer.echo("Target file structure restored successfully!")
     typer.echo(f"Resourced file name: {resourced_fname}")
 
@@ -47,6 +192,40 @@ def unsource(course: str = typer.Argument(..., help='course name or name of sour
              release_tag: Optional[str] = typer.Option(
                  None, '-r', '--release-tag', help='optional GitHub release tag'
              ),
+             stream: bool = typer.Option(
+                 False, '-s', '--stream', help='rewrite packages zip-to-zip without extracting them'
+             ),
+             level: Optional[int] = typer.Option(
+                 None, '-l', '--level', min=0, max=9, help='deflate level of the output package (0: store only)'
+             ),
+             zip_jobs: int = typer.Option(
+                 0, '-z', '--zip-jobs', min=0, help='number of threads compressing output members (0: one per CPU)'
+             ),
+             low_memory: bool = typer.Option(
+                 False, '--low-memory', help='stream members one at a time, formatting each just before it is written'
+             ),
+             max_rss: Optional[int] = typer.Option(
+                 None, '--max-rss', min=1, envvar='DOCBOOKTOXTM_MAX_RSS', help='fail before memory use exceeds this many MB'
+             ),
+             max_scratch: Optional[int] = typer.Option(
+                 None, '--max-scratch', min=1, envvar='DOCBOOKTOXTM_MAX_SCRATCH',
+                 help='fail before the files written exceed this many MB of disk'
+             ),
+             no_cache: bool = typer.Option(
+                 False, '--no-cache', help='always download the source release from GitHub and parse it again'
+             ),
+             incremental: bool = typer.Option(
+                 False, '-i', '--incremental', help='package only the files changed since the previous run'
+             ),
+             manifest_dir: str = typer.Option(
+                 '.', '--manifest-dir', help='directory keeping the manifest of the previous run'
+             ),
+             profile: bool = typer.Option(
+                 False, '--profile', help='write per-stage timings to profile.json next to events.log'
+             ),
+             cprofile: bool = typer.Option(
+                 False, '--cprofile', help='also dump a cProfile of the slowest stage (implies --profile)'
+             ),
              ) -> None:
     """
     This function reorganizes the XML source files so that XTM will parse them
@@ -54,16 +233,252 @@ def unsource(course: str = typer.Argument(..., help='course name or name of sour
     :param course: Course number to be prepped, e.g. RH124, CL310, DO180.
     :param release_tag: Indicates a specific release to download. Default is
     None and will result in the most recent release of the highest version number.
+    :param stream: Copy members straight from the source package into the output
+     package instead of extracting them to the working directory.
+    :param level: Deflate level, 1 (fastest) to 9 (smallest), of the members
+     written to the output package; 0 stores them. Images and other formats that
+     are compressed already are always stored. Members copied as they are in
+     stream mode keep their compression.
+    :param zip_jobs: Number of threads compressing output members. Only the
+     writes to the package are serialized.
+    :param low_memory: Implies `stream`. Target files are formatted one at a
+     time as they are written instead of all before, and members are written
+     by a single thread, so that memory use does not grow with the package.
+    :param max_rss: Memory limit in MB. The run fails with a clear error when
+     the process, with the next member, would use more. DOCBOOKTOXTM_MAX_RSS
+     sets a default.
+    :param max_scratch: Limit in MB on the disk the run writes: the extracted
+     files and the output package. DOCBOOKTOXTM_MAX_SCRATCH sets a default.
+    :param no_cache: Bypass the local release and structure caches.
+    :param incremental: Compare the book with the manifest of the previous run
+     and write a delta package holding only new, changed and moved files, with a
+     JSON report that also lists the target files that were removed. Members are
+     always copied zip-to-zip, so --stream, --level and --low-memory do not apply.
+    :param manifest_dir: Directory of `{course}.manifest.json`, which is read
+     and then replaced by an incremental run.
+    :param profile: Record wall and CPU time, bytes read and written and file
+     counts for each stage (download, parse, match, extract, format, compress)
+     in profile.json. Setting DOCBOOKTOXTM_TRACE=1 has the same effect.
+    :param cprofile: Also profile the stages with cProfile and keep the dump of
+     the slowest one as profile-<stage>.prof (DOCBOOKTOXTM_TRACE=cprofile).
     :return zip_filename: Name of restructured .ZIP package that is
     ready to be uploaded to XTM for analysis.
     """
+    from docbooktoxtm.bookclasses import Book
+    from docbooktoxtm.cache import default_cache, default_structures
+    from docbooktoxtm.functions import get_zip
+    from docbooktoxtm.limits import Limits
+
+    from docbooktoxtm.profiling import trace_mode, tracing
+
+    if incremental and (stream or level is not None or low_memory):
+        raise typer.BadParameter('--incremental always copies the changed members zip-to-zip; it cannot be used '
+                                 'with --stream, --level or --low-memory')
     configure_log(os.getcwd())
-    source_fname = course if os.path.isfile(course) else get_zip(course, release_tag)
-    book = Book(source_fname)
-    unsourced_fname = book()
+    cache = False if no_cache else default_cache()
+    with limits_reported(), tracing(os.getcwd(), 'unsource', trace_mode(profile, cprofile)):
+        source_fname = course if os.path.isfile(course) else get_zip(course, release_tag, cache=cache)
+        book = Book(source_fname, stream=stream or incremental, level=level, zip_jobs=zip_jobs, low_memory=low_memory,
+                    limits=Limits.from_mb(max_rss, max_scratch),
+                    structures=None if no_cache else default_structures())
+        if incremental:
+            unsource_incremental(book, manifest_dir)
+            return
+        unsourced_fname = book()
     typer.echo(f"Source file ({source_fname}) structure restructured successfully!")
     typer.echo(f"Unsourced file name: {unsourced_fname}")
 
 
+def unsource_incremental(book: 'Book', manifest_dir: str) -> None:
+    from docbooktoxtm.incremental import Manifest, manifest_path, write_report
+
+    manifest_fname = manifest_path(manifest_dir, book.course)
+    previous = Manifest.load(manifest_fname)
+    try:
+        delta_fname, delta, manifest = book.unsource_delta(previous)
+    finally:
+        book.close()
+    report_fname = write_report(delta, delta_fname, previous, manifest)
+    os.makedirs(manifest_dir, exist_ok=True)
+    manifest.save(manifest_fname)
+    if previous is None:
+        typer.echo(f"No manifest found in {manifest_dir}: all {len(manifest.files)} files packaged.")
+    else:
+        typer.echo(f"{len(delta.emitted)} of {len(manifest.files)} files changed since {previous.release}; "
+                   f"{len(delta.removed)} removed.")
+    typer.echo(f"Delta file name: {delta_fname}")
+    typer.echo(f"Delta report: {report_fname}")
+
+
+@app.command(help='Prints the file mapping of an unsource or resource run as JSON without running it.')
+def plan(source_fname: str = typer.Argument(..., help='name of source .zip package'),
+         target_fname: Optional[str] = typer.Argument(None, help='name of target .zip package, for a resource'),
+         output: Optional[str] = typer.Option(None, '-o', '--output', help='write the plan to this file'),
+         strict: bool = typer.Option(False, '--strict', help='exit with status 1 if any file is left unmatched'),
+         ) -> None:
+    """
+    Builds the mapping `unsource` (or, given a target package, `resource`)
+    would apply from the central directories of the packages, `Book_Info.xml`
+    and the XML files the SG map includes, and prints it as JSON. No other
+    member is read, and nothing is written or removed unless `--output` is given.
+    :param source_fname: Name of source .ZIP package, e.g. a release from the cache.
+    :param target_fname: Name of target .ZIP package exported from XTM.
+    :param output: File the JSON plan is written to instead of stdout.
+    :param strict: Fail when target or source files are left unmatched, as a
+     pre-flight check before a full run.
+    """
+    import json
+
+    from docbooktoxtm.bookclasses import Book
+
+    book = Book(source_fname, target_fname)
+    try:
+        book_plan = book.plan()
+    finally:
+        book.close()
+    text = json.dumps(book_plan, indent=2, ensure_ascii=False)
+    if output is None:
+        typer.echo(text)
+    else:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(f"{text}\n")
+    if strict and (book_plan['unmatched_targets'] or book_plan['unmatched_sources']):
+        typer.echo(f"{len(book_plan['unmatched_targets'])} target and {len(book_plan['unmatched_sources'])} source "
+                   f"file(s) unmatched", err=True)
+        raise typer.Exit(1)
+
+
+def batch_entries(entries: Optional[List[str]], manifest: Optional[str]) -> List[str]:
+    from docbooktoxtm.batch import read_manifest
+
+    entries = list(entries or [])
+    if manifest is not None:
+        entries += read_manifest(manifest)
+    if not entries:
+        raise typer.BadParameter('no packages given; pass them as arguments or with --manifest')
+    return entries
+
+
+def report_batch(results: List['BatchResult'], out_dir: str, summary: str) -> None:
+    from docbooktoxtm.batch import write_summary
+
+    summary_fname = os.path.join(out_dir, summary)
+    write_summary(results, summary_fname)
+    for result in results:
+        if result.ok:
+            typer.echo(f"{result.package}: {result.output} ({result.seconds:.1f}s)")
+        else:
+            typer.echo(f"{result.package}: FAILED: {result.error}", err=True)
+    failed = sum(not result.ok for result in results)
+    typer.echo(f"{len(results) - failed}/{len(results)} package(s) processed; summary in {summary_fname}")
+    if failed:
+        raise typer.Exit(1)
+
+
+@app.command('resource-batch', help='Runs resource on many target packages with a pool of workers.')
+def resource_batch(target_fnames: Optional[List[str]] = typer.Argument(None, help='target .zip packages'),
+                   manifest: Optional[str] = typer.Option(
+                       None, '-m', '--manifest', help='file listing one target .zip package per line'
+                   ),
+                   out_dir: str = typer.Option(
+                       '.', '-o', '--out-dir', help='directory holding one working directory per package'
+                   ),
+                   workers: int = typer.Option(4, '-w', '--workers', min=1, help='number of packages run at once'),
+                   engine: Engine = typer.Option(
+                       Engine.lxml, '-e', '--engine', help='XML formatting engine'
+                   ),
+                   jobs: int = typer.Option(
+                       1, '-j', '--jobs', min=0, help='number of processes formatting target files (0: one per CPU)'
+                   ),
+                   stream: bool = typer.Option(
+                       False, '-s', '--stream', help='rewrite packages zip-to-zip without extracting them'
+                   ),
+                   level: Optional[int] = typer.Option(
+                       None, '-l', '--level', min=0, max=9, help='deflate level of the output package (0: store only)'
+                   ),
+                   zip_jobs: int = typer.Option(
+                       0, '-z', '--zip-jobs', min=0,
+                       help='number of threads compressing output members (0: one per CPU)'
+                   ),
+                   no_cache: bool = typer.Option(
+                       False, '--no-cache', help='always download the source release from GitHub and parse it again'
+                   ),
+                   summary: str = typer.Option(
+                       SUMMARY_FNAME, '--summary', help='name of the JSON summary written to the output directory'
+                   ),
+                   ) -> None:
+    """
+    Runs `resource` on every target package in one process. Each package is
+    processed in `out_dir/<package name>/`, which receives a link to the target
+    package, the source release, the output package and its own events.log.
+    The target packages given are left in place.
+    :param target_fnames: Names of target .ZIP packages.
+    :param manifest: File listing further target packages, one per line.
+    :param out_dir: Directory for the per-package working directories.
+    :param workers: Number of packages processed concurrently. All of them
+     share one GitHub client and the release cache.
+    :param summary: Name of the JSON file that records the result of each package.
+    """
+    from docbooktoxtm.batch import Batch
+    from docbooktoxtm.cache import default_cache
+
+    entries = batch_entries(target_fnames, manifest)
+    os.makedirs(out_dir, exist_ok=True)
+    configure_log(out_dir)
+    batch = Batch(out_dir, workers, cache=False if no_cache else default_cache(),
+                  engine=engine.value, jobs=jobs, stream=stream, level=level, zip_jobs=zip_jobs)
+    report_batch(batch.resource(entries), out_dir, summary)
+
+
+@app.command('unsource-batch', help='Runs unsource on many courses or source packages with a pool of workers.')
+def unsource_batch(courses: Optional[List[str]] = typer.Argument(
+                       None, help='course names (COURSE or COURSE@RELEASE_TAG) or source .zip packages'
+                   ),
+                   manifest: Optional[str] = typer.Option(
+                       None, '-m', '--manifest', help='file listing one course or source .zip package per line'
+                   ),
+                   out_dir: str = typer.Option(
+                       '.', '-o', '--out-dir', help='directory holding one working directory per package'
+                   ),
+                   workers: int = typer.Option(4, '-w', '--workers', min=1, help='number of packages run at once'),
+                   stream: bool = typer.Option(
+                       False, '-s', '--stream', help='rewrite packages zip-to-zip without extracting them'
+                   ),
+                   level: Optional[int] = typer.Option(
+                       None, '-l', '--level', min=0, max=9, help='deflate level of the output package (0: store only)'
+                   ),
+                   zip_jobs: int = typer.Option(
+                       0, '-z', '--zip-jobs', min=0,
+                       help='number of threads compressing output members (0: one per CPU)'
+                   ),
+                   no_cache: bool = typer.Option(
+                       False, '--no-cache', help='always download the source release from GitHub and parse it again'
+                   ),
+                   summary: str = typer.Option(
+                       SUMMARY_FNAME, '--summary', help='name of the JSON summary written to the output directory'
+                   ),
+                   ) -> None:
+    """
+    Runs `unsource` on every course or source package in one process, each in
+    `out_dir/<package name>/`.
+    :param courses: Course names, optionally followed by `@` and a release tag,
+     or names of source .ZIP packages, which are left in place.
+    :param manifest: File listing further entries, one per line.
+    :param out_dir: Directory for the per-package working directories.
+    :param workers: Number of packages processed concurrently. All of them
+     share one GitHub client and the release cache.
+    :param summary: Name of the JSON file that records the result of each package.
+    """
+    from docbooktoxtm.batch import Batch
+    from docbooktoxtm.cache import default_cache
+
+    entries = batch_entries(courses, manifest)
+    os.makedirs(out_dir, exist_ok=True)
+    configure_log(out_dir)
+    batch = Batch(out_dir, workers, cache=False if no_cache else default_cache(), stream=stream,
+                  level=level, zip_jobs=zip_jobs)
+    report_batch(batch.unsource(entries), out_dir, summary)
+
+
 if __name__ == "__main__":
     app()
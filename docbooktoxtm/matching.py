@@ -0,0 +1,83 @@
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from fuzzywuzzy import process
+
+from docbooktoxtm.filetable import FileTable, PathPair
+
+
+class Matches(NamedTuple):
+    clean: List[PathPair]
+    unmatched_targets: Tuple[str, ...]
+    unmatched_sources: Tuple[str, ...]
+
+
+class TargetMatcher:
+    """
+    Pairs the files found in a target package with the source files they were
+    generated from.
+
+    Expected target paths resolve with a single dict lookup. For any other target
+    file, the candidates are the unused source files whose basename occurs in the
+    target path, exactly as before, but they are found through a basename index
+    instead of a scan over the whole book. Fuzzy scoring only runs over that bucket.
+    A `FileTable` is used as it is, with its own target index.
+    """
+
+    def __init__(self, flist: Iterable[PathPair]):
+        self.flist = flist if isinstance(flist, FileTable) else FileTable(flist)
+        self.fdict: Dict[str, str] = self.flist.by_target
+        self.order: Dict[str, int] = {tfname: i for i, tfname in enumerate(self.fdict)}
+        self.basenames: Dict[str, List[str]] = defaultdict(list)
+        for tfname, sfname in self.fdict.items():
+            self.basenames[os.path.basename(sfname)].append(tfname)
+        self.lengths = sorted({len(basename) for basename in self.basenames})
+        self.used: Set[str] = set()
+
+    def bucket(self, tf: str) -> List[str]:
+        # a basename has no separator, so any occurrence lies within one component of tf
+        found = set()
+        for component in set(tf.split(os.sep)):
+            for length in self.lengths:
+                if length > len(component):
+                    break
+                for i in range(len(component) - length + 1):
+                    found.update(self.basenames.get(component[i:i + length], ()))
+        return sorted(
+            (tfname for tfname in found if self.fdict[tfname] not in self.used),
+            key=self.order.__getitem__
+        )
+
+    def match_one(self, tf: str) -> Optional[str]:
+        if tf in self.fdict:
+            sf = self.fdict[tf]
+            self.used.add(sf)
+            logging.info(f"File matched as expected: {tf} -> {sf}")
+            return sf
+        bucket = self.bucket(tf)
+        # with no score cutoff, a lone candidate wins whatever its score
+        best = bucket[0] if len(bucket) == 1 else next(iter(process.extractBests(tf, bucket)), (None,))[0]
+        if best is not None:
+            sf = self.fdict[best]
+            self.used.add(sf)
+            logging.info(f"Unexpected filename: {tf}")
+            logging.info(f"Matched to source file: {tf} -> {sf}")
+            return sf
+        logging.warning(f"Unmatched target file: {tf}")
+        return None
+
+    def match(self, target_actuals: Iterable[str]) -> Matches:
+        clean = []
+        unmatched_targets = []
+        for tf in target_actuals:
+            sf = self.match_one(tf)
+            if sf is None:
+                unmatched_targets.append(tf)
+            else:
+                clean.append((tf, sf))
+        unmatched_sources = tuple(sf for sf, _ in self.flist if sf not in self.used)
+        for sf in unmatched_sources:
+            logging.warning(f"Source file not found in target files: {sf}")
+        return Matches(sorted(tuple(clean)), tuple(unmatched_targets), unmatched_sources)
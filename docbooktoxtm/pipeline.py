@@ -0,0 +1,156 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from docbooktoxtm.bookclasses import Book, BookInfo, prepare_target
+from docbooktoxtm.cache import MemoryStructureCache, ReleaseCache, StructureCache
+from docbooktoxtm.formatting import DEFAULT_ENGINE
+from docbooktoxtm.functions import get_zip
+from docbooktoxtm.releases import ReleaseClient
+from docbooktoxtm.ziputils import ZipIndex
+
+
+class Overlap(NamedTuple):
+    download: float
+    prepare: float
+    wall: float
+
+    @property
+    def saved(self) -> float:
+        """
+        Seconds saved over downloading the source and then preparing the target.
+        """
+        return max(0.0, self.download + self.prepare - self.wall)
+
+    def report(self) -> str:
+        return (f"Overlap saved {self.saved:.1f}s: downloading the source ({self.download:.1f}s) and preparing "
+                f"the target ({self.prepare:.1f}s) took {self.wall:.1f}s together")
+
+
+async def timed(func: Callable[[], Any]) -> Tuple[Any, float]:
+    """
+    Runs `func` in the default executor, within the current tracing context.
+    """
+    start = time.perf_counter()
+    result = await asyncio.get_running_loop().run_in_executor(None, contextvars.copy_context().run, func)
+    return result, time.perf_counter() - start
+
+
+async def resource_async(target_index: ZipIndex,
+                         cache: Union[ReleaseCache, bool, None] = None,
+                         client: Optional[ReleaseClient] = None,
+                         wd: Optional[str] = None,
+                         engine: str = DEFAULT_ENGINE,
+                         jobs: int = 1,
+                         stream: bool = False,
+                         **options: Any
+                         ) -> Tuple[str, Overlap]:
+    """
+    Resources a target package while its source release downloads: the target
+    files are extracted (or read, in stream mode) and formatted at the same
+    time, and the book is built and matched once both are done.
+    :param cache: Release cache, as for `get_zip`: by default the one in
+     CACHE_DIR, False always downloads.
+    :param options: Further `Book` arguments, such as `level` and `zip_jobs`.
+    :return: Name of the resourced package, and the timings of the overlap.
+    """
+    bi = BookInfo.from_zipf(target_index)
+    wd = wd or os.getcwd()
+    start = time.perf_counter()
+    (source_fname, download), (prepared, prepare) = await asyncio.gather(
+        timed(partial(get_zip, bi.course, bi.release_tag, cache=cache, client=client, wd=wd)),
+        timed(partial(prepare_target, target_index, wd, engine, jobs, stream)),
+    )
+    overlap = Overlap(download, prepare, time.perf_counter() - start)
+    logging.info(overlap.report())
+    book = Book(source_fname, target_index, engine=engine, jobs=jobs, stream=stream, wd=wd, prepared=prepared,
+                **options)
+    return book(), overlap
+
+
+def resource_overlapped(target_index: ZipIndex, **options: Any) -> Tuple[str, Overlap]:
+    """
+    Runs `resource_async` in a new event loop.
+    """
+    return asyncio.run(resource_async(target_index, **options))
+
+
+def resource_locale(book: Book) -> str:
+    try:
+        book.preflight()
+        zip_fname = book.resource_stream(keep_inputs=True)
+    finally:
+        book.close()
+    logging.info(f"{book.target}: {book.target_zip} resourced as {zip_fname}")
+    return zip_fname
+
+
+def build_and_resource(source_index: ZipIndex, target_index: ZipIndex, **options: Any) -> str:
+    """
+    Matches and packages one locale: the body of a `resource_targets` worker.
+    """
+    return resource_locale(Book(source_index, target_index, **options))
+
+
+def resource_targets(target_fnames: Sequence[str],
+                     cache: Union[ReleaseCache, bool, None] = None,
+                     client: Optional[ReleaseClient] = None,
+                     wd: Optional[str] = None,
+                     workers: int = 4,
+                     structures: Optional[StructureCache] = None,
+                     **options: Any
+                     ) -> List[str]:
+    """
+    Resources the target packages of several locales of one release against a
+    single copy of the source: the release is downloaded (or checked out of
+    the cache) and its structure resolved once, by the book of the first
+    locale. Every other locale is then matched and packaged zip-to-zip from
+    it in a worker thread, `workers` at a time.
+    :param target_fnames: Target packages exported from XTM for the same
+     course and release tag, one per locale.
+    :param cache: Release cache, as for `get_zip`: by default the one in
+     CACHE_DIR, False always downloads.
+    :param structures: Structure cache; by default one kept in memory for
+     this call.
+    :param options: Further `Book` arguments, such as `level` and `low_memory`.
+    :return: Names of the resourced packages, in the order of `target_fnames`.
+     The inputs are removed once all of them are written.
+    """
+    wd = wd or os.getcwd()
+    target_indexes = [ZipIndex(fname) for fname in target_fnames]
+    try:
+        infos = [BookInfo.from_zipf(index) for index in target_indexes]
+        releases = sorted({(bi.course, bi.release_tag) for bi in infos})
+        if len(releases) != 1:
+            raise ValueError(f"Target packages are exports of different releases: "
+                             f"{', '.join(f'{course}@{tag}' for course, tag in releases)}")
+        duplicates = sorted(locale for locale, n in Counter(bi.target for bi in infos).items() if n > 1)
+        if duplicates:
+            raise ValueError(f"Several target packages for {', '.join(duplicates)}")
+        (course, release_tag), = releases
+        source_fname = get_zip(course, release_tag, cache=cache, client=client, wd=wd)
+        structures = structures or MemoryStructureCache()
+        with ZipIndex(source_fname) as source_index:
+            options = dict(options, wd=wd, stream=True, structures=structures)
+            # the first book fills the structure cache before the others are built in the workers
+            first = Book(source_index, target_indexes[0], **options)
+            with ThreadPoolExecutor(workers) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, resource_locale, first)]
+                futures += [executor.submit(contextvars.copy_context().run,
+                                            partial(build_and_resource, source_index, index, **options))
+                            for index in target_indexes[1:]]
+                outputs = [future.result() for future in futures]
+    finally:
+        for index in target_indexes:
+            index.close()
+    written = {os.path.abspath(os.path.join(wd, fname)) for fname in outputs}
+    for fname in (source_fname, *target_fnames):
+        if os.path.abspath(fname) not in written:
+            os.remove(fname)
+    return outputs
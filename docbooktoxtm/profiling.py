@@ -0,0 +1,164 @@
+import cProfile
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import ContextManager, Dict, Iterator, List, Optional
+
+from docbooktoxtm import __version__
+
+TRACE_ENV = 'DOCBOOKTOXTM_TRACE'
+REPORT_FNAME = 'profile.json'
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.files = 0
+        self.profile: Optional[cProfile.Profile] = None
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'wall': round(self.wall, 6),
+            'cpu': round(self.cpu, 6),
+            'bytes_read': self.bytes_read,
+            'bytes_written': self.bytes_written,
+            'files': self.files,
+        }
+
+
+def cpu_time() -> float:
+    # worker processes count once they have been joined, e.g. when a ProcessPoolExecutor shuts down
+    times = os.times()
+    return time.process_time() + times.children_user + times.children_system
+
+
+class Tracer:
+    """
+    Wall and CPU time, bytes read and written and files handled per pipeline
+    stage. Entering a stage again adds to the same record. With `cprofile`,
+    every stage is also profiled and the profile of the slowest one is kept.
+    """
+
+    def __init__(self, cprofile: bool = False):
+        self.cprofile = cprofile
+        self.stages: Dict[str, StageStats] = {}
+        self.profiling = False
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        stats = self.stages.setdefault(name, StageStats(name))
+        token = current_stage.set(stats)
+        profile = None
+        if self.cprofile and not self.profiling:
+            profile = stats.profile = stats.profile or cProfile.Profile()
+            self.profiling = True
+            profile.enable()
+        wall, cpu = time.perf_counter(), cpu_time()
+        try:
+            yield stats
+        finally:
+            stats.wall += time.perf_counter() - wall
+            stats.cpu += cpu_time() - cpu
+            stats.calls += 1
+            if profile is not None:
+                profile.disable()
+                self.profiling = False
+            current_stage.reset(token)
+
+    def slowest(self) -> Optional[StageStats]:
+        return max(self.stages.values(), key=lambda stats: stats.wall, default=None)
+
+    def report(self, command: str) -> dict:
+        return {
+            'version': __version__,
+            'command': command,
+            'argv': sys.argv[1:],
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'wall': round(time.perf_counter() - self.start, 6),
+            'stages': [stats.as_dict() for stats in self.stages.values()],
+        }
+
+    def write(self, wd: str, command: str) -> List[str]:
+        fnames = [os.path.join(wd, REPORT_FNAME)]
+        with open(fnames[0], 'w') as f:
+            json.dump(self.report(command), f, indent=2)
+        slowest = self.slowest()
+        if slowest is not None and slowest.profile is not None:
+            fnames.append(os.path.join(wd, f"profile-{slowest.name}.prof"))
+            slowest.profile.dump_stats(fnames[-1])
+        return fnames
+
+
+current_tracer: ContextVar[Optional[Tracer]] = ContextVar('current_tracer', default=None)
+current_stage: ContextVar[Optional[StageStats]] = ContextVar('current_stage', default=None)
+
+
+def trace(name: str) -> ContextManager:
+    """
+    Records the enclosed block as stage `name` while tracing is on.
+    """
+    tracer = current_tracer.get()
+    return tracer.stage(name) if tracer is not None else nullcontext()
+
+
+def counting() -> bool:
+    """
+    Whether a stage is being traced, for counters that are not free to compute.
+    """
+    return current_stage.get() is not None
+
+
+def count(read: int = 0, written: int = 0, files: int = 0) -> None:
+    """
+    Adds to the counters of the stage being traced, if any.
+    """
+    stats = current_stage.get()
+    if stats is not None:
+        stats.bytes_read += read
+        stats.bytes_written += written
+        stats.files += files
+
+
+def trace_mode(profile: bool = False, cprofile: bool = False) -> Optional[str]:
+    """
+    `--profile` or DOCBOOKTOXTM_TRACE=1 record timings; `--cprofile` or
+    DOCBOOKTOXTM_TRACE=cprofile also keep a cProfile dump of the slowest stage.
+    """
+    mode = os.environ.get(TRACE_ENV, '').strip().lower()
+    if cprofile or mode == 'cprofile':
+        return 'cprofile'
+    if profile or mode not in ('', '0', 'false', 'no', 'off'):
+        return 'timing'
+    return None
+
+
+@contextmanager
+def tracing(wd: str, command: str, mode: Optional[str]) -> Iterator[Optional[Tracer]]:
+    """
+    Traces the enclosed run and writes the report to `wd`, even if the run fails.
+    """
+    if mode is None:
+        yield None
+        return
+    tracer = Tracer(cprofile=mode == 'cprofile')
+    token = current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        current_tracer.reset(token)
+        for fname in tracer.write(wd, command):
+            logging.info(f"Profile written to {fname}")
@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+from docbooktoxtm.config import GITHUB_TOKEN, RELEASES_TTL
+from docbooktoxtm.ziputils import atomic_write
+
+GITHUB_API = 'https://api.github.com'
+PER_PAGE = 100
+
+
+class Release(NamedTuple):
+    tag_name: str
+    target_commitish: str
+    published_at: str
+    created_at: str
+    zipball_url: str
+    draft: bool = False
+    prerelease: bool = False
+
+    @classmethod
+    def from_json(cls, release: dict) -> 'Release':
+        return cls(**{field: release.get(field) or cls._field_defaults.get(field, '') for field in cls._fields})
+
+
+class ReleaseClient:
+    """
+    Looks up GitHub releases with as few API requests as possible.
+
+    One pooled `requests.Session` carries every API call and zipball download.
+    Release lists are kept per repository for `ttl` seconds, in memory and, when
+    `cache_dir` is set, on disk, so that a batch of courses or repeated runs do
+    not list the same releases again.
+    """
+
+    def __init__(self,
+                 token: Optional[str] = GITHUB_TOKEN,
+                 base_url: str = GITHUB_API,
+                 cache_dir: Optional[str] = None,
+                 ttl: float = RELEASES_TTL,
+                 session: Optional[requests.Session] = None
+                 ):
+        self.base_url = base_url.rstrip('/')
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.ttl = ttl
+        self.session = session or requests.Session()
+        self.session.headers['Accept'] = 'application/vnd.github.v3+json'
+        if token:
+            self.session.headers['Authorization'] = f"token {token}"
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.releases: Dict[Tuple[str, str], Tuple[float, List[Release]]] = {}
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        response = self.session.get(url, **kwargs)
+        with self.lock:
+            self.requests += 1
+            count = self.requests
+        logging.debug(f"GitHub request #{count}: GET {url} -> {response.status_code}")
+        return response
+
+    def repo_url(self, user: str, course: str) -> str:
+        return f"{self.base_url}/repos/{user}/{course}"
+
+    def get_release(self, user: str, course: str, tag: str) -> Optional[Release]:
+        response = self.get(f"{self.repo_url(user, course)}/releases/tags/{quote(tag, safe='')}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return Release.from_json(response.json())
+
+    def list_path(self, user: str, course: str) -> Optional[str]:
+        return os.path.join(self.cache_dir, 'releases', f"{user}_{course}.json") if self.cache_dir else None
+
+    def load_releases(self, user: str, course: str) -> Optional[List[Release]]:
+        fetched, releases = self.releases.get((user, course), (0, None))
+        if releases is None and self.list_path(user, course):
+            try:
+                with open(self.list_path(user, course), 'r') as f:
+                    cached = json.load(f)
+                fetched, releases = cached['fetched'], [Release(*release) for release in cached['releases']]
+            except (OSError, ValueError, KeyError, TypeError):
+                return None
+        if releases is None or time.time() - fetched > self.ttl:
+            return None
+        logging.debug(f"Using release list of {user}/{course} fetched {time.time() - fetched:.0f}s ago")
+        return releases
+
+    def save_releases(self, user: str, course: str, releases: List[Release]) -> None:
+        fetched = time.time()
+        self.releases[(user, course)] = (fetched, releases)
+        path = self.list_path(user, course)
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomic_write(path) as f:
+                json.dump({'fetched': fetched, 'releases': releases}, f)
+
+    def list_releases(self, user: str, course: str) -> List[Release]:
+        releases = self.load_releases(user, course)
+        if releases is not None:
+            return releases
+        releases = []
+        url = f"{self.repo_url(user, course)}/releases"
+        params = {'per_page': PER_PAGE}
+        while url:
+            response = self.get(url, params=params)
+            response.raise_for_status()
+            releases += [Release.from_json(release) for release in response.json()]
+            url = response.links.get('next', {}).get('url')
+            params = None
+        self.save_releases(user, course, releases)
+        return releases
+
+    @staticmethod
+    def is_full_tag(course: str, release_tag: str) -> bool:
+        # release tags are named {course}-{product}{version}-...; the tag of a Book_Info.xml or a branch is not
+        return release_tag.startswith(f"{course}-")
+
+    @staticmethod
+    def latest(releases: List[Release]) -> Optional[Release]:
+        # GitHub's "latest release": the most recently created release that is neither a draft nor a prerelease
+        published = [release for release in releases if not release.draft and not release.prerelease]
+        return max(published, key=lambda x: x.created_at) if published else None
+
+    def resolve(self, user: str, course: str, release_tag: Optional[str] = None) -> Optional[Release]:
+        """
+        Picks the release to download, following the rules `get_zip` has always used.
+        A tag is first looked for in the cached release list. A full tag missing
+        from it is looked up directly; anything else is matched against the
+        release list, which is only fetched when it is not cached.
+        :param release_tag: Full tag, or a part of a tag name or target branch.
+        :return: The release, or None when the default branch should be used.
+        """
+        if release_tag:
+            cached = self.load_releases(user, course) or []
+            release = next((release for release in cached if release.tag_name == release_tag), None)
+            if release is None and self.is_full_tag(course, release_tag):
+                release = self.get_release(user, course, release_tag)
+            if release is not None:
+                return release
+            releases = [
+                release
+                for release in self.list_releases(user, course)
+                if (
+                        release_tag in release.target_commitish
+                        or
+                        release_tag in release.tag_name
+                )
+            ]
+        else:
+            releases = self.list_releases(user, course)
+        release = max(releases, key=lambda x: x.published_at) if releases else None
+        if release and release_tag is None:
+            latest_release = self.latest(releases)
+            if latest_release is not None and latest_release != release:
+                release_tags = {release.tag_name.split('-')[-4] for release in [release, latest_release]}
+                if len(release_tags) > 1:
+                    release = sorted(
+                        [release, latest_release],
+                        key=lambda x: x.tag_name.split('-')[-4],
+                        reverse=True
+                    )[0]
+                else:
+                    release = sorted(
+                        [release, latest_release],
+                        key=lambda x: x.published_at,
+                        reverse=True
+                    )[0]
+        return release
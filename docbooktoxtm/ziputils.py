@@ -0,0 +1,359 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from os import PathLike
+from typing import Callable, Deque, Dict, IO, Iterator, List, Optional, Union
+
+from docbooktoxtm.profiling import count, counting
+
+CHUNK_SIZE = 1 << 20
+IN_MEMORY_LIMIT = 64 * CHUNK_SIZE
+STORED_SUFFIXES = frozenset((
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.svgz',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.jar', '.rpm', '.whl',
+    '.pdf', '.mp3', '.mp4', '.m4v', '.mov', '.webm', '.woff', '.woff2',
+    '.docx', '.pptx', '.xlsx', '.odt', '.odp', '.ods',
+))
+DATA_DESCRIPTOR_FLAG = 0x08
+FILE_HEADER_SIZE = struct.calcsize(zipfile.structFileHeader)
+
+
+class ZipIndex:
+    """
+    Reads the central directory of a .ZIP package once and keeps it at hand
+    for every stage that needs to look up, open or copy members.
+    `Book_Info.xml` and `*-SG.xml` candidates are collected in the same pass.
+    """
+
+    def __init__(self, file: Union[str, os.PathLike, IO[bytes]]):
+        self.fname: Optional[str] = os.fspath(file) if isinstance(file, (str, os.PathLike)) else getattr(
+            file, 'name', None)
+        self.zipf = zipfile.ZipFile(file, 'r')
+        self.namelist: List[str] = []
+        self.infos: Dict[str, zipfile.ZipInfo] = {}
+        self.book_info: List[str] = []
+        self.maps: List[str] = []
+        for info in self.zipf.infolist():
+            name = info.filename
+            self.namelist.append(name)
+            self.infos[name] = info
+            if 'Book_Info.xml' in name:
+                self.book_info.append(name)
+            if name.endswith('-SG.xml') and '/guides/en-US/' in name:
+                self.maps.append(name)
+        self.files = frozenset(name for name in self.infos if name[-1] != '/')
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.files
+
+    def __enter__(self) -> 'ZipIndex':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.zipf.close()
+
+    @property
+    def root(self) -> str:
+        return self.namelist[0].split('/')[0]
+
+    @property
+    def digest(self) -> str:
+        """
+        SHA-256 of the central directory: member names, CRC-32s and sizes
+        identify the contents of the package without reading it again.
+        """
+        digest = hashlib.sha256()
+        for name in self.namelist:
+            info = self.infos[name]
+            digest.update(f"{name}\0{info.CRC:08x}\0{info.file_size}\n".encode('utf-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+    def open(self, name: str) -> IO[bytes]:
+        return self.zipf.open(self.infos[name], 'r')
+
+    def read(self, name: str) -> bytes:
+        return self.zipf.read(self.infos[name])
+
+    def find_book_info(self) -> str:
+        if not self.book_info:
+            raise ValueError(f"No 'Book_Info.xml' file found in {self.fname}.")
+        if len(self.book_info) == 1:
+            return self.book_info[0]
+        filtered = [file for file in self.book_info if 'en-US' in file]
+        if len(filtered) != 1:
+            raise ValueError(f"Several 'Book_Info.xml' files found in {self.fname}.")
+        return filtered[0]
+
+    def find_map(self, course: str) -> str:
+        suffix = f"/guides/en-US/{course}-SG.xml"
+        for name in self.maps:
+            if name.endswith(suffix):
+                return name
+        raise ValueError(f"No '{course}-SG.xml' file found in {self.fname}.")
+
+
+def member_name(path: str) -> str:
+    """
+    Converts an OS path, as used in `Book.flist`, to a .ZIP member name.
+    """
+    return path.replace(os.sep, '/')
+
+
+def iter_raw(f_zip: zipfile.ZipFile, info: zipfile.ZipInfo) -> Iterator[bytes]:
+    """
+    Yields the still-compressed data of a member straight from the archive.
+    Every chunk is read at its own offset under the archive lock, so threads
+    can copy members of the same archive at once.
+    """
+    with f_zip._lock:
+        f_zip.fp.seek(info.header_offset)
+        header = struct.unpack(zipfile.structFileHeader, f_zip.fp.read(FILE_HEADER_SIZE))
+        if header[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad magic number for file header: {info.filename}")
+        offset = (info.header_offset + FILE_HEADER_SIZE
+                  + header[zipfile._FH_FILENAME_LENGTH] + header[zipfile._FH_EXTRA_FIELD_LENGTH])
+    remaining = info.compress_size
+    while remaining:
+        with f_zip._lock:
+            f_zip.fp.seek(offset)
+            chunk = f_zip.fp.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise EOFError(f"Truncated member: {info.filename}")
+        offset += len(chunk)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def renamed(info: zipfile.ZipInfo, arcname: str) -> zipfile.ZipInfo:
+    zinfo = zipfile.ZipInfo(arcname, date_time=info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.create_system = info.create_system
+    zinfo.external_attr = info.external_attr
+    zinfo.flag_bits = info.flag_bits & ~DATA_DESCRIPTOR_FLAG
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    return zinfo
+
+
+def write_raw(f_zip: zipfile.ZipFile, zinfo: zipfile.ZipInfo, chunks: Iterator[bytes]) -> None:
+    """
+    Writes already-compressed member data to an archive opened for writing.
+    `zinfo` must carry the final CRC, sizes and compression method of the data.
+    """
+    if f_zip._writing:
+        raise ValueError("Can't write to ZIP archive while an open writing handle exists.")
+    with f_zip._lock:
+        if f_zip._seekable:
+            f_zip.fp.seek(f_zip.start_dir)
+        zinfo.header_offset = f_zip.fp.tell()
+        f_zip._writecheck(zinfo)
+        f_zip._didModify = True
+        zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+        f_zip.fp.write(zinfo.FileHeader(zip64))
+        for chunk in chunks:
+            f_zip.fp.write(chunk)
+        f_zip.filelist.append(zinfo)
+        f_zip.NameToInfo[zinfo.filename] = zinfo
+        f_zip.start_dir = f_zip.fp.tell()
+
+
+def copy_member(source: zipfile.ZipFile,
+                info: zipfile.ZipInfo,
+                target: zipfile.ZipFile,
+                arcname: str
+                ) -> zipfile.ZipInfo:
+    """
+    Copies a member to another archive under a new name without decompressing
+    and recompressing it.
+    :param source: Archive opened for reading.
+    :param info: Member of `source` to be copied.
+    :param target: Archive opened for writing.
+    :param arcname: Name of the member in `target`.
+    :return: ZipInfo of the new member.
+    """
+    zinfo = renamed(info, arcname)
+    write_raw(target, zinfo, iter_raw(source, info))
+    return zinfo
+
+
+def write_bytes(f_zip: zipfile.ZipFile, arcname: str, data: bytes) -> zipfile.ZipInfo:
+    zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = f_zip.compression
+    zinfo.external_attr = 0o644 << 16
+    f_zip.writestr(zinfo, data)
+    return zinfo
+
+
+def already_compressed(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in STORED_SUFFIXES
+
+
+def deflate(zinfo: zipfile.ZipInfo, data: bytes, level: Optional[int] = None) -> bytes:
+    """
+    Sets the CRC, sizes and compression method of `zinfo` for `data` and
+    returns the member data to be written. Formats that are compressed already,
+    and data that deflate does not shrink, are stored; so is everything at level 0.
+    """
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    if level != 0 and not already_compressed(zinfo.filename):
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) < len(data):
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            zinfo.compress_size = len(compressed)
+            return compressed
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.compress_size = len(data)
+    return data
+
+
+class MemberWriter:
+    """
+    Adds members to an archive opened for writing, in the order they are
+    given, while up to `jobs` threads read and compress the next ones. zlib
+    releases the GIL, so members are deflated in parallel and only the writes
+    to the archive are serialized. Members are compressed at `level` (zlib's
+    default when None); see `deflate` for those that are stored instead.
+    Files larger than IN_MEMORY_LIMIT are compressed by `ZipFile.write` when
+    their turn comes, without being read into memory.
+    """
+
+    def __init__(self, f_zip: zipfile.ZipFile, level: Optional[int] = None, jobs: int = 1):
+        self.f_zip = f_zip
+        self.level = level
+        self.jobs = jobs or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(max_workers=self.jobs) if self.jobs > 1 else None
+        self.pending: Deque[Future] = deque()
+
+    def __enter__(self) -> 'MemberWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            for future in self.pending:
+                future.cancel()
+            self.pending.clear()
+            self.shutdown()
+
+    def add(self, prepare: Callable[[], Callable[[], None]]) -> None:
+        """
+        Runs `prepare` in a worker thread; the write it returns runs in this
+        thread, after the writes of the members added before.
+        """
+        if self.pool is None:
+            prepare()()
+            return
+        self.pending.append(self.pool.submit(prepare))
+        while len(self.pending) > 2 * self.jobs:
+            self.pending.popleft().result()()
+
+    def deflated(self, zinfo: zipfile.ZipInfo, data: Union[bytes, PathLike, str]) -> Callable[[], None]:
+        if not isinstance(data, bytes):
+            with open(data, 'rb') as f:
+                data = f.read()
+        return partial(write_raw, self.f_zip, zinfo, (deflate(zinfo, data, self.level),))
+
+    def write_file(self, fname: Union[str, PathLike], arcname: Optional[str] = None) -> zipfile.ZipInfo:
+        zinfo = zipfile.ZipInfo.from_file(fname, arcname)
+        if zinfo.file_size > IN_MEMORY_LIMIT:
+            stored = self.level == 0 or already_compressed(zinfo.filename)
+            compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            self.add(lambda: partial(self.f_zip.write, fname, zinfo.filename, compress_type, self.level))
+        else:
+            self.add(partial(self.deflated, zinfo, fname))
+        return zinfo
+
+    def write_bytes(self, arcname: str, data: bytes) -> zipfile.ZipInfo:
+        zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime(time.time())[:6])
+        zinfo.external_attr = 0o644 << 16
+        self.add(partial(self.deflated, zinfo, data))
+        return zinfo
+
+    def copy(self, source: zipfile.ZipFile, info: zipfile.ZipInfo, arcname: str) -> None:
+        """
+        Queues a raw copy of a member of `source`, which keeps its compression.
+        """
+        self.add(lambda: partial(copy_member, source, info, self.f_zip, arcname))
+
+    def close(self) -> None:
+        try:
+            while self.pending:
+                self.pending.popleft().result()()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def zipdir(path: Union[str, PathLike],
+           f_zip: zipfile.ZipFile,
+           start: Optional[Union[str, PathLike]] = None,
+           level: Optional[int] = None,
+           jobs: int = 1
+           ) -> None:
+    """
+    Adds every file under `path` to `f_zip`, named relative to `start` if
+    given; see `MemberWriter` for `level` and `jobs`.
+    """
+    with MemberWriter(f_zip, level, jobs) as writer:
+        for root, _, files in os.walk(path):
+            for file in files:
+                file = os.path.join(root, file)
+                zinfo = writer.write_file(file, os.path.relpath(file, start) if start else None)
+                if counting():
+                    count(read=zinfo.file_size, files=1)
+
+
+@contextmanager
+def atomic_write(fname: str, mode: str = 'w', encoding: Optional[str] = None) -> Iterator[IO]:
+    """
+    Opens a file that only replaces `fname` once it has been written
+    completely. The partial file is named after the process and thread, so
+    that concurrent writers of the same file never share it.
+    """
+    partial_fname = f"{fname}.{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(partial_fname, mode, encoding=encoding) as f:
+            yield f
+    except BaseException:
+        if os.path.exists(partial_fname):
+            os.remove(partial_fname)
+        raise
+    os.replace(partial_fname, fname)
+
+
+@contextmanager
+def atomic_zip(fname: str,
+               compression: int = zipfile.ZIP_DEFLATED,
+               compresslevel: Optional[int] = None
+               ) -> Iterator[zipfile.ZipFile]:
+    """
+    Opens a new archive that only replaces `fname` once it has been written
+    completely, so that an input archive of the same name stays readable until then.
+    """
+    partial_fname = f"{fname}.part"
+    try:
+        with zipfile.ZipFile(partial_fname, 'w', compression, compresslevel=compresslevel) as f_zip:
+            yield f_zip
+    except BaseException:
+        if os.path.exists(partial_fname):
+            os.remove(partial_fname)
+        raise
+    os.replace(partial_fname, fname)
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from typing import IO, Dict, Optional, Union
+
+from docbooktoxtm.bookclasses import Book
+
+fixture = os.path.join(os.path.dirname(__file__), 'DTX123-1.0.0.zip')
+
+
+def contents(fname) -> Dict[str, bytes]:
+    with zipfile.ZipFile(fname) as f_zip:
+        return {info.filename: f_zip.read(info) for info in f_zip.infolist() if not info.is_dir()}
+
+
+def unsourced() -> Dict[str, bytes]:
+    """
+    Members of the unsourced fixture, built in a directory of their own.
+    """
+    wd = tempfile.mkdtemp()
+    try:
+        shutil.copy(fixture, wd)
+        return contents(os.path.join(wd, Book(os.path.join(wd, os.path.basename(fixture)), wd=wd)()))
+    finally:
+        shutil.rmtree(wd)
+
+
+def translated_target(fname: Union[str, IO[bytes]], subtitle: str, members: Optional[Dict[str, bytes]] = None,
+                      compression: int = zipfile.ZIP_STORED) -> Union[str, IO[bytes]]:
+    """
+    Writes the unsourced fixture, or `members`, as a target zip translated
+    by its subtitle alone.
+    """
+    with zipfile.ZipFile(fname, 'w', compression) as f_zip:
+        for name, data in (unsourced() if members is None else members).items():
+            f_zip.writestr(name, data.replace(b'Student Workbook', subtitle.encode()))
+    return fname
+
+
+def german_target(fname: Union[str, IO[bytes]] = 'target.zip', **kwargs) -> Union[str, IO[bytes]]:
+    return translated_target(fname, 'Teilnehmerarbeitsbuch', **kwargs)
+
+
+class TempDirTestCase(unittest.TestCase):
+    """
+    Runs each test inside a temporary working directory.
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.wd = tempfile.mkdtemp()
+        os.chdir(self.wd)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.wd)
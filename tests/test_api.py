@@ -0,0 +1,63 @@
+import io
+import logging
+import os
+import unittest
+
+from docbooktoxtm.api import convert
+from docbooktoxtm.main import configure_log
+
+from tests import TempDirTestCase, contents, fixture, german_target, unsourced
+
+
+class Unseekable(io.RawIOBase):
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+class TestApi(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        with open(fixture, 'rb') as f:
+            self.source = f.read()
+
+    def test_unsource(self):
+        expected = unsourced()
+        handlers = list(logging.getLogger('').handlers)
+        converted = convert(self.source)
+        self.assertEqual(os.listdir(self.wd), [])
+        self.assertEqual(logging.getLogger('').handlers, handlers)
+        self.assertEqual(converted.fname, 'DTX123-20200625_en-US.zip')
+        self.assertEqual(contents(converted.data), expected)
+
+    def test_resource(self):
+        target = german_target(io.BytesIO()).getvalue()
+        with open(fixture, 'rb') as source:
+            converted = convert(source, io.BytesIO(target), output=Unseekable())
+        self.assertEqual(os.listdir(self.wd), [])
+        self.assertTrue(converted.fname.endswith('_de-DE.zip'))
+        self.assertEqual(converted.sublog, {'unmatched_targets': (), 'unmatched_sources': ()})
+        resourced = contents(io.BytesIO(converted.data.buffer.getvalue()))
+        self.assertTrue(any('/guides/de-DE/' in name for name in resourced))
+        self.assertEqual(resourced, contents(convert(self.source, target, jobs=1, zip_jobs=2).data))
+
+    def test_configure_log(self):
+        log = logging.getLogger('')
+        handlers = list(log.handlers)
+        try:
+            configure_log(self.wd)
+            configure_log(self.wd)
+            self.assertEqual(len(log.handlers), len(handlers) + 2)
+        finally:
+            for handler in log.handlers[len(handlers):]:
+                log.removeHandler(handler)
+                handler.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
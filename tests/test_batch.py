@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from docbooktoxtm.batch import Batch, read_manifest, work_dirs, write_summary
+from docbooktoxtm.bookclasses import BookInfo
+from docbooktoxtm.cache import ReleaseCache
+from docbooktoxtm.releases import ReleaseClient
+
+from tests import TempDirTestCase, contents, fixture, translated_target, unsourced
+
+
+class TestBatch(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        os.mkdir('inputs')
+        self.cache = ReleaseCache(os.path.join(self.wd, 'cache'))
+        # nothing listens here: every source release has to come from the cache
+        self.client = ReleaseClient(None, base_url='http://127.0.0.1:9')
+
+    def batch(self, **options) -> Batch:
+        return Batch('out', workers=3, cache=self.cache, client=self.client, **options)
+
+    def make_target(self, fname: str, subtitle: str) -> str:
+        return translated_target(os.path.join('inputs', fname), subtitle)
+
+    def test_unsource(self):
+        shutil.copy(fixture, 'inputs')
+        source = os.path.join('inputs', os.path.basename(fixture))
+        results = self.batch().unsource([source, source, 'inputs/missing.zip'])
+        self.assertEqual([result.ok for result in results], [True, True, False])
+        self.assertEqual(len({result.wd for result in results}), 3)
+        self.assertTrue(os.path.isfile(source))
+        expected = unsourced()
+        for result in results[:2]:
+            self.assertEqual(os.path.dirname(result.output), result.wd)
+            self.assertEqual(contents(result.output), expected)
+            self.assertEqual(sorted(os.listdir(result.wd)), sorted(['events.log', os.path.basename(result.output)]))
+        self.assertIn('missing.zip', results[2].error)
+
+    def test_resource(self):
+        targets = [self.make_target('en.zip', 'Student Workbook'), self.make_target('de.zip', 'Teilnehmerarbeitsbuch')]
+        bi = BookInfo.from_zipf(targets[0])
+        shutil.copy(fixture, 'release.zip')
+        self.cache.put('RedHatTraining', bi.course, bi.release_tag, 'release.zip')
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                results = self.batch(stream=stream).resource(targets)
+                self.assertTrue(all(result.ok for result in results), results)
+                self.assertTrue(all(os.path.isfile(target) for target in targets))
+                self.assertTrue(results[0].output.endswith('_en-US.zip'))
+                self.assertTrue(results[1].output.endswith('_de-DE.zip'))
+                self.assertTrue(any('/guides/de-DE/' in name for name in contents(results[1].output)))
+                self.assertEqual(self.client.requests, 0)
+                shutil.rmtree('out')
+
+    def test_default_cache(self):
+        root = os.path.join(self.wd, 'default')
+        with mock.patch('docbooktoxtm.cache.CACHE_DIR', root):
+            self.assertEqual(Batch('out').cache.root, root)
+            self.assertIsNone(Batch('out', cache=False).cache)
+
+    def test_summary(self):
+        with open('manifest.txt', 'w') as f:
+            f.write('# courses\nDTX123@1.0.0\n\nDTX123  # default release\n')
+        entries = read_manifest('manifest.txt')
+        self.assertEqual(entries, ['DTX123@1.0.0', 'DTX123'])
+        self.assertEqual([os.path.basename(wd) for wd in work_dirs('out', entries + entries)],
+                         ['DTX123-1.0.0', 'DTX123', 'DTX123-1.0.0-2', 'DTX123-2'])
+        shutil.copy(fixture, 'inputs')
+        results = self.batch().unsource([os.path.join('inputs', os.path.basename(fixture))])
+        write_summary(results, 'summary.json')
+        with open('summary.json') as f:
+            summary = json.load(f)
+        self.assertEqual(summary[0]['output'], results[0].output)
+        self.assertTrue(summary[0]['ok'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import unittest
+import zipfile
+from unittest import mock
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.ziputils import ZipIndex
+
+from tests import TempDirTestCase, contents, fixture
+
+source_fname = 'DTX123-1.0.0.zip'
+
+
+class TestBook(TempDirTestCase):
+    def run_book(self, target=None, **options):
+        shutil.copy(fixture, source_fname)
+        target_fname = options.pop('target_fname', 'target.zip')
+        if target is not None:
+            with zipfile.ZipFile(target_fname, 'w') as f_zip:
+                for name, data in target.items():
+                    f_zip.writestr(name, data)
+        book = Book(source_fname, target_fname if target is not None else None, **options)
+        zip_fname = book()
+        self.assertEqual(os.listdir(self.wd), [zip_fname])
+        output = contents(zip_fname)
+        os.remove(zip_fname)
+        return book, output
+
+    def test_unsource(self):
+        book, output = self.run_book()
+        self.assertEqual(book.course, 'DTX123')
+        self.assertEqual(set(output), {new for _, new in book.flist})
+        self.assertIn('en-US/00-introduction/01-Book_Info.xml', output)
+
+    def test_stream(self):
+        _, unsourced = self.run_book()
+        self.assertEqual(self.run_book(stream=True)[1], unsourced)
+        translated = {
+            name: data.replace(b'Student Workbook', 'Teilnehmerarbeitsbuch'.encode())
+            for name, data in unsourced.items()
+        }
+        book, resourced = self.run_book(translated)
+        self.assertEqual(book.target, 'de-DE')
+        self.assertTrue(any('/guides/de-DE/' in name for name in resourced))
+        self.assertFalse(any('/guides/en-US/' in name for name in resourced))
+        self.assertEqual(self.run_book(translated, stream=True)[1], resourced)
+
+    def test_stream_same_fname(self):
+        book, unsourced = self.run_book()
+        target_fname = book.output_fname
+        self.assertEqual(self.run_book(unsourced, stream=True, target_fname=target_fname)[1],
+                         self.run_book(unsourced, target_fname=target_fname)[1])
+
+    def test_closed_on_failure(self):
+        shutil.copy(fixture, source_fname)
+        with open('target.zip', 'wb') as f:
+            f.write(b'not a zip')
+        closed = []
+        close = ZipIndex.close
+
+        def counted(index):
+            closed.append(index.fname)
+            return close(index)
+
+        with mock.patch.object(ZipIndex, 'close', counted), self.assertRaises(zipfile.BadZipFile):
+            Book(source_fname, 'target.zip')
+        self.assertEqual(closed, [source_fname])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import io
+import os
+import unittest
+import zipfile
+
+from lxml import etree
+
+from docbooktoxtm.booktree import BookTree
+from docbooktoxtm.ziputils import ZipIndex
+
+from tests import fixture
+
+
+def legacy_get_book(index, fname, source_root):
+    root = etree.parse(index.open('/'.join((source_root, fname))), parser=etree.XMLParser(recover=True)).getroot()
+    children = [file for child in root if (
+            (file := child.attrib.get('href')) and '/'.join((source_root, file)) in index)]
+    file_list = []
+    for child in children:
+        file_list.append(child)
+        file_list += legacy_get_book(index, child, source_root)
+    return file_list
+
+
+class CountingIndex(ZipIndex):
+    def __init__(self, file):
+        super().__init__(file)
+        self.opened = []
+
+    def open(self, name):
+        self.opened.append(name)
+        return super().open(name)
+
+
+def package(files: dict) -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as f_zip:
+        for name, includes in files.items():
+            children = ''.join(f'<xi:include href="{href}"/>' for href in includes)
+            f_zip.writestr(f"C-1/guides/en-US/{name}",
+                           f'<book xmlns:xi="http://www.w3.org/2001/XInclude">{children}</book>')
+    buffer.seek(0)
+    return buffer
+
+
+class TestBookTree(unittest.TestCase):
+    def test_same_as_legacy(self):
+        with CountingIndex(fixture) as index:
+            source_root, mapf = os.path.split(index.find_map('DTX123'))
+            tree = BookTree(index, source_root)
+            book_tree = tree.walk(mapf)
+            self.assertEqual(len(index.opened), len(set(index.opened)))
+            self.assertEqual(book_tree, legacy_get_book(index, mapf, source_root))
+
+    def test_shared_and_cyclic_includes(self):
+        files = {
+            'C-SG.xml': ['a.xml', 'b.xml', 'missing.xml'],
+            'a.xml': ['shared.xml', 'a.xml'],
+            'b.xml': ['shared.xml', 'c.xml'],
+            'c.xml': ['b.xml'],
+            'shared.xml': [],
+        }
+        with CountingIndex(package(files)) as index:
+            tree = BookTree(index, 'C-1/guides/en-US')
+            with self.assertLogs(level='WARNING') as logs:
+                book_tree = tree.walk('C-SG.xml')
+            self.assertEqual(book_tree, ['a.xml', 'shared.xml', 'b.xml', 'shared.xml', 'c.xml'])
+            self.assertEqual(len(logs.output), 2)
+            self.assertEqual(sorted(index.opened), sorted(f"C-1/guides/en-US/{name}" for name in files))
+            self.assertEqual(tree.hrefs('C-SG.xml'), ('a.xml', 'b.xml', 'missing.xml'))
+            self.assertEqual(len(index.opened), len(files))
+
+    def test_deep_chain(self):
+        files = {f"{i}.xml": [f"{i + 1}.xml"] for i in range(5000)}
+        files['5000.xml'] = ['0.xml']
+        with ZipIndex(package(files)) as index:
+            with self.assertLogs(level='WARNING'):
+                book_tree = BookTree(index, 'C-1/guides/en-US').walk('0.xml')
+        self.assertEqual(len(book_tree), 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import io
+import os
+import shutil
+import threading
+import tracemalloc
+import unittest
+from unittest import mock
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.booktree import BookTree
+from docbooktoxtm.cache import ReleaseCache, StructureCache, file_digest
+from docbooktoxtm.functions import DEFAULT_BRANCH, download_release, get_zip
+
+from tests import TempDirTestCase, fixture
+
+course = 'DTX123'
+user = 'raorourke'
+tag = '1.0.0'
+etag = '"abc123"'
+
+
+def zipball() -> bytes:
+    # GitHub serves release zipballs under an owner-repo-sha/ top-level folder
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(fixture) as source, zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+        for info in source.infolist():
+            if not info.is_dir():
+                name = info.filename.split('/', 1)[1]
+                f_zip.writestr(f"{user}-{course}-abc123/{name}", source.read(info))
+    return buffer.getvalue()
+
+
+def large_zipball() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+        for i in range(4):
+            f_zip.writestr(f"{user}-{course}-abc123/large-{i}.bin", os.urandom(1024 * 1024))
+    return buffer.getvalue()
+
+
+class ZipballHandler(BaseHTTPRequestHandler):
+    bodies = {'small': zipball(), 'large': large_zipball()}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = self.bodies['large' if self.path.endswith('large') else 'small']
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestReleaseCache(TempDirTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ZipballHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/zipball/{tag}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    def setUp(self):
+        super().setUp()
+        self.cache = ReleaseCache(os.path.join(self.wd, 'cache'))
+        ZipballHandler.requests.clear()
+
+    def test_download_and_revalidate(self):
+        fname = download_release(self.url, course, tag, user, self.cache)
+        self.assertEqual(fname, f"{course}-{tag}.zip")
+        with zipfile.ZipFile(fname) as f_zip:
+            self.assertTrue(all(name.startswith(f"{course}-{tag}/") for name in f_zip.namelist()))
+            names = f_zip.namelist()
+        entry = self.cache.get(user, course, tag)
+        self.assertEqual(entry.etag, etag)
+        os.remove(fname)
+        self.assertEqual(download_release(self.url, course, tag, user, self.cache), fname)
+        self.assertEqual(ZipballHandler.requests, [(f"/zipball/{tag}", None), (f"/zipball/{tag}", etag)])
+        with zipfile.ZipFile(fname) as f_zip:
+            self.assertEqual(f_zip.namelist(), names)
+
+    def test_rerooted_contents(self):
+        fname = download_release(self.url, course, tag, user)
+        with zipfile.ZipFile(fixture) as source, zipfile.ZipFile(fname) as f_zip:
+            expected = {
+                f"{course}-{tag}/{info.filename.split('/', 1)[1]}": source.read(info)
+                for info in source.infolist() if not info.is_dir()
+            }
+            self.assertEqual({name: f_zip.read(name) for name in f_zip.namelist()}, expected)
+        self.assertEqual(os.listdir(self.wd), [fname])
+
+    def test_constant_memory(self):
+        size = len(ZipballHandler.bodies['large'])
+        with mock.patch('docbooktoxtm.functions.CHUNK_SIZE', 64 * 1024), \
+                mock.patch('docbooktoxtm.ziputils.CHUNK_SIZE', 64 * 1024):
+            tracemalloc.start()
+            fname = download_release(f"{self.url}-large", course, tag, user)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        self.assertLess(peak, size / 8)
+        with zipfile.ZipFile(fname) as f_zip:
+            self.assertIsNone(f_zip.testzip())
+
+    def test_exact_tag_skips_network(self):
+        download_release(self.url, course, tag, user, self.cache)
+        os.remove(f"{course}-{tag}.zip")
+        self.assertEqual(get_zip(course, tag, user, None, cache=self.cache), f"{course}-{tag}.zip")
+        self.assertEqual(len(ZipballHandler.requests), 1)
+        self.assertTrue(os.path.isfile(f"{course}-{tag}.zip"))
+        entry = self.cache.get(user, course, tag)
+        with open(f"{course}-{tag}.zip", 'ab') as f:
+            f.write(b'appended')
+        self.assertEqual(file_digest(self.cache.blob(entry.digest)), entry.digest)
+
+    def test_default_cache(self):
+        download_release(self.url, course, tag, user, self.cache)
+        os.remove(f"{course}-{tag}.zip")
+        # the default cache is looked up on each call, not once at import
+        with mock.patch('docbooktoxtm.cache.CACHE_DIR', self.cache.root):
+            self.assertEqual(get_zip(course, tag, user, None), f"{course}-{tag}.zip")
+        self.assertEqual(len(ZipballHandler.requests), 1)
+
+    def test_default_branch_revalidated(self):
+        # a repository without releases falls back to its default branch, which moves
+        client = mock.Mock(session=None, requests=0)
+        client.resolve.return_value = None
+        client.repo_url.return_value = self.url.rsplit('/zipball/', 1)[0]
+        fname = f"{course}-{DEFAULT_BRANCH}.zip"
+        self.assertEqual(get_zip(course, DEFAULT_BRANCH, user, None, cache=self.cache, client=client), fname)
+        os.remove(fname)
+        self.assertEqual(get_zip(course, DEFAULT_BRANCH, user, None, cache=self.cache, client=client), fname)
+        self.assertEqual(ZipballHandler.requests, [(f"/zipball/{DEFAULT_BRANCH}", None),
+                                                   (f"/zipball/{DEFAULT_BRANCH}", etag)])
+        self.assertTrue(os.path.isfile(fname))
+
+    def test_eviction(self):
+        download_release(self.url, course, tag, user, self.cache)
+        shutil.copy(f"{course}-{tag}.zip", 'other.zip')
+        with zipfile.ZipFile('other.zip', 'a') as f_zip:
+            f_zip.writestr('extra.txt', b'extra')
+        self.cache.max_bytes = os.path.getsize('other.zip')
+        self.cache.put(user, course, '2.0.0', 'other.zip')
+        self.assertIsNone(self.cache.get(user, course, tag))
+        self.assertIsNotNone(self.cache.get(user, course, '2.0.0'))
+        self.assertEqual(len(os.listdir(self.cache.blobs)), 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+
+class TestStructureCache(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.structures = StructureCache(self.wd)
+
+    def book(self) -> Book:
+        book = Book(fixture, structures=self.structures, wd=self.wd)
+        book.close()
+        return book
+
+    def test_hit(self):
+        parsed = self.book()
+        self.assertEqual(len(os.listdir(self.structures.root)), 1)
+        with mock.patch.object(BookTree, 'walk', side_effect=AssertionError('parsed again')):
+            cached = self.book()
+        for attr in ('mapf', 'source_root', 'intro', 'chapters', 'appendices', 'flist'):
+            self.assertEqual(getattr(cached, attr), getattr(parsed, attr))
+        self.assertEqual([file.astuple() for file in cached.files], [file.astuple() for file in parsed.files])
+        self.assertEqual([file.target_path() for file in cached.files], [file.target_path() for file in parsed.files])
+
+    def test_version(self):
+        parsed = self.book()
+        walks = []
+        walk = BookTree.walk
+
+        def counted(tree, fname):
+            walks.append(fname)
+            return walk(tree, fname)
+
+        with mock.patch('docbooktoxtm.cache.__version__', '0.0.0'), mock.patch.object(BookTree, 'walk', counted):
+            self.assertEqual(self.book().flist, parsed.flist)
+        self.assertEqual(len(walks), 1)
+        self.assertEqual(len(os.listdir(self.structures.root)), 2)
+
+    def test_evict(self):
+        structures = StructureCache(self.wd, max_entries=2)
+        for i in range(4):
+            structures.put(f"digest{i}", course, {'i': i})
+            os.utime(structures.fname(structures.key(f"digest{i}", course)), (i, i))
+        self.assertIsNone(structures.get('digest1', course))
+        self.assertEqual(structures.get('digest3', course), {'i': 3})
+        self.assertEqual(len(os.listdir(structures.root)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
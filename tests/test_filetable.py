@@ -0,0 +1,47 @@
+import os
+import unittest
+
+from docbooktoxtm.bookclasses import Book, BookFile
+from docbooktoxtm.filetable import FileTable
+
+from tests import fixture
+
+source_root = 'DTX123-1.0.0/guides/en-US'
+
+
+class TestFileTable(unittest.TestCase):
+    def setUp(self):
+        self.files = (
+            BookFile('00-introduction', 1, 'intro.xml'),
+            BookFile('01-chapter1', 1, 'sg-chapters/chapter1.xml'),
+            BookFile('01-chapter1', 2, 'sg-chapters/topics/chapter1/section.xml'),
+            BookFile('99-appendix', 1, 'Common/appendix.xml'),
+        )
+        self.table = FileTable.from_files(self.files, source_root, 'en-US')
+
+    def test_paths(self):
+        self.assertEqual(self.table, [(file.source_path(source_root), file.target_path()) for file in self.files])
+        self.assertEqual(self.table[3], (os.path.join('DTX123-1.0.0', 'guides', 'en-US', 'Common', 'appendix.xml'),
+                                         os.path.join('en-US', '99-appendix', '01-appendix.xml')))
+        self.assertEqual(self.table[1:2], ((self.table.sources[1], self.table.targets[1]),))
+        self.assertEqual(FileTable(self.table), self.table)
+
+    def test_lookups(self):
+        for source, target in self.table:
+            self.assertEqual(self.table.target(source), target)
+            self.assertEqual(self.table.source(target), source)
+        self.assertIsNone(self.table.source('missing.xml'))
+
+    def test_compact(self):
+        self.assertFalse(hasattr(self.files[0], '__dict__'))
+        self.assertIs(self.files[1].path, BookFile('01-chapter1', 3, 'sg-chapters/chapter2.xml').path)
+
+    def test_book(self):
+        book = Book(fixture)
+        book.close()
+        self.assertIsInstance(book.flist, FileTable)
+        self.assertEqual(book.flist, [(file.source_path(book.source_root), file.target_path()) for file in book.files])
+
+
+if __name__ == '__main__':
+    unittest.main()
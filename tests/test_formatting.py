@@ -0,0 +1,78 @@
+import os
+import shutil
+import unittest
+import zipfile
+
+from docbooktoxtm.bookclasses import ppxml
+from docbooktoxtm.formatting import format_file, format_xml
+
+from tests import TempDirTestCase, fixture
+
+section = 'DTX123-0.0.1.dev6/guides/en-US/sg-chapters/topics/seven_chapter/two-section.xml'
+
+document = b'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE section PUBLIC "-//OASIS//DTD DocBook XML V4.5//EN" "docbookx.dtd" [
+<!ENTITY % common_entities SYSTEM "common.ent">
+]>
+<section id="one"><title>Red&nbsp;Hat</title>   <para>para</para></section>
+'''
+
+
+class TestFormatXml(unittest.TestCase):
+    def test_pretty_print(self):
+        formatted = format_xml(document)
+        self.assertTrue(formatted.startswith(b'<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE section'))
+        self.assertIn(b'<!ENTITY % common_entities SYSTEM "common.ent">', formatted)
+        self.assertIn(b'\n  <title>Red&nbsp;Hat</title>\n  <para>para</para>\n', formatted)
+
+    def test_no_parser_noise(self):
+        self.assertNotIn(b'parser', format_xml(document))
+
+    def test_not_xml(self):
+        self.assertEqual(format_xml(b'Dummy text\n'), b'Dummy text\n')
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            format_file('missing.xml', 'tidy')
+
+
+class TestPpxml(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(6):
+            with open(os.path.join(self.wd, f"{i}.xml"), 'wb') as f:
+                f.write(document)
+        self.broken = os.path.join(self.wd, 'broken.xml')
+        os.symlink(os.path.join(self.wd, 'missing.xml'), self.broken)
+
+    def test_parallel(self):
+        with self.assertLogs(level='ERROR') as logs:
+            failed = ppxml(self.wd, jobs=2)
+        self.assertEqual(failed, (self.broken,))
+        self.assertIn(self.broken, logs.output[0])
+        for i in range(6):
+            with open(os.path.join(self.wd, f"{i}.xml"), 'rb') as f:
+                self.assertEqual(f.read(), format_xml(document))
+
+
+@unittest.skipUnless(shutil.which('xmllint'), 'xmllint is not installed')
+class TestEngines(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        with zipfile.ZipFile(fixture) as f_zip:
+            self.data = f_zip.read(section)
+
+    def test_same_output(self):
+        outputs = []
+        for engine in ('lxml', 'xmllint'):
+            file = os.path.join(self.wd, f"{engine}.xml")
+            with open(file, 'wb') as f:
+                f.write(self.data)
+            format_file(file, engine)
+            with open(file, 'rb') as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import shutil
+import unittest
+import zipfile
+
+from typer.testing import CliRunner
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.incremental import Manifest, ManifestEntry, manifest_path
+from docbooktoxtm.limits import LimitExceeded, Limits
+from docbooktoxtm.main import app
+
+from tests import TempDirTestCase, contents, fixture
+
+section = 'guides/en-US/sg-chapters/topics/appendix/three-section.xml'
+
+
+def release(fname: str, changes: dict) -> str:
+    with zipfile.ZipFile(fixture) as source, zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+        for info in source.infolist():
+            data = source.read(info)
+            f_zip.writestr(info, changes.get(info.filename.split('/', 1)[-1], data))
+    return fname
+
+
+class TestIncremental(TempDirTestCase):
+    def unsource_delta(self, fname, previous=None):
+        book = Book(fname)
+        try:
+            return book.unsource_delta(previous)
+        finally:
+            book.close()
+
+    def test_first_run(self):
+        shutil.copy(fixture, 'first.zip')
+        zip_fname, delta, manifest = self.unsource_delta('first.zip')
+        self.assertEqual(delta.unchanged, 0)
+        self.assertEqual(len(delta.added), len(manifest.files))
+        delta_contents = contents(zip_fname)
+        shutil.copy(fixture, 'full.zip')
+        self.assertEqual(delta_contents, contents(Book('full.zip')()))
+        manifest.save(manifest_path(self.wd, 'DTX123'))
+        self.assertEqual(Manifest.load(manifest_path(self.wd, 'DTX123')), manifest)
+        self.assertIsNone(Manifest.load(manifest_path(self.wd, 'RH124')))
+
+    def test_changed_file(self):
+        shutil.copy(fixture, 'first.zip')
+        _, _, previous = self.unsource_delta('first.zip')
+        with zipfile.ZipFile(fixture) as f_zip:
+            root = f_zip.namelist()[0].split('/')[0]
+            data = f_zip.read(f"{root}/{section}").replace(b'</section>', b'<para>New</para></section>')
+        zip_fname, delta, manifest = self.unsource_delta(release('second.zip', {section: data}), previous)
+        target = previous.files[section].target
+        self.assertEqual(delta.changed, (target,))
+        self.assertEqual(delta.added + delta.moved + delta.removed, ())
+        self.assertEqual(delta.unchanged, len(manifest.files) - 1)
+        self.assertEqual(contents(zip_fname), {target: data})
+        self.assertFalse(os.path.exists('second.zip'))
+
+    def test_limits(self):
+        shutil.copy(fixture, 'first.zip')
+        book = Book('first.zip', stream=True, limits=Limits(max_scratch=100 * 1024))
+        try:
+            with self.assertRaisesRegex(LimitExceeded, 'Scratch disk'):
+                book.unsource_delta()
+        finally:
+            book.close()
+        self.assertEqual(os.listdir(self.wd), ['first.zip'])
+
+    def test_cli_options(self):
+        shutil.copy(fixture, 'first.zip')
+        for option in (['--stream'], ['--level', '1'], ['--low-memory']):
+            result = CliRunner().invoke(app, ['unsource', 'first.zip', '--incremental', '--no-cache', *option])
+            self.assertEqual(result.exit_code, 2, result.output)
+            self.assertIn('--incremental', result.output)
+        self.assertEqual(os.listdir(self.wd), ['first.zip'])
+
+    def test_diff(self):
+        previous = Manifest('COURSE-1.0', {
+            'a.xml': ManifestEntry('1:1', 'en-US/01-a.xml'),
+            'b.xml': ManifestEntry('2:2', 'en-US/02-b.xml'),
+            'c.xml': ManifestEntry('3:3', 'en-US/03-c.xml'),
+            'd.xml': ManifestEntry('4:4', 'en-US/04-d.xml'),
+        })
+        current = Manifest('COURSE-1.1', {
+            'a.xml': ManifestEntry('1:1', 'en-US/01-a.xml'),
+            'c.xml': ManifestEntry('3:3', 'en-US/02-c.xml'),
+            'd.xml': ManifestEntry('5:5', 'en-US/03-d.xml'),
+            'e.xml': ManifestEntry('6:6', 'en-US/04-e.xml'),
+        })
+        delta = current.diff(previous)
+        self.assertEqual(delta.added, ('en-US/04-e.xml',))
+        self.assertEqual(delta.changed, ('en-US/03-d.xml',))
+        self.assertEqual(delta.moved, (('en-US/03-c.xml', 'en-US/02-c.xml'),))
+        self.assertEqual(delta.removed, ('en-US/02-b.xml', 'en-US/03-c.xml', 'en-US/04-d.xml'))
+        self.assertEqual(delta.unchanged, 1)
+        self.assertEqual(delta.emitted, ('en-US/04-e.xml', 'en-US/03-d.xml', 'en-US/02-c.xml'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import json
+import os
+import unittest
+
+from fuzzywuzzy import fuzz, process
+
+from docbooktoxtm.languages import SUBTITLE_INDEX, LanguageDetector
+
+from tests import TempDirTestCase
+
+
+def legacy(query: str) -> str:
+    return SUBTITLE_INDEX.get(process.extractOne(query, list(SUBTITLE_INDEX.keys()), scorer=fuzz.ratio)[0])
+
+
+class TestLanguageDetector(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.detector = LanguageDetector(SUBTITLE_INDEX)
+
+    def test_exact_and_normalized(self):
+        for subtitle, locale in SUBTITLE_INDEX.items():
+            self.assertEqual(self.detector.detect(subtitle), locale)
+        self.assertEqual(self.detector.detect('  student   WORKBOOK '), 'en-US')
+        self.assertEqual(self.detector.detect('Manuel d’exercices'), 'fr-FR')
+        self.assertEqual(self.detector.closest.cache_info().currsize, 0)
+
+    def test_fuzzy(self):
+        for query in ('Teilnehmer-Arbeitsbuch', 'Manual de exercícios', 'Libro del estudiante', 'Student Guide'):
+            self.assertEqual(self.detector.detect(query), legacy(query))
+            self.assertEqual(self.detector.detect(query), legacy(query))
+        self.assertEqual(self.detector.closest.cache_info().hits, 4)
+
+    def test_from_file(self):
+        fname = os.path.join(self.wd, 'languages.json')
+        self.assertEqual(LanguageDetector.from_file(fname).index, SUBTITLE_INDEX)
+        with open(fname, 'w', encoding='utf-8') as f:
+            json.dump({'Quaderno dello studente': 'it-IT', 'Student Workbook': 'en-GB'}, f)
+        detector = LanguageDetector.from_file(fname)
+        self.assertEqual(detector.detect('Quaderno dello studente'), 'it-IT')
+        self.assertEqual(detector.detect('Student Workbook'), 'en-GB')
+        self.assertIn('it-IT', detector.locales)
+        with open(fname, 'w') as f:
+            f.write('["it-IT"]')
+        with self.assertRaises(ValueError):
+            LanguageDetector.from_file(fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import logging
+import os
+import shutil
+import unittest
+import zipfile
+
+from typer.testing import CliRunner
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.limits import LimitExceeded, Limits, current_rss
+from docbooktoxtm.main import LOG_HANDLER, app
+
+from tests import TempDirTestCase, contents, fixture, german_target
+
+
+class TestLimits(TempDirTestCase):
+    def resource(self, **options) -> dict:
+        shutil.copy(fixture, 'source.zip')
+        shutil.copy('target.zip', 'input.zip')
+        output = Book('source.zip', 'input.zip', **options)()
+        resourced = contents(output)
+        os.remove(output)
+        return resourced
+
+    def test_low_memory(self):
+        german_target(compression=zipfile.ZIP_DEFLATED)
+        expected = self.resource()
+        limits = Limits(max_rss=current_rss() + 512 * 1024 ** 2, max_scratch=1024 ** 2)
+        self.assertEqual(self.resource(low_memory=True, limits=limits), expected)
+        self.assertEqual(sorted(os.listdir(self.wd)), ['target.zip'])
+
+    def test_scratch(self):
+        shutil.copy(fixture, 'source.zip')
+        with self.assertRaisesRegex(LimitExceeded, 'low-memory'):
+            Book('source.zip', limits=Limits(max_scratch=200 * 1024))()
+        with self.assertRaisesRegex(LimitExceeded, 'Scratch disk'):
+            Book('source.zip', stream=True, limits=Limits(max_scratch=100 * 1024))()
+        self.assertEqual(os.listdir(self.wd), ['source.zip'])
+        Book('source.zip', stream=True, limits=Limits(max_scratch=200 * 1024))()
+        self.assertFalse(os.path.exists('source.zip'))
+
+    def test_rss(self):
+        shutil.copy(fixture, 'source.zip')
+        with self.assertRaisesRegex(LimitExceeded, 'Memory limit of 1 MB'):
+            Book('source.zip', low_memory=True, limits=Limits.from_mb(max_rss=1))()
+        self.assertEqual(os.listdir(self.wd), ['source.zip'])
+
+    def test_cli(self):
+        shutil.copy(fixture, 'source.zip')
+        # the caches live under the user's home, which env= cannot redirect once docbooktoxtm.config is imported
+        result = CliRunner().invoke(app, ['unsource', 'source.zip', '--no-cache'], env={'DOCBOOKTOXTM_MAX_RSS': '1'})
+        self.assertEqual(result.exit_code, 2, result.output)
+        with open('events.log') as f:
+            self.assertIn('Memory limit of 1 MB exceeded', f.read())
+
+    def tearDown(self):
+        log = logging.getLogger('')
+        for handler in [handler for handler in log.handlers if handler.get_name() == LOG_HANDLER]:
+            log.removeHandler(handler)
+            handler.close()
+        super().tearDown()
+
+
+if __name__ == '__main__':
+    unittest.main()
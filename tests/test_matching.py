@@ -0,0 +1,63 @@
+import os
+import unittest
+
+from fuzzywuzzy import process
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.matching import TargetMatcher
+
+from tests import fixture
+
+
+def legacy_match(flist, target_actuals):
+    clean = []
+    matches = []
+    fdict = {tfname: sfname for sfname, tfname in flist}
+    for tf in target_actuals:
+        if tf in fdict:
+            clean.append((tf, fdict.get(tf)))
+            matches.append(fdict.get(tf))
+        else:
+            bests = process.extractBests(tf, (tarf for tarf in fdict if (
+                    os.path.basename(fdict.get(tarf)) in tf and fdict.get(tarf) not in matches)))
+            if bests:
+                clean.append((tf, fdict.get(bests[0][0])))
+                matches.append(fdict.get(bests[0][0]))
+    return sorted(tuple(clean))
+
+
+class TestTargetMatcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        book = Book(fixture)
+        cls.flist = book.flist
+        book.close()
+
+    def targets(self, every):
+        # shift the numeric prefix of every n-th file so that it needs fuzzy matching
+        targets = []
+        for i, (_, tf) in enumerate(self.flist):
+            if i % every == 0:
+                tf = tf.replace(f"{os.sep}0", f"{os.sep}1", 1)
+            targets.append(tf)
+        return targets + [os.path.join('en-US', 'extra', 'stray.xml')]
+
+    def test_same_as_legacy(self):
+        for every in (1, 2, 3, 7):
+            with self.subTest(every=every):
+                targets = self.targets(every)
+                with self.assertLogs(level='INFO'):
+                    matches = TargetMatcher(self.flist).match(targets)
+                self.assertEqual(matches.clean, legacy_match(self.flist, targets))
+
+    def test_unmatched(self):
+        targets = [tf for _, tf in self.flist[1:]] + [os.path.join('en-US', 'extra', 'stray.xml')]
+        with self.assertLogs(level='WARNING') as logs:
+            matches = TargetMatcher(self.flist).match(targets)
+        self.assertEqual(matches.unmatched_targets, (os.path.join('en-US', 'extra', 'stray.xml'),))
+        self.assertEqual(matches.unmatched_sources, (self.flist[0][0],))
+        self.assertEqual(len(logs.output), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
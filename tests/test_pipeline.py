@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from docbooktoxtm.bookclasses import Book, BookInfo
+from docbooktoxtm.booktree import BookTree
+from docbooktoxtm.cache import ReleaseCache
+from docbooktoxtm.pipeline import Overlap, resource_overlapped, resource_targets
+from docbooktoxtm.releases import ReleaseClient
+from docbooktoxtm.ziputils import ZipIndex
+
+from tests import TempDirTestCase, contents, fixture, german_target, translated_target, unsourced
+
+
+class TestPipeline(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ReleaseCache(os.path.join(self.wd, 'cache'))
+        # nothing listens here: the source release has to come from the cache
+        self.client = ReleaseClient(None, base_url='http://127.0.0.1:9')
+        self.unsourced = unsourced()
+        german_target(members=self.unsourced)
+        bi = BookInfo.from_zipf('target.zip')
+        shutil.copy(fixture, 'release.zip')
+        self.cache.put('RedHatTraining', bi.course, bi.release_tag, 'release.zip')
+
+    def translate(self, fname: str, subtitle: str) -> None:
+        translated_target(fname, subtitle, members=self.unsourced)
+
+    def resource(self, stream: bool) -> dict:
+        wd = tempfile.mkdtemp(dir=self.wd)
+        shutil.copy('target.zip', wd)
+        with ZipIndex(os.path.join(wd, 'target.zip')) as target_index:
+            output, overlap = resource_overlapped(target_index, cache=self.cache, client=self.client, wd=wd,
+                                                  stream=stream)
+        self.assertGreaterEqual(overlap.saved, 0)
+        self.assertEqual(sorted(os.listdir(wd)), [output])
+        return contents(os.path.join(wd, output))
+
+    def test_resource(self):
+        expected = self.resource(stream=False)
+        self.assertTrue(any('/guides/de-DE/' in name for name in expected))
+        self.assertEqual(self.resource(stream=True), expected)
+        shutil.copy('release.zip', 'source.zip')
+        self.assertEqual(contents(Book('source.zip', 'target.zip')()), expected)
+        self.assertEqual(self.client.requests, 0)
+
+    def test_targets(self):
+        wd = tempfile.mkdtemp(dir=self.wd)
+        self.translate(os.path.join(wd, 'de.zip'), 'Teilnehmerarbeitsbuch')
+        self.translate(os.path.join(wd, 'ja.zip'), '受講生用ワークブック')
+        targets = [os.path.join(wd, 'de.zip'), os.path.join(wd, 'ja.zip')]
+        walks = []
+        walk = BookTree.walk
+
+        def counted(tree, fname):
+            walks.append(fname)
+            return walk(tree, fname)
+
+        with mock.patch.object(BookTree, 'walk', counted):
+            outputs = resource_targets(targets, cache=self.cache, client=self.client, wd=wd, workers=2)
+        self.assertEqual(len(walks), 1)
+        self.assertEqual(outputs, ['DTX123-20200625_de-DE.zip', 'DTX123-20200625_ja-JP.zip'])
+        self.assertEqual(sorted(os.listdir(wd)), outputs)
+        self.assertEqual(self.client.requests, 0)
+        for locale, output in zip(('de-DE', 'ja-JP'), outputs):
+            resourced = contents(os.path.join(wd, output))
+            self.assertTrue(any(f'/guides/{locale}/' in name for name in resourced))
+            shutil.copy('release.zip', 'source.zip')
+            self.translate('single.zip', 'Teilnehmerarbeitsbuch' if locale == 'de-DE' else '受講生用ワークブック')
+            self.assertEqual(contents(Book('source.zip', 'single.zip', stream=True)()), resourced)
+
+    def test_targets_mismatch(self):
+        shutil.copy('target.zip', 'again.zip')
+        with self.assertRaisesRegex(ValueError, 'de-DE'):
+            resource_targets(['target.zip', 'again.zip'], cache=self.cache, client=self.client)
+        self.assertTrue(os.path.isfile('again.zip'))
+
+    def test_overlap(self):
+        self.assertAlmostEqual(Overlap(download=3.0, prepare=2.0, wall=3.5).saved, 1.5)
+        self.assertEqual(Overlap(download=0.1, prepare=0.1, wall=0.3).saved, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import unittest
+import zipfile
+from unittest import mock
+
+from typer.testing import CliRunner
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.main import app
+from docbooktoxtm.ziputils import ZipIndex, member_name
+
+from tests import TempDirTestCase, contents, fixture, german_target
+
+
+class TestPlan(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.runner = CliRunner()
+
+    def plan(self, *args, exit_code=0):
+        result = self.runner.invoke(app, ['plan', *args])
+        self.assertEqual(result.exit_code, exit_code, result.output)
+        return result
+
+    def test_unsource(self):
+        shutil.copy(fixture, 'source.zip')
+        with mock.patch.object(ZipIndex, 'open', autospec=True, side_effect=ZipIndex.open) as index_open, \
+                mock.patch.object(ZipIndex, 'read', autospec=True, side_effect=ZipIndex.read) as index_read:
+            plan = json.loads(self.plan('source.zip').stdout)
+            read = {call.args[1] for call in index_open.call_args_list + index_read.call_args_list}
+        self.assertEqual(sorted(os.listdir(self.wd)), ['source.zip'])
+        book = Book('source.zip')
+        book.close()
+        self.assertEqual(plan['mode'], 'unsource')
+        self.assertEqual(plan['output'], book.output_fname)
+        self.assertEqual([(pair['from'], pair['to']) for pair in plan['files']],
+                         [(member_name(current), member_name(new)) for current, new in book.flist])
+        self.assertLess(len(read), len(plan['files']) // 3)
+        self.assertFalse(any('/topics/' in name for name in read))
+
+    def test_resource(self):
+        german_target()
+        with zipfile.ZipFile('target.zip', 'a') as f_zip:
+            f_zip.writestr('en-US/99-appendix/99-extra.xml', b'<section/>')
+        shutil.copy(fixture, 'source.zip')
+        plan = json.loads(self.plan('source.zip', 'target.zip').stdout)
+        self.assertEqual((plan['mode'], plan['target']), ('resource', 'de-DE'))
+        self.assertEqual(plan['unmatched_targets'], ['en-US/99-appendix/99-extra.xml'])
+        self.assertEqual(plan['unmatched_sources'], [])
+        self.assertEqual(len(plan['files']), len(contents('target.zip')) - 1)
+        self.assertTrue(all(pair['from'].startswith('en-US/') for pair in plan['files']))
+        self.plan('source.zip', 'target.zip', '--strict', '-o', 'plan.json', exit_code=1)
+        with open('plan.json') as f:
+            self.assertEqual(json.load(f), plan)
+        self.assertEqual(sorted(os.listdir(self.wd)), ['plan.json', 'source.zip', 'target.zip'])
+
+
+if __name__ == '__main__':
+    unittest.main()
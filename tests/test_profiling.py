@@ -0,0 +1,44 @@
+import json
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from docbooktoxtm.bookclasses import Book
+from docbooktoxtm.profiling import REPORT_FNAME, TRACE_ENV, count, trace, trace_mode, tracing
+
+from tests import TempDirTestCase, fixture
+
+
+class TestProfiling(TempDirTestCase):
+    def test_stages(self):
+        with tracing(self.wd, 'test', 'timing') as tracer:
+            for _ in range(2):
+                with trace('stage'):
+                    count(read=10, written=5, files=1)
+        count(read=1)
+        self.assertIsNone(tracer.stages['stage'].profile)
+        with open(REPORT_FNAME) as f:
+            report = json.load(f)
+        self.assertEqual(report['command'], 'test')
+        stage, = report['stages']
+        self.assertEqual((stage['calls'], stage['bytes_read'], stage['bytes_written'], stage['files']), (2, 20, 10, 2))
+
+    def test_unsource(self):
+        shutil.copy(fixture, 'source.zip')
+        with tracing(self.wd, 'unsource', 'cprofile') as tracer:
+            Book('source.zip')()
+        self.assertEqual(list(tracer.stages), ['parse', 'extract', 'compress'])
+        self.assertEqual(tracer.stages['compress'].files, 95)
+        self.assertTrue(os.path.isfile(f"profile-{tracer.slowest().name}.prof"))
+
+    def test_trace_mode(self):
+        for env, profile, expected in (('', False, None), ('', True, 'timing'), ('1', False, 'timing'),
+                                       ('0', True, 'timing'), ('cprofile', False, 'cprofile')):
+            with self.subTest(env=env, profile=profile), mock.patch.dict(os.environ, {TRACE_ENV: env}):
+                self.assertEqual(trace_mode(profile), expected)
+        self.assertEqual(trace_mode(cprofile=True), 'cprofile')
+
+
+if __name__ == '__main__':
+    unittest.main()
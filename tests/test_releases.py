@@ -0,0 +1,157 @@
+import json
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from docbooktoxtm.functions import get_zip
+from docbooktoxtm.releases import ReleaseClient
+
+from tests import TempDirTestCase
+from tests.test_cache import zipball
+
+course = 'DTX123'
+user = 'raorourke'
+
+
+def release(tag_name: str, commitish: str, published_at: str, **kwargs) -> dict:
+    return dict(dict(
+        tag_name=tag_name,
+        target_commitish=commitish,
+        published_at=published_at,
+        created_at=published_at,
+        zipball_url=f"/repos/{user}/{course}/zipball/{tag_name}",
+        draft=False,
+        prerelease=False,
+    ), **kwargs)
+
+
+RELEASES = [
+    release('DTX123-RHEL8.2-1.r2021010100-ILT+RAV+VC-en_US', 'rhel8.2', '2021-01-01T00:00:00Z'),
+    release('DTX123-RHEL8.4-2.r2021060100-ILT+RAV+VC-en_US', 'rhel8.4', '2021-06-01T00:00:00Z'),
+    release('DTX123-RHEL8.2-1.r2021070100-ILT+RAV+VC-en_US', 'rhel8.2', '2021-07-01T00:00:00Z'),
+    release('DTX123-RHEL8.0-0.r2021080100-ILT+RAV+VC-en_US', 'rhel8.0', '2021-08-01T00:00:00Z', prerelease=True),
+]
+
+
+class GitHubHandler(BaseHTTPRequestHandler):
+    per_page = 2
+    requests = []
+
+    def send_json(self, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requests.append(url.path)
+        base = f"http://{self.headers['Host']}"
+        releases = [dict(r, zipball_url=f"{base}{r['zipball_url']}") for r in RELEASES]
+        repo = f"/repos/{user}/{course}"
+        if url.path == f"{repo}/releases":
+            page = int(parse_qs(url.query).get('page', ['1'])[0])
+            headers = {}
+            if page * self.per_page < len(releases):
+                headers['Link'] = f'<{base}{url.path}?page={page + 1}>; rel="next"'
+            self.send_json(releases[(page - 1) * self.per_page:page * self.per_page], headers)
+        elif url.path.startswith(f"{repo}/releases/tags/"):
+            tag = unquote(url.path.rsplit('/', 1)[1])
+            matches = [r for r in releases if r['tag_name'] == tag]
+            if matches:
+                self.send_json(matches[0])
+            else:
+                self.send_response(404)
+                self.end_headers()
+        elif url.path.startswith(f"{repo}/zipball/"):
+            body = zipball()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_response(404)
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestReleaseClient(TempDirTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), GitHubHandler)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    def setUp(self):
+        super().setUp()
+        GitHubHandler.requests.clear()
+
+    def client(self, **kwargs) -> ReleaseClient:
+        return ReleaseClient('token', base_url=self.base_url, **kwargs)
+
+    def test_exact_tag(self):
+        client = self.client()
+        tag = RELEASES[1]['tag_name']
+        self.assertEqual(client.resolve(user, course, tag).tag_name, tag)
+        self.assertEqual(GitHubHandler.requests, [f"/repos/{user}/{course}/releases/tags/{quote(tag, safe='')}"])
+
+    def test_exact_tag_listed(self):
+        client = self.client()
+        client.list_releases(user, course)
+        tag = RELEASES[1]['tag_name']
+        self.assertEqual(client.resolve(user, course, tag).tag_name, tag)
+        self.assertEqual(client.requests, 2)
+
+    def test_partial_tag(self):
+        client = self.client()
+        self.assertEqual(client.resolve(user, course, 'rhel8.2').tag_name, RELEASES[2]['tag_name'])
+        self.assertEqual(client.resolve(user, course, 'RHEL8.4').tag_name, RELEASES[1]['tag_name'])
+        self.assertIsNone(client.resolve(user, course, 'rhel7.0'))
+        # partial tags never reach the tag endpoint, and the two list pages are fetched only once
+        self.assertEqual(GitHubHandler.requests.count(f"/repos/{user}/{course}/releases"), 2)
+        self.assertEqual(client.requests, 2)
+
+    def test_latest(self):
+        # the latest release has a higher version than the most recently published prerelease
+        client = self.client()
+        self.assertEqual(client.resolve(user, course).tag_name, RELEASES[2]['tag_name'])
+        self.assertEqual(client.requests, 2)
+        self.assertIsNone(ReleaseClient.latest(client.list_releases(user, course)[3:]))
+
+    def test_ttl(self):
+        cache_dir = os.path.join(self.wd, 'cache')
+        self.client(cache_dir=cache_dir).list_releases(user, course)
+        releases = self.client(cache_dir=cache_dir).list_releases(user, course)
+        self.assertEqual(len(releases), len(RELEASES))
+        self.assertEqual(len(GitHubHandler.requests), 2)
+        self.client(cache_dir=cache_dir, ttl=0).list_releases(user, course)
+        self.assertEqual(len(GitHubHandler.requests), 4)
+
+    def test_get_zip(self):
+        client = self.client()
+        tag = RELEASES[0]['tag_name']
+        with self.assertLogs(level='DEBUG') as logs:
+            fname = get_zip(course, tag, user, cache=False, client=client)
+        self.assertEqual(fname, f"{course}-{tag}.zip")
+        self.assertTrue(os.path.isfile(fname))
+        self.assertEqual(client.requests, 1)
+        self.assertEqual(GitHubHandler.requests[-1], f"/repos/{user}/{course}/zipball/{tag}")
+        self.assertTrue(any('GitHub request #1' in line for line in logs.output))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,16 @@
+import unittest
+
+from benchmarks.bench_startup import heavy_imports, imported_modules, python
+
+
+class TestStartup(unittest.TestCase):
+    def test_help_skips_heavy_imports(self):
+        result = python('-X', 'importtime', '-m', 'docbooktoxtm.main', '--help')
+        modules = imported_modules(result.stderr)
+        self.assertIn('docbooktoxtm.config', modules)
+        self.assertEqual(heavy_imports(modules), [])
+        self.assertIn('resource-batch', result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
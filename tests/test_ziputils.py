@@ -0,0 +1,108 @@
+import io
+import os
+import shutil
+import unittest
+import zipfile
+from unittest import mock
+
+from docbooktoxtm.ziputils import MemberWriter, ZipIndex, atomic_zip, copy_member, zipdir
+
+from tests import TempDirTestCase, fixture
+
+
+class TestZipIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ZipIndex(fixture)
+
+    def test_index(self):
+        self.assertEqual(self.index.root, 'DTX123-0.0.1.dev6')
+        self.assertIn('DTX123-0.0.1.dev6/guides/en-US/Book_Info.xml', self.index)
+        self.assertNotIn('DTX123-0.0.1.dev6/guides/', self.index)
+        self.assertEqual(self.index.find_book_info(), 'DTX123-0.0.1.dev6/guides/en-US/Book_Info.xml')
+        self.assertEqual(self.index.find_map('DTX123'), 'DTX123-0.0.1.dev6/guides/en-US/DTX123-SG.xml')
+        with self.assertRaises(ValueError):
+            self.index.find_map('DTX999')
+
+    def tearDown(self):
+        self.index.close()
+
+
+class TestCopyMember(unittest.TestCase):
+    def test_renamed_copy(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(fixture) as source, zipfile.ZipFile(buffer, 'w') as target:
+            members = [info for info in source.infolist() if not info.is_dir()]
+            for info in members:
+                copy_member(source, info, target, f"renamed/{info.filename}")
+            expected = {f"renamed/{info.filename}": source.read(info) for info in members}
+        with zipfile.ZipFile(buffer) as target:
+            self.assertIsNone(target.testzip())
+            self.assertEqual({name: target.read(name) for name in target.namelist()}, expected)
+
+
+class TestAtomicZip(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fname = os.path.join(self.wd, 'out.zip')
+
+    def test_replaced_on_success(self):
+        shutil.copy(fixture, self.fname)
+        with zipfile.ZipFile(self.fname) as source, atomic_zip(self.fname) as target:
+            info = source.infolist()[-1]
+            copy_member(source, info, target, 'only.xml')
+        with zipfile.ZipFile(self.fname) as target:
+            self.assertEqual(target.namelist(), ['only.xml'])
+
+    def test_removed_on_failure(self):
+        with self.assertRaises(RuntimeError):
+            with atomic_zip(self.fname) as target:
+                target.writestr('a.xml', b'<a/>')
+                raise RuntimeError
+        self.assertEqual(os.listdir(self.wd), [])
+
+
+class TestMemberWriter(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tree = os.path.join(self.wd, 'tree')
+        with zipfile.ZipFile(fixture) as source:
+            source.extractall(self.tree)
+        with open(os.path.join(self.tree, 'figure.png'), 'wb') as f:
+            f.write(b'\x89PNG' + bytes(4096))
+
+    def zipdir(self, fname, **options):
+        fname = os.path.join(self.wd, fname)
+        with zipfile.ZipFile(fname, 'w', zipfile.ZIP_DEFLATED) as f_zip:
+            zipdir(self.tree, f_zip, self.tree, **options)
+        with zipfile.ZipFile(fname) as f_zip:
+            self.assertIsNone(f_zip.testzip())
+            return {info.filename: (info.compress_type, f_zip.read(info)) for info in f_zip.infolist()}, fname
+
+    def test_parallel(self):
+        serial, _ = self.zipdir('serial.zip', jobs=1)
+        self.assertEqual(self.zipdir('parallel.zip', jobs=4)[0], serial)
+        self.assertEqual(serial['figure.png'][0], zipfile.ZIP_STORED)
+        with mock.patch('docbooktoxtm.ziputils.IN_MEMORY_LIMIT', 1024):
+            self.assertEqual(self.zipdir('large.zip', jobs=4)[0], serial)
+
+    def test_level(self):
+        stored, stored_fname = self.zipdir('stored.zip', level=0, jobs=2)
+        self.assertEqual({compress_type for compress_type, _ in stored.values()}, {zipfile.ZIP_STORED})
+        fast, fast_fname = self.zipdir('fast.zip', level=1, jobs=2)
+        _, best_fname = self.zipdir('best.zip', level=9, jobs=2)
+        self.assertEqual({name: data for name, (_, data) in fast.items()},
+                         {name: data for name, (_, data) in stored.items()})
+        self.assertLess(os.path.getsize(best_fname), os.path.getsize(fast_fname))
+        self.assertLess(os.path.getsize(fast_fname), os.path.getsize(stored_fname))
+
+    def test_failure(self):
+        with zipfile.ZipFile(os.path.join(self.wd, 'failed.zip'), 'w') as f_zip:
+            with self.assertRaises(FileNotFoundError):
+                with MemberWriter(f_zip, jobs=2) as writer:
+                    writer.write_bytes('a.xml', b'<a/>')
+                    writer.add(lambda: open(os.path.join(self.wd, 'missing'), 'rb'))
+                    writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()